@@ -6,3 +6,10 @@ from django.utils.translation import ugettext_lazy as _
 class DemocracyAppConfig(AppConfig):
     name = 'democracy'
     verbose_name = _("Participatory Democracy")
+
+    def ready(self):
+        # connect the receivers that keep caches and search vectors up to date
+        import democracy.models.search  # noqa
+        import democracy.utils.comment_clusters  # noqa
+        import democracy.utils.hearing_cache  # noqa
+        import democracy.utils.tiles  # noqa
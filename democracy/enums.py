@@ -19,3 +19,9 @@ class InitialSectionType:
     PART = "part"
     SCENARIO = "scenario"
     CLOSURE_INFO = "closure-info"
+
+
+class HearingStatus:
+    UPCOMING = "upcoming"
+    OPEN = "open"
+    CLOSED = "closed"
@@ -0,0 +1,72 @@
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from democracy.models import SectionComment
+from democracy.models.language_detection import (
+    DEFAULT_BATCH_SIZE, detect_comment_languages, detect_pending_comment_languages, get_undetected_comments
+)
+from democracy.utils.language_detection import get_detector_factory
+
+
+def _init_worker():
+    # load the language profiles once per worker process
+    get_detector_factory()
+
+
+def _detect_range(pk_range):
+    start, end = pk_range
+    comments = get_undetected_comments(SectionComment).filter(pk__gte=start, pk__lt=end)
+    return detect_comment_languages(comments)
+
+
+class Command(BaseCommand):
+    help = "Detect the languages of the comments pending language detection, or of all comments without one."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill', action='store_true', dest='backfill', default=False,
+            help="Detect the language of every comment without one, not only of the pending ones"
+        )
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help="The number of worker processes for backfilling"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help="The number of comments detected per batch"
+        )
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help="Keep detecting the pending comments every INTERVAL seconds instead of once"
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.backfill(options['processes'], options['batch_size'])
+            return
+        while True:
+            n_processed, n_detected = detect_pending_comment_languages(SectionComment, options['batch_size'])
+            self.stdout.write("Detected the language of %d of %d pending comments" % (n_detected, n_processed))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
+
+    def backfill(self, processes, batch_size):
+        pks = get_undetected_comments(SectionComment).aggregate(start=Min('pk'), end=Max('pk'))
+        if pks['start'] is None:
+            self.stdout.write("No comments without a language")
+            return
+        # batches are ranges of primary keys, so that the workers do not need the primary keys of every comment
+        pk_ranges = [(start, start + batch_size) for start in range(pks['start'], pks['end'] + 1, batch_size)]
+        if processes > 1:
+            # the worker processes must not share the database connections of this one
+            connections.close_all()
+            with Pool(processes, initializer=_init_worker) as pool:
+                n_detected = sum(pool.imap_unordered(_detect_range, pk_ranges))
+        else:
+            n_detected = sum(_detect_range(pk_range) for pk_range in pk_ranges)
+        self.stdout.write("Detected the language of %d comments" % n_detected)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from democracy.utils.vote_buffer import flush_vote_buffer, get_vote_buffer, get_vote_buffer_stats
+
+
+class Command(BaseCommand):
+    help = "Add the anonymous votes in the vote buffer to the vote counts of their comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help="Keep flushing the buffer every INTERVAL seconds instead of flushing it once"
+        )
+
+    def handle(self, *args, **options):
+        if get_vote_buffer() is None:
+            raise CommandError("DEMOCRACY_VOTE_BUFFER is not set")
+        while True:
+            n_votes = flush_vote_buffer()
+            stats = get_vote_buffer_stats()
+            self.stdout.write("Flushed %d votes in %.3f s, %d votes pending" % (
+                n_votes, stats['last_flush_duration'], stats['pending_votes']
+            ))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
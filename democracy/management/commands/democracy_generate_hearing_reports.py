@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from democracy.views.hearing_report import generate_pending_reports
+
+
+class Command(BaseCommand):
+    help = "Generate the hearing reports requested for background generation."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help="Keep generating the pending reports every INTERVAL seconds instead of once"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            n_generated = generate_pending_reports()
+            self.stdout.write("Generated %d hearing reports" % n_generated)
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
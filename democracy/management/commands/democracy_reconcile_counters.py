@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from democracy.models.counter_reconciliation import DEFAULT_BATCH_SIZE, reconcile_counters
+from democracy.utils.vote_buffer import flush_vote_buffer
+
+
+class Command(BaseCommand):
+    help = "Recompute the comment, vote and poll answer counters, and fix the ones that have drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', dest='dry_run', default=False,
+            help="Only report the drift, without fixing it"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help="The number of objects checked per query"
+        )
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            flush_vote_buffer()
+        for drift in reconcile_counters(options['dry_run'], options['batch_size']):
+            self.stdout.write("%s: checked %d, drifted %d by %d in total, fixed %d" % (
+                drift.counter.name, drift.n_checked, drift.n_drifted, drift.total_drift, drift.n_fixed
+            ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from democracy.models import Hearing
+from democracy.models.hearing_list import refresh_hearing_list_entry
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed hearing list entries of all hearings."
+
+    def handle(self, *args, **options):
+        hearing_ids = Hearing.objects.everything().values_list('pk', flat=True)
+        for hearing_id in hearing_ids.iterator():
+            refresh_hearing_list_entry(hearing_id)
+        self.stdout.write("Refreshed %d hearing list entries" % hearing_ids.count())
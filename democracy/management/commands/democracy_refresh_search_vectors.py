@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from democracy.models import Hearing, Section, SectionComment
+from democracy.models.search import (
+    refresh_comment_search_vectors, refresh_hearing_search_vector, refresh_section_search_vector
+)
+
+
+class Command(BaseCommand):
+    help = "Recompute the full text search vectors of all hearings, sections and comments."
+
+    def handle(self, *args, **options):
+        section_ids = Section.objects.everything().values_list('pk', flat=True)
+        for section_id in section_ids.iterator():
+            refresh_section_search_vector(section_id)
+        hearing_ids = Hearing.objects.everything().values_list('pk', flat=True)
+        for hearing_id in hearing_ids.iterator():
+            refresh_hearing_search_vector(hearing_id)
+        comments = SectionComment.objects.everything()
+        refresh_comment_search_vectors(comments)
+        self.stdout.write("Refreshed search vectors of %d hearings, %d sections and %d comments" % (
+            hearing_ids.count(), section_ids.count(), comments.count()
+        ))
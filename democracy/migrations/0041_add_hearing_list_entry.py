@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0040_add_hearing_project_phase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HearingListEntry',
+            fields=[
+                ('hearing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='list_entry', serialize=False, to='democracy.Hearing', verbose_name='hearing')),
+                ('title', django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='title')),
+                ('borough', django.contrib.postgres.fields.jsonb.JSONField(default=dict, verbose_name='borough')),
+                ('abstract', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True, verbose_name='abstract')),
+                ('main_image', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True, verbose_name='main image')),
+                ('default_to_fullscreen', models.BooleanField(default=False, verbose_name='default to fullscreen')),
+                ('labels', django.contrib.postgres.fields.jsonb.JSONField(default=list, verbose_name='labels')),
+                ('n_comments', models.IntegerField(default=0, verbose_name='number of comments')),
+                ('open_at', models.DateTimeField(verbose_name='opening time')),
+                ('close_at', models.DateTimeField(verbose_name='closing time')),
+                ('force_closed', models.BooleanField(default=False, verbose_name='force hearing closed')),
+            ],
+            options={
+                'verbose_name': 'hearing list entry',
+                'verbose_name_plural': 'hearing list entries',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def set_tree_modified_at(apps, schema_editor):
+    Hearing = apps.get_model('democracy', 'Hearing')
+    Hearing.objects.update(tree_modified_at=F('modified_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0041_add_hearing_list_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hearing',
+            name='tree_modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='last time the hearing or any object in it was modified', verbose_name='tree modification time'),
+        ),
+        migrations.RunPython(set_tree_modified_at, migrations.RunPython.noop),
+    ]
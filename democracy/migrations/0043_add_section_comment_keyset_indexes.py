@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0042_add_hearing_tree_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sectioncomment',
+            index=models.Index(fields=['section', 'created_at', 'id'], name='democracy_comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncomment',
+            index=models.Index(fields=['section', 'n_votes', 'id'], name='democracy_comment_votes_idx'),
+        ),
+    ]
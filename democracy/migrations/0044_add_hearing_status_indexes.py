@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0043_add_section_comment_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hearing',
+            index=models.Index(fields=['published', 'deleted', 'open_at', 'close_at'], name='democracy_hearing_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hearing',
+            index=models.Index(fields=['close_at'], name='democracy_hearing_close_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hearing',
+            index=models.Index(fields=['deleted', 'published', '-created_at'], name='democracy_hearing_created_idx'),
+        ),
+    ]
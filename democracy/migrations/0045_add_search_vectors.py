@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0044_add_hearing_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hearing',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.AddIndex(
+            model_name='hearing',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='democracy_hearing_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='section',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='democracy_section_search_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0045_add_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sectioncomment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='search vector'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncomment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='democracy_comment_search_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0046_add_section_comment_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentCounterSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='slot')),
+                ('delta', models.IntegerField(default=0, verbose_name='pending change in the number of comments')),
+                ('hearing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_counter_slots', to='democracy.Hearing', verbose_name='hearing')),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_counter_slots', to='democracy.Section', verbose_name='section')),
+            ],
+            options={
+                'verbose_name': 'comment counter slot',
+                'verbose_name_plural': 'comment counter slots',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='commentcounterslot',
+            unique_together=set([('section', 'slot')]),
+        ),
+    ]
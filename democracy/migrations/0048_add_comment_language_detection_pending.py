@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0047_add_comment_counter_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sectioncomment',
+            name='language_detection_pending',
+            field=models.BooleanField(db_index=True, default=False, editable=False, verbose_name='language detection pending'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0048_add_comment_language_detection_pending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredHearingReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='key')),
+                ('hearing_data', django.contrib.postgres.fields.jsonb.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='hearing data')),
+                ('base_url', models.CharField(max_length=255, verbose_name='base URL')),
+                ('file', models.FileField(blank=True, upload_to='reports/%Y/%m', verbose_name='file')),
+                ('requested_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='time of request')),
+                ('generated_at', models.DateTimeField(blank=True, null=True, verbose_name='time of generation')),
+                ('hearing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stored_reports', to='democracy.Hearing', verbose_name='hearing')),
+            ],
+            options={
+                'verbose_name': 'stored hearing report',
+                'verbose_name_plural': 'stored hearing reports',
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+CREATE_TRIGGER = """
+CREATE FUNCTION democracy_sectioncomment_set_change_txid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_txid := txid_current();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER democracy_sectioncomment_change_txid
+    BEFORE INSERT OR UPDATE ON democracy_sectioncomment
+    FOR EACH ROW EXECUTE PROCEDURE democracy_sectioncomment_set_change_txid();
+
+UPDATE democracy_sectioncomment SET change_txid = txid_current();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER democracy_sectioncomment_change_txid ON democracy_sectioncomment;
+DROP FUNCTION democracy_sectioncomment_set_change_txid();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0049_add_stored_hearing_report'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sectioncomment',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True, verbose_name='changing transaction'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.AddIndex(
+            model_name='sectioncomment',
+            index=models.Index(fields=['change_txid', 'id'], name='democracy_comment_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sectioncomment',
+            index=models.Index(fields=['modified_at'], name='democracy_comment_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0050_add_comment_change_txid'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='hearinglistentry',
+            name='n_comments',
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+def delete_list_entries(apps, schema_editor):
+    # the existing entries lack the new fields, so fall back to computing the list until
+    # the entries are recomputed with democracy_refresh_hearing_list
+    apps.get_model('democracy', 'HearingListEntry').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('democracy', '0051_remove_hearing_list_entry_n_comments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hearinglistentry',
+            name='organization',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='organization'),
+        ),
+        migrations.AddField(
+            model_name='hearinglistentry',
+            name='project',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True, verbose_name='project'),
+        ),
+        migrations.RunPython(delete_list_entries, migrations.RunPython.noop),
+    ]
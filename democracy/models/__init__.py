@@ -4,10 +4,15 @@ from .section import Section, SectionComment, SectionImage, SectionType
 from .section import SectionPoll, SectionPollOption, SectionPollAnswer
 from .organization import ContactPerson, Organization
 from .project import Project, ProjectPhase
+from .hearing_list import HearingListEntry
+from .counters import CommentCounterSlot
+from .hearing_report import StoredHearingReport
 
 __all__ = [
+    "CommentCounterSlot",
     "ContactPerson",
     "Hearing",
+    "HearingListEntry",
     "Label",
     "Section",
     "SectionComment",
@@ -16,6 +21,7 @@ __all__ = [
     "SectionPoll",
     "SectionPollOption",
     "SectionPollAnswer",
+    "StoredHearingReport",
     "Organization",
     "Project",
     "ProjectPhase",
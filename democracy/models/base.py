@@ -3,7 +3,7 @@ from functools import lru_cache
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import ManyToOneRel
+from django.db.models import ManyToOneRel, Sum
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
@@ -114,7 +114,37 @@ class StringIdBaseModel(BaseModel):
         abstract = True
 
 
-class Commentable(models.Model):
+def get_counter_slots():
+    return getattr(settings, 'DEMOCRACY_COMMENT_COUNTER_SLOTS', None) or 0
+
+
+def get_counter_slot_prefetches():
+    """
+    Get the prefetches that `CommentCounterMixin.get_n_comments()` needs, if counter slots are in use.
+    """
+    return ('comment_counter_slots',) if get_counter_slots() else ()
+
+
+class CommentCounterMixin(object):
+    """
+    Mixin for models with an `n_comments` counter and comment counter slots, see `democracy.models.counters`.
+    """
+
+    def get_n_comments(self):
+        """
+        Get the number of comments, including changes still pending in counter slots.
+
+        Lists should prefetch the slots with `get_counter_slot_prefetches()`.
+        """
+        if not get_counter_slots():
+            return self.n_comments
+        prefetched_slots = getattr(self, '_prefetched_objects_cache', {}).get('comment_counter_slots')
+        if prefetched_slots is not None:
+            return self.n_comments + sum(slot.delta for slot in prefetched_slots)
+        return self.n_comments + (self.comment_counter_slots.aggregate(delta=Sum('delta'))['delta'] or 0)
+
+
+class Commentable(CommentCounterMixin, models.Model):
     """
     Mixin for models which can be commented.
     """
@@ -123,6 +153,8 @@ class Commentable(models.Model):
     voting = EnumIntegerField(Commenting, verbose_name=_('voting'), default=Commenting.REGISTERED)
 
     def recache_n_comments(self):
+        # pending counter slots are replaced by the recount
+        self.comment_counter_slots.all().delete()
         new_n_comments = self.comments.count()
         if new_n_comments != self.n_comments:
             self.n_comments = new_n_comments
@@ -1,16 +1,49 @@
 from django.conf import settings
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F
 from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from djgeojson.fields import GeoJSONField
-from langdetect import detect_langs
-from langdetect.lang_detect_exception import LangDetectException
 
-from democracy.utils.geo import get_geometry_from_geojson
+from democracy.utils.geo import update_geometry
+from democracy.utils.language_detection import detect_language, is_language_detection_async
+from democracy.utils.vote_buffer import buffer_unregistered_vote, get_pending_votes
 
 from .base import BaseModel
 
+# Sent instead of `post_save` for comments created together by `bulk_create_comments`
+comments_bulk_created = Signal(providing_args=['instances'])
+
+# Sent for comments modified without `save()`, e.g. by votes, with their primary keys
+comments_modified = Signal(providing_args=['pks', 'modified_at'])
+
+# Votes are added and removed in single statements, that change the voters and the vote count
+# together without running `save()`. The vote count changes only if a voter row was written.
+VOTE_SQL = """
+WITH vote AS (
+    INSERT INTO "{voters_table}" ("{comment_column}", "{user_column}") VALUES (%s, %s)
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+)
+UPDATE "{comment_table}" SET n_votes = n_votes + 1, modified_at = %s
+WHERE id = %s AND EXISTS (SELECT 1 FROM vote)
+RETURNING n_votes
+"""
+
+UNVOTE_SQL = """
+WITH vote AS (
+    DELETE FROM "{voters_table}" WHERE "{comment_column}" = %s AND "{user_column}" = %s
+    RETURNING 1
+)
+UPDATE "{comment_table}" SET n_votes = n_votes - 1, modified_at = %s
+WHERE id = %s AND EXISTS (SELECT 1 FROM vote)
+RETURNING n_votes
+"""
+
 
 class BaseComment(BaseModel):
     parent_field = None  # Required for factories and API
@@ -23,6 +56,9 @@ class BaseComment(BaseModel):
     plugin_data = models.TextField(verbose_name=_('plugin data'), blank=True)
     label = models.ForeignKey("Label", verbose_name=_('label'), blank=True, null=True)
     language_code = models.CharField(verbose_name=_('language code'), blank=True, max_length=15)
+    language_detection_pending = models.BooleanField(
+        verbose_name=_('language detection pending'), default=False, db_index=True, editable=False
+    )
     n_votes = models.IntegerField(
         verbose_name=_('vote count'),
         help_text=_('number of votes given to this comment'),
@@ -48,6 +84,14 @@ class BaseComment(BaseModel):
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the parent the comment is counted in, see democracy.models.counters
+        if {'deleted', '%s_id' % cls.parent_field} <= set(field_names):
+            instance._counted_parent_id = None if instance.deleted else instance.parent_id
+        return instance
+
     @property
     def parent(self):
         """
@@ -63,33 +107,94 @@ class BaseComment(BaseModel):
         return getattr(self, "%s_id" % self.parent_field, None)
 
     def _detect_lang(self):
-        try:
-            candidates = detect_langs(self.content.lower())
-            for candidate in candidates:
-                if candidate.lang in [lang['code'] for lang in settings.PARLER_LANGUAGES[None]]:
-                    if candidate.prob > settings.DETECT_LANGS_MIN_PROBA:
-                        self.language_code = candidate.lang
-                    break
-
-        except LangDetectException:
-            pass
+        self.language_code = detect_language(self.content)
 
-    def save(self, *args, **kwargs):
+    def _prepare_save(self, update_fields=None):
         if not any((getattr(self, field) for field in self.fields_to_check_for_data)):
             raise ValidationError("You must supply at least one of the following data in a comment: " +
                                   str(self.fields_to_check_for_data))
         if not self.author_name and self.created_by_id:
             self.author_name = (self.created_by.get_display_name() or None)
-        if not self.language_code and self.content:
-            self._detect_lang()
-        self.geometry = get_geometry_from_geojson(self.geojson)
+        # counter updates and the like do not change the language
+        text_changed = update_fields is None or {'content', 'language_code'} & set(update_fields)
+        if text_changed and not self.language_code and self.content:
+            if is_language_detection_async():
+                # detected later in a batch, see democracy.models.language_detection
+                self.language_detection_pending = True
+                if update_fields is not None:
+                    update_fields = list(update_fields) + ['language_detection_pending']
+            else:
+                self._detect_lang()
+        return update_geometry(self, update_fields)
+
+    def save(self, *args, **kwargs):
+        kwargs['update_fields'] = self._prepare_save(kwargs.get('update_fields'))
         return super(BaseComment, self).save(*args, **kwargs)
 
     def recache_n_votes(self):
         n_votes = self.voters.all().count() + self.n_unregistered_votes
         if n_votes != self.n_votes:
             self.n_votes = n_votes
-            self.save(update_fields=("n_votes", "n_unregistered_votes"))
+            # votes change the representation of the comment, so they count as modifications
+            self.save(update_fields=("n_votes", "n_unregistered_votes", "modified_at"))
+
+    def _execute_vote_sql(self, sql, user):
+        field = self._meta.get_field('voters')
+        sql = sql.format(
+            voters_table=field.m2m_db_table(),
+            comment_column=field.m2m_column_name(),
+            user_column=field.m2m_reverse_name(),
+            comment_table=self._meta.db_table,
+        )
+        modified_at = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk, user.pk, modified_at, self.pk])
+            row = cursor.fetchone()
+        if not row:
+            return False
+        self.n_votes = row[0]
+        self.modified_at = modified_at
+        comments_modified.send(sender=self.__class__, pks=[self.pk], modified_at=modified_at)
+        return True
+
+    def add_vote(self, user):
+        """
+        Add the vote of `user`, unless they have voted for this comment already.
+
+        :return: Whether the vote was added
+        :rtype: bool
+        """
+        return self._execute_vote_sql(VOTE_SQL, user)
+
+    def remove_vote(self, user):
+        """
+        Remove the vote of `user`, if they have voted for this comment.
+
+        :return: Whether a vote was removed
+        :rtype: bool
+        """
+        return self._execute_vote_sql(UNVOTE_SQL, user)
+
+    def add_unregistered_vote(self):
+        if buffer_unregistered_vote(self):
+            return
+        modified_at = timezone.now()
+        self.__class__.objects.everything().filter(pk=self.pk).update(
+            n_votes=F('n_votes') + 1, n_unregistered_votes=F('n_unregistered_votes') + 1, modified_at=modified_at
+        )
+        self.modified_at = modified_at
+        comments_modified.send(sender=self.__class__, pks=[self.pk], modified_at=modified_at)
+
+    def get_n_votes(self):
+        """
+        Get the number of votes, including anonymous votes still pending in the vote buffer.
+
+        Lists should look up the pending votes with `prefetch_pending_votes()`.
+        """
+        pending_votes = getattr(self, '_pending_votes', None)
+        if pending_votes is None:
+            pending_votes = get_pending_votes(self)
+        return self.n_votes + pending_votes
 
     def recache_parent_n_comments(self):
         if self.parent_id:  # pragma: no branch
@@ -99,24 +204,56 @@ class BaseComment(BaseModel):
         """
         Whether the given request (HTTP or DRF) is allowed to edit this Comment.
         """
-        is_authenticated = request.user.is_authenticated()
-        if is_authenticated and self.created_by == request.user:
+        user = request.user
+        if user.is_authenticated() and self.created_by_id == user.pk:
             # also make sure the hearing is still commentable
+            return self.parent_allows_commenting(request)
+        return False
+
+    def parent_allows_commenting(self, request):
+        """
+        Whether the parent of this Comment allows commenting for the given request.
+
+        The result is remembered per parent for the rest of the request, so that checking every
+        comment of a list costs no more than checking each parent once.
+        """
+        allowed_by_parent = getattr(request, '_democracy_commenting_allowed', None)
+        if allowed_by_parent is None:
+            allowed_by_parent = request._democracy_commenting_allowed = {}
+        key = (self.parent_field, self.parent_id)
+        if key not in allowed_by_parent:
             try:
                 self.parent.check_commenting(request)
+                allowed_by_parent[key] = True
             except ValidationError:
-                return False
-            return True
-        return False
+                allowed_by_parent[key] = False
+        return allowed_by_parent[key]
+
+
+def bulk_create_comments(model, comments):
+    """
+    Create comments of `model` with a single insert.
+
+    The comments are prepared like in `save()`, but instead of a `post_save` signal for each
+    comment, a single `comments_bulk_created` signal is sent for all of them.
+
+    :type comments: list[BaseComment]
+    :rtype: list[BaseComment]
+    """
+    for comment in comments:
+        comment._prepare_save()
+    comments = model.objects.bulk_create(comments)
+    if comments:
+        comments_bulk_created.send(sender=model, instances=comments)
+    return comments
 
 
 def comment_recache(sender, instance, using, created, **kwargs):
     """
     :type instance: BaseComment
     """
-    if created or instance.deleted:
-        instance.recache_parent_n_comments()
-    else:
+    # comment counts are kept up to date incrementally, see democracy.models.counters
+    if not (created or instance.deleted):
         instance.recache_n_votes()
 
 
@@ -0,0 +1,163 @@
+"""
+Reconciliation of denormalized counters.
+
+The counters are kept up to date incrementally, but they can drift when transactions fail
+halfway or rows are changed with raw SQL. Reconciliation recomputes them in batches of
+objects, with one query to find the drifted objects of a batch and one to fix them. The
+expected values are recomputed in the fixing update itself, so that counter changes made in
+between are not lost.
+"""
+from collections import namedtuple
+
+from django.db import connection
+from django.utils.timezone import now
+
+from .comment import comments_modified
+from .counters import CommentCounterSlot, _send_n_comments_changed, flush_comment_counter_slots
+from .hearing import Hearing
+from .section import Section, SectionComment, SectionPoll, SectionPollAnswer, SectionPollOption
+from .signals import hearing_tree_changed
+
+DEFAULT_BATCH_SIZE = 5000
+
+# `current` and `expected` are SQL expressions of the object `t` with the names below formatted in
+DenormalizedCounter = namedtuple(
+    'DenormalizedCounter', ('name', 'model', 'field', 'current', 'expected', 'hearing_lookup')
+)
+
+
+def _get_table_names():
+    voters = SectionComment._meta.get_field('voters')
+    return {
+        'comment': SectionComment._meta.db_table,
+        'section': Section._meta.db_table,
+        'slot': CommentCounterSlot._meta.db_table,
+        'voter': voters.m2m_db_table(),
+        'voter_comment': voters.m2m_column_name(),
+        'option': SectionPollOption._meta.db_table,
+        'answer': SectionPollAnswer._meta.db_table,
+    }
+
+
+COUNTERS = (
+    DenormalizedCounter(
+        'section comments', Section, 'n_comments',
+        't.n_comments + COALESCE((SELECT SUM(s.delta) FROM {slot} s WHERE s.section_id = t.id), 0)',
+        '(SELECT COUNT(*) FROM {comment} c WHERE c.section_id = t.id AND NOT c.deleted)',
+        'hearing_id',
+    ),
+    DenormalizedCounter(
+        'hearing comments', Hearing, 'n_comments',
+        't.n_comments + COALESCE((SELECT SUM(s.delta) FROM {slot} s WHERE s.hearing_id = t.id), 0)',
+        '(SELECT COUNT(*) FROM {comment} c JOIN {section} s ON s.id = c.section_id '
+        'WHERE s.hearing_id = t.id AND NOT s.deleted AND NOT c.deleted)',
+        'pk',
+    ),
+    DenormalizedCounter(
+        'comment votes', SectionComment, 'n_votes',
+        't.n_votes',
+        't.n_unregistered_votes + (SELECT COUNT(*) FROM {voter} v WHERE v.{voter_comment} = t.id)',
+        None,
+    ),
+    DenormalizedCounter(
+        'poll option answers', SectionPollOption, 'n_answers',
+        't.n_answers',
+        '(SELECT COUNT(*) FROM {answer} a WHERE a.option_id = t.id AND NOT a.deleted)',
+        'poll__section__hearing_id',
+    ),
+    DenormalizedCounter(
+        'poll answers', SectionPoll, 'n_answers',
+        't.n_answers',
+        # a multiple choice poll is answered once per comment
+        '(SELECT COUNT(DISTINCT a.comment_id) FROM {answer} a JOIN {option} o ON o.id = a.option_id '
+        'WHERE o.poll_id = t.id AND NOT a.deleted)',
+        'section__hearing_id',
+    ),
+)
+
+
+class Drift(object):
+    def __init__(self, counter):
+        self.counter = counter
+        self.n_checked = 0
+        self.n_drifted = 0
+        self.total_drift = 0
+        self.n_fixed = 0
+
+
+def _get_batches(model, batch_size):
+    pks = model._base_manager.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        batch = list((pks.filter(pk__gt=last_pk) if last_pk is not None else pks)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1]
+
+
+def reconcile_counter(counter, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Find and fix the drift of a counter.
+
+    :type counter: DenormalizedCounter
+    :rtype: Drift
+    """
+    drift = Drift(counter)
+    names = _get_table_names()
+    table = counter.model._meta.db_table
+    current = counter.current.format(**names)
+    expected = counter.expected.format(**names)
+    find_sql = (
+        'SELECT id, current, expected FROM ('
+        'SELECT t.id, {current} AS current, {expected} AS expected FROM {table} t WHERE t.id = ANY(%s)'
+        ') AS counter WHERE current <> expected'
+    ).format(current=current, expected=expected, table=table)
+    # changes still pending in counter slots are left out of the counter column
+    fix_sql = 'UPDATE {table} t SET {field} = {expected} - ({current} - t.{field}) WHERE t.id = ANY(%s)'.format(
+        table=table, field=counter.field, expected=expected, current=current
+    )
+    fixed_pks = []
+    for batch in _get_batches(counter.model, batch_size):
+        drift.n_checked += len(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(find_sql, [batch])
+            rows = cursor.fetchall()
+            drift.n_drifted += len(rows)
+            drift.total_drift += sum(abs(row[2] - row[1]) for row in rows)
+            if rows and not dry_run:
+                drifted_pks = [row[0] for row in rows]
+                cursor.execute(fix_sql, [drifted_pks])
+                drift.n_fixed += cursor.rowcount
+                fixed_pks.extend(drifted_pks)
+    if fixed_pks and counter.model is SectionComment:
+        comments_modified.send(sender=SectionComment, pks=fixed_pks, modified_at=now())
+    elif fixed_pks and counter.hearing_lookup:
+        _send_counters_changed(counter, fixed_pks)
+    return drift
+
+
+def _send_counters_changed(counter, pks):
+    hearing_ids = list(set(
+        counter.model._base_manager.filter(pk__in=pks).values_list(counter.hearing_lookup, flat=True)
+    ))
+    if counter.model is Hearing:
+        Hearing.objects.everything().filter(pk__in=hearing_ids).update(tree_modified_at=now())
+        _send_n_comments_changed(hearing_ids)
+    elif hearing_ids:
+        hearing_tree_changed.send(
+            sender=counter.model, instance=None, hearing_ids=hearing_ids, update_fields=(counter.field,)
+        )
+
+
+def reconcile_counters(dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Find and fix the drift of all denormalized counters.
+
+    Pending comment counter slots are folded into the counters first, unless this is a dry run.
+
+    :rtype: list[Drift]
+    """
+    if not dry_run:
+        flush_comment_counter_slots()
+    return [reconcile_counter(counter, dry_run, batch_size) for counter in COUNTERS]
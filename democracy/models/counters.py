@@ -0,0 +1,154 @@
+"""
+Incremental comment counters.
+
+Comment writes change `Section.n_comments` and `Hearing.n_comments` by atomic deltas instead
+of recounting, and never go through `save()`. A hearing with lots of commenting would still
+serialize every comment on its hearing row, so with `DEMOCRACY_COMMENT_COUNTER_SLOTS` set,
+deltas are instead added to one of that many counter slots per section, chosen at random.
+Pending slot deltas are summed on read by `get_n_comments()`, and folded into the counter
+columns by `flush_comment_counter_slots()`.
+"""
+import random
+from collections import Counter
+
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.utils.timezone import now
+from django.utils.translation import ugettext_lazy as _
+
+from democracy.utils.hearing_cache import bump_hearing_generation
+
+from .base import get_counter_slots
+from .comment import comments_bulk_created
+from .hearing import Hearing
+from .section import Section, SectionComment
+from .signals import hearing_tree_changed
+
+
+class CommentCounterSlot(models.Model):
+    hearing = models.ForeignKey(
+        Hearing, verbose_name=_('hearing'), related_name='comment_counter_slots', on_delete=models.CASCADE
+    )
+    section = models.ForeignKey(
+        Section, verbose_name=_('section'), related_name='comment_counter_slots', on_delete=models.CASCADE
+    )
+    slot = models.PositiveSmallIntegerField(verbose_name=_('slot'))
+    delta = models.IntegerField(verbose_name=_('pending change in the number of comments'), default=0)
+
+    class Meta:
+        verbose_name = _('comment counter slot')
+        verbose_name_plural = _('comment counter slots')
+        unique_together = (('section', 'slot'),)
+
+
+def _add_to_counter_slot(hearing_id, section_id, delta):
+    table = CommentCounterSlot._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO "{table}" (hearing_id, section_id, slot, delta) VALUES (%s, %s, %s, %s) '
+            'ON CONFLICT (section_id, slot) DO UPDATE SET delta = "{table}".delta + EXCLUDED.delta'.format(
+                table=table
+            ),
+            [hearing_id, section_id, random.randrange(get_counter_slots()), delta]
+        )
+
+
+def change_n_comments(section_id, delta):
+    """
+    Change the comment counts of a section and its hearing by `delta`.
+    """
+    hearing_id = Section.objects.everything().filter(pk=section_id).values_list('hearing_id', flat=True).first()
+    if hearing_id is None:
+        return
+    if get_counter_slots():
+        _add_to_counter_slot(hearing_id, section_id, delta)
+        # slots are summed on read, so only cached representations need to be refreshed until the slots are
+        # flushed, updating the hearing tree would lock the hearing row again
+        bump_hearing_generation(hearing_id)
+        return
+    Section.objects.everything().filter(pk=section_id).update(n_comments=F('n_comments') + delta)
+    Hearing.objects.everything().filter(pk=hearing_id).update(
+        n_comments=F('n_comments') + delta, tree_modified_at=now()
+    )
+    _send_n_comments_changed([hearing_id])
+
+
+def _send_n_comments_changed(hearing_ids):
+    # the senders bump tree_modified_at in the same update as the count, see update_tree_modified_at
+    hearing_tree_changed.send(sender=Hearing, instance=None, hearing_ids=hearing_ids, update_fields=('n_comments',))
+
+
+def flush_comment_counter_slots():
+    """
+    Fold the pending deltas of all counter slots into the comment counts.
+
+    :return: The number of flushed slots
+    """
+    table = CommentCounterSlot._meta.db_table
+    section_deltas = Counter()
+    hearing_deltas = Counter()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM "%s" RETURNING hearing_id, section_id, delta' % table)
+            rows = cursor.fetchall()
+        for hearing_id, section_id, delta in rows:
+            section_deltas[section_id] += delta
+            hearing_deltas[hearing_id] += delta
+        for section_id, delta in section_deltas.items():
+            Section.objects.everything().filter(pk=section_id).update(n_comments=F('n_comments') + delta)
+        tree_modified_at = now()
+        for hearing_id, delta in hearing_deltas.items():
+            Hearing.objects.everything().filter(pk=hearing_id).update(
+                n_comments=F('n_comments') + delta, tree_modified_at=tree_modified_at
+            )
+    if hearing_deltas:
+        _send_n_comments_changed(list(hearing_deltas))
+    return len(rows)
+
+
+def update_comment_counters(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Count comments in or out of their section when they are created, (un)deleted or moved.
+    """
+    counted_section_id = None if instance.deleted else instance.section_id
+    if created:
+        previous_section_id = None
+    elif update_fields and not {'deleted', 'section'} & set(update_fields):
+        return
+    elif hasattr(instance, '_counted_parent_id'):
+        previous_section_id = instance._counted_parent_id
+    else:
+        # the previous state is unknown, so recount
+        instance._counted_parent_id = counted_section_id
+        instance.recache_parent_n_comments()
+        return
+
+    instance._counted_parent_id = counted_section_id
+    if previous_section_id == counted_section_id:
+        return
+    if previous_section_id:
+        change_n_comments(previous_section_id, -1)
+    if counted_section_id:
+        change_n_comments(counted_section_id, 1)
+
+
+post_save.connect(update_comment_counters, sender=SectionComment, dispatch_uid='update_comment_counters')
+
+
+def update_bulk_comment_counters(sender, instances, **kwargs):
+    """
+    Count comments created in bulk with one counter update per section.
+    """
+    section_deltas = Counter()
+    for instance in instances:
+        instance._counted_parent_id = None if instance.deleted else instance.section_id
+        if instance._counted_parent_id:
+            section_deltas[instance._counted_parent_id] += 1
+    for section_id, delta in section_deltas.items():
+        change_n_comments(section_id, delta)
+
+
+comments_bulk_created.connect(
+    update_bulk_comment_counters, sender=SectionComment, dispatch_uid='update_bulk_comment_counters'
+)
@@ -3,6 +3,8 @@ from urllib.parse import urljoin
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db.models import Sum
 from django.utils import timezone
 from django.utils.timezone import now
@@ -13,15 +15,31 @@ from autoslug.utils import generate_unique_slug
 from parler.models import TranslatedFields, TranslatableModel
 from parler.managers import TranslatableQuerySet
 
-from democracy.enums import InitialSectionType
+from democracy.enums import HearingStatus, InitialSectionType
 from democracy.utils.hmac_hash import get_hmac_b64_encoded
-from democracy.utils.geo import get_geometry_from_geojson
+from democracy.utils.geo import update_geometry
 
-from .base import BaseModelManager, StringIdBaseModel
+from .base import BaseModelManager, CommentCounterMixin, StringIdBaseModel
 from .organization import ContactPerson, Organization
 from .project import ProjectPhase
 
 
+def get_status_q(status, at=None):
+    """
+    Get a Q for hearings with the given HearingStatus.
+
+    The conditions only use the opening and closing times, so the database can evaluate them using an index.
+    """
+    at = at or now()
+    if status == HearingStatus.UPCOMING:
+        return models.Q(force_closed=False, open_at__gt=at, close_at__gte=at)
+    if status == HearingStatus.OPEN:
+        return models.Q(force_closed=False, open_at__lte=at, close_at__gte=at)
+    if status == HearingStatus.CLOSED:
+        return models.Q(force_closed=True) | models.Q(close_at__lt=at)
+    raise ValueError('Unknown hearing status %r' % status)
+
+
 class HearingQueryset(TranslatableQuerySet):
     def get_by_id_or_slug(self, id_or_slug):
         return self.get(models.Q(pk=id_or_slug) | models.Q(slug=id_or_slug))
@@ -29,8 +47,14 @@ class HearingQueryset(TranslatableQuerySet):
     def filter_by_id_or_slug(self, id_or_slug):
         return self.filter(models.Q(pk=id_or_slug) | models.Q(slug=id_or_slug))
 
+    def filter_by_status(self, status, at=None):
+        return self.filter(get_status_q(status, at))
+
+    def exclude_by_status(self, status, at=None):
+        return self.exclude(get_status_q(status, at))
 
-class Hearing(StringIdBaseModel, TranslatableModel):
+
+class Hearing(CommentCounterMixin, StringIdBaseModel, TranslatableModel):
     open_at = models.DateTimeField(verbose_name=_('opening time'), default=timezone.now)
     close_at = models.DateTimeField(verbose_name=_('closing time'), default=timezone.now)
     force_closed = models.BooleanField(verbose_name=_('force hearing closed'), default=False)
@@ -59,6 +83,11 @@ class Hearing(StringIdBaseModel, TranslatableModel):
     contact_persons = models.ManyToManyField(ContactPerson, verbose_name=_('contact persons'), related_name='hearings')
     project_phase = models.ForeignKey(ProjectPhase, verbose_name=_('project phase'), related_name='hearings',
                                       on_delete=models.PROTECT, null=True, blank=True)
+    search_vector = SearchVectorField(verbose_name=_('search vector'), null=True, editable=False)
+    tree_modified_at = models.DateTimeField(
+        verbose_name=_('tree modification time'), default=timezone.now, editable=False,
+        help_text=_('last time the hearing or any object in it was modified')
+    )
 
     objects = BaseModelManager.from_queryset(HearingQueryset)()
     original_manager = models.Manager()
@@ -66,6 +95,15 @@ class Hearing(StringIdBaseModel, TranslatableModel):
     class Meta:
         verbose_name = _('hearing')
         verbose_name_plural = _('hearings')
+        indexes = [
+            # hearing status filters, see get_status_q
+            models.Index(fields=['published', 'deleted', 'open_at', 'close_at'], name='democracy_hearing_window_idx'),
+            # next_closing
+            models.Index(fields=['close_at'], name='democracy_hearing_close_idx'),
+            # the default ordering of the hearing list
+            models.Index(fields=['deleted', 'published', '-created_at'], name='democracy_hearing_created_idx'),
+            GinIndex(fields=['search_vector'], name='democracy_hearing_search_idx'),
+        ]
 
     def __str__(self):
         return (self.title or self.id)
@@ -74,6 +112,28 @@ class Hearing(StringIdBaseModel, TranslatableModel):
     def closed(self):
         return self.force_closed or not (self.open_at <= now() <= self.close_at)
 
+    @property
+    def status(self):
+        """
+        The HearingStatus of the hearing, matching `get_status_q`.
+        """
+        if self.force_closed or self.close_at < now():
+            return HearingStatus.CLOSED
+        if self.open_at > now():
+            return HearingStatus.UPCOMING
+        return HearingStatus.OPEN
+
+    def get_last_modified(self):
+        """
+        Get the last time the representation of the hearing changed.
+
+        Opening and closing change the representation as well, so they count as modifications.
+        """
+        current_time = now()
+        return max(
+            [time for time in (self.open_at, self.close_at) if time <= current_time] + [self.tree_modified_at]
+        )
+
     def check_commenting(self, request):
         if self.closed:
             raise ValidationError(_("%s is closed and does not allow comments anymore") % self, code="hearing_closed")
@@ -96,13 +156,15 @@ class Hearing(StringIdBaseModel, TranslatableModel):
         return url
 
     def save(self, *args, **kwargs):
-        slug_field = self._meta.get_field('slug')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'slug' in update_fields:
+            slug_field = self._meta.get_field('slug')
 
-        # we need to manually use autoslug utils here with ModelManager, because automatic slug populating
-        # uses our default manager, which can lead to a slug collision between this and a deleted hearing
-        self.slug = generate_unique_slug(slug_field, self, self.slug, Hearing.original_manager)
+            # we need to manually use autoslug utils here with ModelManager, because automatic slug populating
+            # uses our default manager, which can lead to a slug collision between this and a deleted hearing
+            self.slug = generate_unique_slug(slug_field, self, self.slug, Hearing.original_manager)
 
-        self.geometry = get_geometry_from_geojson(self.geojson)
+        kwargs['update_fields'] = update_geometry(self, update_fields)
 
         super().save(*args, **kwargs)
 
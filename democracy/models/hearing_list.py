@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+from .hearing import Hearing
+from .label import Label
+from .organization import Organization
+from .project import Project, ProjectPhase
+from .section import Section, SectionImage
+from .signals import get_master_model, hearing_tree_changed
+
+# models whose changes are reflected in the list entries
+LIST_ENTRY_SOURCE_MODELS = (Hearing, Section, SectionImage, Label, Organization, Project, ProjectPhase)
+
+
+def _get_translation_values(obj, fields):
+    """
+    Get the raw translated values of `obj` as {field: {language_code: value}}.
+
+    Every existing translation is included, even if its value is empty, so that the
+    list serializer can reproduce the exact output of `TranslatableSerializer`.
+    """
+    language_codes = [lang['code'] for lang in settings.PARLER_LANGUAGES[None]]
+    values = {field: {} for field in fields}
+    for translation in obj.translations.filter(language_code__in=language_codes):
+        for field in fields:
+            values[field][translation.language_code] = getattr(translation, field)
+    return values
+
+
+class HearingListEntry(models.Model):
+    """
+    Precomputed hearing list payload.
+
+    There is one entry per hearing. The entries are kept up to date by `hearing_tree_changed`,
+    so the hearing list endpoint does not need to walk sections, images, labels and projects per hearing.
+    """
+    hearing = models.OneToOneField(
+        Hearing, verbose_name=_('hearing'), primary_key=True, related_name='list_entry', on_delete=models.CASCADE
+    )
+    title = JSONField(verbose_name=_('title'), default=dict)
+    borough = JSONField(verbose_name=_('borough'), default=dict)
+    abstract = JSONField(verbose_name=_('abstract'), blank=True, null=True)
+    main_image = JSONField(verbose_name=_('main image'), blank=True, null=True)
+    default_to_fullscreen = models.BooleanField(verbose_name=_('default to fullscreen'), default=False)
+    labels = JSONField(verbose_name=_('labels'), default=list)
+    organization = models.CharField(verbose_name=_('organization'), max_length=255, blank=True, null=True)
+    project = JSONField(verbose_name=_('project'), blank=True, null=True)
+    open_at = models.DateTimeField(verbose_name=_('opening time'))
+    close_at = models.DateTimeField(verbose_name=_('closing time'))
+    force_closed = models.BooleanField(verbose_name=_('force hearing closed'), default=False)
+
+    class Meta:
+        verbose_name = _('hearing list entry')
+        verbose_name_plural = _('hearing list entries')
+
+    def __str__(self):
+        return str(self.hearing_id)
+
+
+def _get_main_image_values(main_section):
+    main_image = main_section.images.first()
+    if not main_image:
+        return None
+    values = {
+        'id': main_image.pk,
+        'image': main_image.image.name,
+        'width': main_image.width,
+        'height': main_image.height,
+        'published': main_image.published,
+    }
+    values.update(_get_translation_values(main_image, ('title', 'caption')))
+    return values
+
+
+def _get_project_values(project_phase):
+    """
+    Get the project of `project_phase` with its phases.
+
+    The hearings of the phases are not included, since which of them are visible depends on the request.
+    """
+    project = project_phase.project
+    values = {'id': project.pk}
+    values.update(_get_translation_values(project, ('title',)))
+    values['phases'] = [
+        dict(id=phase.pk, **_get_translation_values(phase, ('title', 'description', 'schedule')))
+        for phase in project.phases.all()
+    ]
+    return values
+
+
+def refresh_hearing_list_entry(hearing_id):
+    """
+    Recompute the list entry of the given hearing.
+
+    :return: The refreshed entry, or None if the hearing does not exist
+    :rtype: HearingListEntry|None
+    """
+    hearing = Hearing.objects.everything().filter(pk=hearing_id).first()
+    if not hearing:
+        return None
+
+    values = _get_translation_values(hearing, ('title', 'borough'))
+    main_section = hearing.get_main_section()
+    if main_section:
+        abstracts = _get_translation_values(main_section, ('abstract',))['abstract']
+        values['abstract'] = {lang_code: abstract for lang_code, abstract in abstracts.items() if abstract}
+        values['main_image'] = _get_main_image_values(main_section)
+        values['default_to_fullscreen'] = main_section.plugin_fullscreen
+    else:
+        values['abstract'] = ''
+        values['main_image'] = None
+        values['default_to_fullscreen'] = False
+    values['labels'] = [
+        dict(id=label.pk, **_get_translation_values(label, ('label',)))
+        for label in hearing.labels.all()
+    ]
+    values.update(
+        organization=hearing.organization.name if hearing.organization else None,
+        project=_get_project_values(hearing.project_phase) if hearing.project_phase else None,
+        open_at=hearing.open_at,
+        close_at=hearing.close_at,
+        force_closed=hearing.force_closed,
+    )
+    entry, created = HearingListEntry.objects.update_or_create(hearing=hearing, defaults=values)
+    return entry
+
+
+def update_hearing_list_entries(sender, instance, hearing_ids, update_fields=None, **kwargs):
+    if get_master_model(sender) not in LIST_ENTRY_SOURCE_MODELS:
+        return
+    # contact persons are not listed, and the list reads comment counts from the hearing row
+    if update_fields and set(update_fields) <= {'contact_persons', 'n_comments'}:
+        return
+    for hearing_id in hearing_ids:
+        refresh_hearing_list_entry(hearing_id)
+
+
+hearing_tree_changed.connect(update_hearing_list_entries, dispatch_uid='update_hearing_list_entries')
@@ -0,0 +1,46 @@
+from django.contrib.postgres.fields import JSONField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils.timezone import now
+from django.utils.translation import ugettext_lazy as _
+
+from .hearing import Hearing
+
+
+class StoredHearingReport(models.Model):
+    """
+    An XLSX report of a hearing generated in the background and kept in media storage.
+
+    A report is pending until the `democracy_generate_hearing_reports` command has generated
+    its file. The key changes whenever the reported hearing or its comments change, see
+    `get_report_key()`.
+    """
+    hearing = models.ForeignKey(
+        Hearing, verbose_name=_('hearing'), related_name='stored_reports', on_delete=models.CASCADE
+    )
+    key = models.CharField(verbose_name=_('key'), max_length=200, unique=True)
+    # the report is generated without a request, so the request dependent parts are stored with it
+    hearing_data = JSONField(verbose_name=_('hearing data'), encoder=DjangoJSONEncoder)
+    base_url = models.CharField(verbose_name=_('base URL'), max_length=255)
+    file = models.FileField(verbose_name=_('file'), upload_to='reports/%Y/%m', blank=True)
+    requested_at = models.DateTimeField(verbose_name=_('time of request'), default=now, db_index=True)
+    generated_at = models.DateTimeField(verbose_name=_('time of generation'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('stored hearing report')
+        verbose_name_plural = _('stored hearing reports')
+
+    def delete_with_file(self):
+        if self.file:
+            self.file.delete(save=False)
+        self.delete()
+
+
+def get_report_key(hearing):
+    """
+    Get a key that changes whenever the report of `hearing` changes.
+
+    The comment count changes when comments are added or removed, and the tree modification
+    time when the hearing or any object in it, including its comments, is edited or voted on.
+    """
+    return '%s:%d:%s' % (hearing.pk, hearing.get_n_comments(), hearing.tree_modified_at.isoformat())
@@ -0,0 +1,74 @@
+"""
+Batched language detection of comments.
+
+With `DEMOCRACY_ASYNC_LANGUAGE_DETECTION` set, comments without a language are saved without
+detecting it, and are marked as pending instead. The pending comments are detected in batches
+by the `democracy_detect_comment_languages` command, which can also backfill the languages of
+existing comments.
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+from django.utils.timezone import now
+
+from democracy.utils.language_detection import detect_language, get_detectable_languages
+
+from .comment import comments_modified
+from .search import refresh_comment_search_vectors
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def detect_comment_languages(queryset):
+    """
+    Detect and save the languages of the comments in `queryset` that have none, with one update per language.
+
+    :return: The number of comments whose language was detected
+    """
+    languages = get_detectable_languages()
+    # a language set meanwhile is never overwritten
+    queryset = queryset.filter(language_code='')
+    pks_by_language = defaultdict(list)
+    for pk, content in queryset.values_list('pk', 'content'):
+        pks_by_language[detect_language(content, languages) if content else ''].append(pk)
+    pks_by_language.pop('', None)
+
+    modified_at = now()
+    for language_code, pks in pks_by_language.items():
+        queryset.filter(pk__in=pks).update(
+            language_code=language_code, language_detection_pending=False, modified_at=modified_at
+        )
+    detected_pks = [pk for pks in pks_by_language.values() for pk in pks]
+    if detected_pks:
+        refresh_comment_search_vectors(queryset.model.objects.everything().filter(pk__in=detected_pks))
+        comments_modified.send(sender=queryset.model, pks=detected_pks, modified_at=modified_at)
+    return len(detected_pks)
+
+
+def detect_pending_comment_languages(model, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Detect the languages of all comments of `model` pending language detection, in batches.
+
+    :return: The number of processed comments and the number of detected languages
+    """
+    n_processed = n_detected = 0
+    pending = model.objects.everything().filter(language_detection_pending=True).order_by('pk')
+    last_pk = None
+    while True:
+        batch = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return n_processed, n_detected
+        batch = model.objects.everything().filter(pk__in=pks)
+        n_detected += detect_comment_languages(batch)
+        # the comments whose language could not be detected are not retried
+        batch.filter(language_detection_pending=True).update(language_detection_pending=False)
+        n_processed += len(pks)
+        last_pk = pks[-1]
+
+
+def get_undetected_comments(model):
+    """
+    Get the comments of `model` that have content but no language.
+    """
+    return model.objects.everything().filter(language_code='').exclude(Q(content='') | Q(content__isnull=True))
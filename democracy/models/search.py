@@ -0,0 +1,142 @@
+"""
+Full text search for hearings, sections and section comments.
+
+Every hearing and section has a single `search_vector` that concatenates a vector for each
+language, built with the text search configuration of that language. A comment has one
+language, so its vector is built with the configuration of its `language_code`. Queries are
+matched against all configurations, or only the one of the requested language.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Case, CharField, F, TextField, Value, When
+from django.db.models.signals import post_save
+from django.utils.html import strip_tags
+
+from .comment import comments_bulk_created
+from .hearing import Hearing
+from .section import Section, SectionComment
+from .signals import get_master_model, hearing_tree_changed
+
+DEFAULT_SEARCH_CONFIG = 'simple'
+
+
+def get_search_config(language_code):
+    return getattr(settings, 'DEMOCRACY_SEARCH_CONFIGS', {}).get(language_code, DEFAULT_SEARCH_CONFIG)
+
+
+def get_search_config_expression(language_field):
+    """
+    Get an expression that selects the text search configuration by the language code in `language_field`.
+    """
+    configs = getattr(settings, 'DEMOCRACY_SEARCH_CONFIGS', {})
+    return Case(
+        *[When(**{language_field: language_code, 'then': Value(config)})
+          for language_code, config in sorted(configs.items())],
+        default=Value(DEFAULT_SEARCH_CONFIG),
+        output_field=CharField()
+    )
+
+
+def build_search_vector(weighted_texts):
+    """
+    Build a search vector expression from (language_code, weight, text) tuples.
+
+    :return: The expression, or None if there is no text
+    """
+    vector = None
+    for language_code, weight, text in weighted_texts:
+        text = strip_tags(text or '').strip()
+        if not text:
+            continue
+        part = SearchVector(
+            Value(text, output_field=TextField()), config=get_search_config(language_code), weight=weight
+        )
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def _get_section_texts(section_ids, title_weight, abstract_weight, content_weight):
+    translations = Section._parler_meta.root_model.objects.filter(master_id__in=section_ids)
+    for translation in translations:
+        yield translation.language_code, title_weight, translation.title
+        yield translation.language_code, abstract_weight, translation.abstract
+        yield translation.language_code, content_weight, translation.content
+
+
+def refresh_section_search_vector(section_id):
+    vector = build_search_vector(_get_section_texts([section_id], 'A', 'B', 'C'))
+    Section.objects.everything().filter(pk=section_id).update(search_vector=vector)
+
+
+def refresh_hearing_search_vector(hearing_id):
+    texts = []
+    for translation in Hearing._parler_meta.root_model.objects.filter(master_id=hearing_id):
+        texts.append((translation.language_code, 'A', translation.title))
+        texts.append((translation.language_code, 'B', translation.borough))
+    section_ids = Section.objects.filter(hearing_id=hearing_id).values_list('pk', flat=True)
+    texts.extend(_get_section_texts(list(section_ids), 'B', 'B', 'C'))
+    Hearing.objects.everything().filter(pk=hearing_id).update(search_vector=build_search_vector(texts))
+
+
+def refresh_comment_search_vectors(queryset):
+    """
+    Recompute the search vectors of the given section comments in a single update.
+    """
+    config = get_search_config_expression('language_code')
+    queryset.update(search_vector=(
+        SearchVector('title', config=config, weight='A') + SearchVector('content', config=config, weight='B')
+    ))
+
+
+def get_search_query(text, language_code=None):
+    if language_code:
+        configs = [get_search_config(language_code)]
+    else:
+        configs = sorted({get_search_config(lang['code']) for lang in settings.PARLER_LANGUAGES[None]})
+    query = None
+    for config in configs:
+        part = SearchQuery(text, config=config)
+        query = part if query is None else query | part
+    return query
+
+
+def filter_by_search(queryset, text, language_code=None):
+    """
+    Filter a Hearing, Section or SectionComment queryset by a search text, annotating the rank as `search_rank`.
+    """
+    query = get_search_query(text, language_code)
+    return queryset.filter(search_vector=query).annotate(search_rank=SearchRank(F('search_vector'), query))
+
+
+def update_search_vectors(sender, instance, hearing_ids, update_fields=None, **kwargs):
+    model = get_master_model(sender)
+    if model not in (Hearing, Section):
+        return
+    # counter updates and the like do not change any text, but removing a section does
+    if update_fields and 'deleted' not in update_fields:
+        return
+    if model is Section:
+        refresh_section_search_vector(instance.pk if isinstance(instance, Section) else instance.master_id)
+    for hearing_id in hearing_ids:
+        refresh_hearing_search_vector(hearing_id)
+
+
+hearing_tree_changed.connect(update_search_vectors, dispatch_uid='update_search_vectors')
+
+
+def update_comment_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not set(update_fields) & {'title', 'content', 'language_code'}:
+        return
+    refresh_comment_search_vectors(SectionComment.objects.everything().filter(pk=instance.pk))
+
+
+post_save.connect(update_comment_search_vector, sender=SectionComment, dispatch_uid='update_comment_search_vector')
+
+
+def update_bulk_comment_search_vectors(sender, instances, **kwargs):
+    refresh_comment_search_vectors(SectionComment.objects.everything().filter(pk__in=[i.pk for i in instances]))
+
+
+comments_bulk_created.connect(
+    update_bulk_comment_search_vectors, sender=SectionComment, dispatch_uid='update_bulk_comment_search_vectors'
+)
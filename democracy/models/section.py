@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from reversion import revisions
@@ -55,12 +57,16 @@ class Section(Commentable, StringIdBaseModel, TranslatableModel):
     plugin_identifier = models.CharField(verbose_name=_('plugin identifier'), blank=True, max_length=255)
     plugin_data = models.TextField(verbose_name=_('plugin data'), blank=True)
     plugin_fullscreen = models.BooleanField(default=False)
+    search_vector = SearchVectorField(verbose_name=_('search vector'), null=True, editable=False)
     objects = BaseModelManager.from_queryset(TranslatableQuerySet)()
 
     class Meta:
         ordering = ["ordering"]
         verbose_name = _('section')
         verbose_name_plural = _('sections')
+        indexes = [
+            GinIndex(fields=['search_vector'], name='democracy_section_search_idx'),
+        ]
 
     def __str__(self):
         return "%s: %s" % (self.hearing, self.title)
@@ -112,11 +118,23 @@ class SectionComment(BaseComment):
     section = models.ForeignKey(Section, related_name="comments")
     title = models.CharField(verbose_name=_('title'), blank=True, max_length=255)
     content = models.TextField(verbose_name=_('content'), blank=True)
+    search_vector = SearchVectorField(verbose_name=_('search vector'), null=True, editable=False)
+    # set to txid_current() on every insert and update by a database trigger, see ChangeFeedPagination
+    change_txid = models.BigIntegerField(verbose_name=_('changing transaction'), null=True, editable=False)
 
     class Meta:
         verbose_name = _('section comment')
         verbose_name_plural = _('section comments')
         ordering = ('-created_at',)
+        indexes = [
+            # keyset pagination of section comments, see KeysetPagination
+            models.Index(fields=['section', 'created_at', 'id'], name='democracy_comment_created_idx'),
+            models.Index(fields=['section', 'n_votes', 'id'], name='democracy_comment_votes_idx'),
+            GinIndex(fields=['search_vector'], name='democracy_comment_search_idx'),
+            # the comment change feed
+            models.Index(fields=['change_txid', 'id'], name='democracy_comment_change_idx'),
+            models.Index(fields=['modified_at'], name='democracy_comment_modified_idx'),
+        ]
 
     def soft_delete(self, using=None):
         for answer in self.poll_answers.all():
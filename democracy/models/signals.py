@@ -0,0 +1,215 @@
+"""
+Signals for keeping data derived from a hearing in sync with the objects the hearing consists of.
+
+Any save of a model in the hearing tree is translated into a `hearing_tree_changed` signal that
+carries the ids of the affected hearings, so that consumers do not have to know how to walk
+from e.g. a section image translation back to its hearing.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import Signal
+from django.utils.timezone import now
+
+from .comment import comments_modified
+from .hearing import Hearing
+from .label import Label
+from .organization import ContactPerson, Organization
+from .project import Project, ProjectPhase
+from .section import Section, SectionComment, SectionImage, SectionPoll, SectionPollOption
+
+hearing_tree_changed = Signal(providing_args=['instance', 'hearing_ids', 'update_fields'])
+
+
+def _get_hearing_ids_for_hearing(hearing):
+    return [hearing.pk]
+
+
+def _get_hearing_ids_for_section(section):
+    return [section.hearing_id]
+
+
+def _get_hearing_ids_for_section_image(image):
+    return list(Section.objects.everything().filter(pk=image.section_id).values_list('hearing_id', flat=True))
+
+
+def _get_hearing_ids_for_section_poll(poll):
+    return list(Section.objects.everything().filter(pk=poll.section_id).values_list('hearing_id', flat=True))
+
+
+def _get_hearing_ids_for_section_poll_option(option):
+    return list(
+        SectionPoll.objects.everything().filter(pk=option.poll_id).values_list('section__hearing_id', flat=True)
+    )
+
+
+def _get_hearing_ids_for_label(label):
+    return list(Hearing.objects.everything().filter(labels=label).values_list('pk', flat=True))
+
+
+def _get_hearing_ids_for_contact_person(contact_person):
+    return list(Hearing.objects.everything().filter(contact_persons=contact_person).values_list('pk', flat=True))
+
+
+def _get_hearing_ids_for_organization(organization):
+    return list(Hearing.objects.everything().filter(organization=organization).values_list('pk', flat=True))
+
+
+def _get_hearing_ids_for_project(project):
+    return list(Hearing.objects.everything().filter(project_phase__project=project).values_list('pk', flat=True))
+
+
+def _get_hearing_ids_for_project_phase(phase):
+    # every hearing of the project lists all of its phases
+    return list(
+        Hearing.objects.everything().filter(project_phase__project_id=phase.project_id).values_list('pk', flat=True)
+    )
+
+
+HEARING_ID_RESOLVERS = {
+    Hearing: _get_hearing_ids_for_hearing,
+    Section: _get_hearing_ids_for_section,
+    SectionImage: _get_hearing_ids_for_section_image,
+    SectionPoll: _get_hearing_ids_for_section_poll,
+    SectionPollOption: _get_hearing_ids_for_section_poll_option,
+    Label: _get_hearing_ids_for_label,
+    ContactPerson: _get_hearing_ids_for_contact_person,
+    Organization: _get_hearing_ids_for_organization,
+    Project: _get_hearing_ids_for_project,
+    ProjectPhase: _get_hearing_ids_for_project_phase,
+}
+
+
+def get_master_model(model):
+    """
+    Get the translatable model of a parler translation model, or the model itself.
+    """
+    if model in HEARING_ID_RESOLVERS:
+        return model
+    try:
+        return model._meta.get_field('master').related_model
+    except FieldDoesNotExist:
+        return model
+
+
+def get_dependent_hearing_ids(instance, hearing_ids, update_fields=None):
+    """
+    Get the ids of the hearings whose representation depends on a change of the given hearings.
+
+    A project lists the slugs of all hearings in it, so a hearing change concerns the other
+    hearings of the project as well. Comment count updates never do.
+
+    :rtype: set[str]
+    """
+    hearing_ids = set(hearing_ids)
+    if update_fields and set(update_fields) == {'n_comments'}:
+        return hearing_ids
+    if isinstance(instance, Hearing) and instance.project_phase_id:
+        hearing_ids.update(
+            Hearing.objects.everything().filter(
+                project_phase__project__phases=instance.project_phase_id
+            ).values_list('pk', flat=True)
+        )
+    return hearing_ids
+
+
+def get_hearing_ids(instance):
+    """
+    Get the ids of the hearings the given hearing tree object (or its translation) belongs to.
+
+    :rtype: list[str]
+    """
+    resolver = HEARING_ID_RESOLVERS.get(instance.__class__)
+    if resolver:
+        return resolver(instance)
+    # parler translation models link to their master object
+    master_id = getattr(instance, 'master_id', None)
+    if master_id is None:
+        return []
+    master = get_master_model(instance.__class__)
+    resolver = HEARING_ID_RESOLVERS[master]
+    return resolver(master._base_manager.get(pk=master_id))
+
+
+def send_hearing_tree_changed(sender, instance, update_fields=None, **kwargs):
+    hearing_ids = [hearing_id for hearing_id in get_hearing_ids(instance) if hearing_id]
+    if hearing_ids:
+        hearing_tree_changed.send(
+            sender=sender, instance=instance, hearing_ids=hearing_ids, update_fields=update_fields
+        )
+
+
+def _send_hearing_m2m_changed(sender, field_name, instance, action, reverse, pk_set):
+    if reverse and action == 'pre_clear':
+        # post_clear gets no pk_set, so record the hearings losing the relation beforehand
+        field = Hearing._meta.get_field(field_name)
+        instance._cleared_hearing_ids = list(
+            sender.objects.filter(**{field.m2m_reverse_field_name(): instance.pk}).values_list(
+                '%s_id' % field.m2m_field_name(), flat=True
+            )
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        hearing_ids = [instance.pk]
+    elif action == 'post_clear':
+        hearing_ids = instance.__dict__.pop('_cleared_hearing_ids', [])
+    else:
+        hearing_ids = pk_set or []
+    if hearing_ids:
+        hearing_tree_changed.send(
+            sender=Hearing, instance=instance, hearing_ids=list(hearing_ids), update_fields=(field_name,)
+        )
+
+
+def send_hearing_labels_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _send_hearing_m2m_changed(sender, 'labels', instance, action, reverse, pk_set)
+
+
+def send_hearing_contact_persons_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _send_hearing_m2m_changed(sender, 'contact_persons', instance, action, reverse, pk_set)
+
+
+for model in HEARING_ID_RESOLVERS:
+    post_save.connect(send_hearing_tree_changed, sender=model)
+    if hasattr(model, '_parler_meta'):
+        post_save.connect(send_hearing_tree_changed, sender=model._parler_meta.root_model)
+m2m_changed.connect(send_hearing_labels_changed, sender=Hearing.labels.through)
+m2m_changed.connect(send_hearing_contact_persons_changed, sender=Hearing.contact_persons.through)
+
+
+def update_tree_modified_at(sender, instance, hearing_ids, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'n_comments'}:
+        # comment counters bump tree_modified_at in the same update as the count
+        return
+    tree_modified_at = now()
+    Hearing.objects.everything().filter(
+        pk__in=get_dependent_hearing_ids(instance, hearing_ids, update_fields)
+    ).update(tree_modified_at=tree_modified_at)
+    if isinstance(instance, Hearing) and instance.pk in hearing_ids:
+        instance.tree_modified_at = tree_modified_at
+
+
+hearing_tree_changed.connect(update_tree_modified_at, dispatch_uid='update_tree_modified_at')
+
+
+def update_comment_tree_modified_at(sender, pks, modified_at, **kwargs):
+    """
+    Bump the tree modification time of the hearings of edited or voted comments.
+
+    Comments are not part of any hearing representation, so no `hearing_tree_changed` is sent
+    for them, but comment lists and reports are validated by the tree modification time.
+    """
+    Hearing.objects.everything().filter(sections__comments__in=pks).update(tree_modified_at=modified_at)
+
+
+def send_comments_modified(sender, instance, created, **kwargs):
+    # new comments change the comment counts instead, see democracy.models.counters
+    if not created:
+        comments_modified.send(sender=sender, pks=[instance.pk], modified_at=instance.modified_at)
+
+
+post_save.connect(send_comments_modified, sender=SectionComment, dispatch_uid='send_comments_modified')
+comments_modified.connect(
+    update_comment_tree_modified_at, sender=SectionComment, dispatch_uid='update_comment_tree_modified_at'
+)
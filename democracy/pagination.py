@@ -1,5 +1,260 @@
-from rest_framework.pagination import LimitOffsetPagination
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
 
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-class DefaultLimitPagination(LimitOffsetPagination):
+
+class CountStrategyPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination that avoids exact counts where it can.
+
+    The count comes from the first strategy that applies:
+
+    * ``counter``: a denormalized counter, if the view's `get_denormalized_count()` returns one
+    * ``estimate``: the planner estimate, if it is at least DEMOCRACY_PAGINATION_ESTIMATE_THRESHOLD rows
+    * ``cached``: an exact count cached in the DEMOCRACY_PAGINATION_COUNT_CACHE cache
+    * ``exact``: an exact count, cached for later requests if the count cache is enabled
+
+    The strategy is returned as `count_strategy`. Counters and estimates may be off, so the
+    existence of a next page is checked by fetching one extra row instead of using the count.
+    """
+    exact_count_strategies = ('cached', 'exact')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.request = request
+        self.view = view
+        self.has_next = False
+        self.count = self.get_count(queryset)
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if self.count_strategy in self.exact_count_strategies and (self.count == 0 or self.offset > self.count):
+            return []
+
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_strategy', self.count_strategy),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_count(self, queryset):
+        self.count_strategy, count = self._get_count(queryset)
+        return count
+
+    def _get_count(self, queryset):
+        get_denormalized_count = getattr(self.view, 'get_denormalized_count', None)
+        count = get_denormalized_count() if get_denormalized_count else None
+        if count is not None:
+            return 'counter', count
+        if not isinstance(queryset, QuerySet):
+            return 'exact', len(queryset)
+
+        threshold = getattr(settings, 'DEMOCRACY_PAGINATION_ESTIMATE_THRESHOLD', None)
+        if threshold is not None:
+            estimate = self._get_estimate(queryset)
+            if estimate is not None and estimate >= threshold:
+                return 'estimate', estimate
+
+        cache_alias = getattr(settings, 'DEMOCRACY_PAGINATION_COUNT_CACHE', None)
+        if not cache_alias:
+            return 'exact', queryset.count()
+        cache = caches[cache_alias]
+        cache_key = self._get_count_cache_key()
+        count = cache.get(cache_key)
+        if count is not None:
+            return 'cached', count
+        count = queryset.count()
+        cache.set(cache_key, count, getattr(settings, 'DEMOCRACY_PAGINATION_COUNT_CACHE_TIMEOUT', 60))
+        return 'exact', count
+
+    def _get_count_cache_key(self):
+        # the SQL may contain the current time, so identify the count by the filters and the user instead
+        request = self.request
+        page_params = (self.limit_query_param, self.offset_query_param, api_settings.ORDERING_PARAM)
+        filters = sorted((key, values) for key, values in request.query_params.lists() if key not in page_params)
+        user_id = request.user.pk if request.user.is_authenticated() else ''
+        variant = '%s|%s|%s' % (request.path, filters, user_id)
+        return 'democracy:count:%s' % hashlib.md5(variant.encode('utf-8')).hexdigest()
+
+    def _get_estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class DefaultLimitPagination(CountStrategyPagination):
+    default_limit = 50
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination for querysets ordered by one of `ordering_fields` and the primary key.
+
+    The cursor identifies the last row of the previous page, so every page is a range scan
+    over an index on (ordering field, pk) instead of an ever growing offset. Pagination is
+    forward only, and the first page is requested with an empty cursor.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
     default_limit = 50
+    max_limit = 500
+    ordering_fields = ('created_at', 'n_votes')
+    default_ordering = '-created_at'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.field_name, self.descending = self.get_ordering(request)
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(prefix + self.field_name, prefix + 'pk')
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = self.filter_after(queryset, position)
+
+        results = list(queryset[:self.limit + 1])
+        self.has_next = len(results) > self.limit
+        self.page = results[:self.limit]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(max(limit, 1), self.max_limit)
+
+    def get_ordering(self, request):
+        """
+        :return: The ordering field name and whether the ordering is descending
+        :rtype: tuple[str, bool]
+        """
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM, '').strip()
+        if ordering.lstrip('-') not in self.ordering_fields:
+            ordering = self.default_ordering
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def filter_after(self, queryset, position):
+        # a row comparison lets the database scan an index on (ordering field, pk) as a range
+        table = queryset.model._meta.db_table
+        column = queryset.model._meta.get_field(self.field_name).column
+        pk_column = queryset.model._meta.pk.column
+        where = '("%s"."%s", "%s"."%s") %s (%%s, %%s)' % (
+            table, column, table, pk_column, '<' if self.descending else '>'
+        )
+        return queryset.extra(where=[where], params=list(position))
+
+    def decode_cursor(self, request, model):
+        """
+        :return: The (ordering field value, pk) position to continue after, or None for the first page
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value = model._meta.get_field(self.field_name).to_python(value)
+            pk = model._meta.pk.to_python(pk)
+        except (binascii.Error, DjangoValidationError, TypeError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field_name)
+        if hasattr(value, 'isoformat'):
+            # keep full precision, DjangoJSONEncoder would round datetimes to milliseconds
+            value = value.isoformat()
+        encoded = base64.urlsafe_b64encode(json.dumps([value, obj.pk]).encode('utf-8'))
+        return encoded.decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+        return remove_query_param(url, 'offset')
+
+
+class ChangeFeedPagination(KeysetPagination):
+    """
+    Keyset pagination over the changes of objects, in the order of the transactions that made them.
+
+    The `change_txid` of the objects is set to the id of the changing transaction by a database
+    trigger. Changes of transactions still in progress are held back, since they may commit after
+    newer changes have been listed. The cursor of the last listed change is always included, so
+    that clients can store it and ask for the changes after it later.
+    """
+    ordering_fields = ('change_txid',)
+    default_ordering = 'change_txid'
+    default_limit = 500
+    max_limit = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        table = queryset.model._meta.db_table
+        column = queryset.model._meta.get_field('change_txid').column
+        committed = '"%s"."%s" < txid_snapshot_xmin(txid_current_snapshot())' % (table, column)
+        if connections[queryset.db].in_atomic_block:
+            # a transaction sees its own changes, outside of transactions txid_current() would only
+            # use up a transaction id
+            committed = '(%s OR "%s"."%s" = txid_current())' % (committed, table, column)
+        return super().paginate_queryset(queryset.extra(where=[committed]), request, view)
+
+    def get_ordering(self, request):
+        return self.default_ordering, False
+
+    def get_cursor(self):
+        if self.page:
+            return self.encode_cursor(self.page[-1])
+        return self.request.query_params.get(self.cursor_query_param) or None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('cursor', self.get_cursor()),
+            ('results', data),
+        ]))
@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 from rest_framework.renderers import JSONRenderer
 
 
@@ -47,3 +49,20 @@ class GeoJSONRenderer(JSONRenderer):
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
         return super().render(self.geojsonify(data), accepted_media_type, renderer_context)
+
+    def render_stream(self, items, members=None):
+        """
+        Render a FeatureCollection piece by piece, so that it never has to be in memory as a whole.
+
+        :param items: Serialized objects, e.g. a generator
+        :param members: Additional FeatureCollection members, such as pagination links
+        :return: Generator of encoded parts
+        """
+        collection = OrderedDict([('type', 'FeatureCollection')])
+        collection.update(members or {})
+        yield super().render(collection)[:-1] + b',"features":['
+        separator = b''
+        for item in items:
+            yield separator + super().render(self.get_single_response(item))
+            separator = b','
+        yield b']}'
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 import datetime
 from copy import deepcopy
+from io import StringIO
 
 import pytest
-from django.test.utils import override_settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils.encoding import force_text
 from django.utils.timezone import now
 from reversion import revisions
@@ -11,12 +15,17 @@ from reversion.models import Version
 
 from democracy.enums import Commenting, InitialSectionType
 from democracy.factories.hearing import SectionCommentFactory
-from democracy.models import Hearing, Label, Section, SectionType
+from democracy.factories.poll import SectionPollFactory
+from democracy.models import (
+    CommentCounterSlot, Hearing, Label, Section, SectionPoll, SectionPollAnswer, SectionPollOption, SectionType
+)
+from democracy.models.counters import flush_comment_counter_slots
 from democracy.models.section import SectionComment
 from democracy.tests.conftest import default_comment_content, default_lang_code, geojson_feature
 from democracy.tests.utils import (
     assert_common_keys_equal, get_data_from_response, get_hearing_detail_url, image_test_json
 )
+from democracy.views.section_comment import SectionCommentViewSet
 
 
 root_list_url = '/v1/comment/'
@@ -169,6 +178,35 @@ def test_226_add_comment_to_section_detect_lang(
     assert data['language_code'] == comment_content[1]
 
 
+@pytest.mark.django_db
+def test_comment_language_detected_in_batches(settings, john_doe_api_client, default_hearing):
+    settings.DEMOCRACY_ASYNC_LANGUAGE_DETECTION = True
+    url = get_main_comments_url(default_hearing)
+    response = john_doe_api_client.post(url, data=get_comment_data(content='This is a comment'))
+    data = get_data_from_response(response, status_code=201)
+    assert data['language_code'] == ''
+    comment = SectionComment.objects.get(pk=data['id'])
+    assert comment.language_detection_pending
+
+    call_command('democracy_detect_comment_languages', stdout=StringIO())
+    comment = SectionComment.objects.get(pk=data['id'])
+    assert comment.language_code == 'en'
+    assert not comment.language_detection_pending
+    assert SectionComment.objects.filter(pk=comment.pk, search_vector='comment').exists()
+
+
+@pytest.mark.django_db
+def test_comment_language_backfill(default_hearing):
+    section = default_hearing.get_main_section()
+    comment = section.comments.create(content='Tämä on kommentti')
+    SectionComment.objects.filter(pk=comment.pk).update(language_code='')
+    undetectable = section.comments.create(content='10.24')
+
+    call_command('democracy_detect_comment_languages', backfill=True, batch_size=2, stdout=StringIO())
+    assert SectionComment.objects.get(pk=comment.pk).language_code == 'fi'
+    assert SectionComment.objects.get(pk=undetectable.pk).language_code == ''
+
+
 @pytest.mark.django_db
 def test_56_add_comment_to_section_test_geojson(john_doe_api_client, default_hearing, get_comments_url_and_data):
     section = default_hearing.sections.first()
@@ -609,6 +647,45 @@ def test_n_comments_updates(admin_user, default_hearing):
     assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 10
     comment.soft_delete()
     assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 9
+    comment.undelete()
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 10
+    # saving an undeleted comment again does not count it twice
+    SectionComment.objects.get(pk=comment.pk).save()
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 10
+
+
+@pytest.mark.django_db
+def test_n_comments_follow_moved_comment(default_hearing):
+    main_section = default_hearing.get_main_section()
+    other_section = default_hearing.sections.exclude(pk=main_section.pk).first()
+    comment = SectionComment.objects.get(pk=main_section.comments.first().pk)
+    comment.section = other_section
+    comment.save()
+    assert Section.objects.get(pk=main_section.pk).n_comments == 2
+    assert Section.objects.get(pk=other_section.pk).n_comments == 4
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 9
+
+
+@pytest.mark.django_db
+def test_n_comments_counter_slots(settings, admin_user, default_hearing, api_client):
+    settings.DEMOCRACY_COMMENT_COUNTER_SLOTS = 4
+    main_section = default_hearing.get_main_section()
+    for i in range(5):
+        main_section.comments.create(created_by=admin_user, content="Hello %d" % i)
+    main_section.comments.first().soft_delete()
+
+    # the counter columns are untouched until the slots are flushed, but reads include the slots
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 9
+    assert Hearing.objects.get(pk=default_hearing.pk).get_n_comments() == 13
+    assert Section.objects.get(pk=main_section.pk).get_n_comments() == 7
+    data = get_data_from_response(api_client.get(get_hearing_detail_url(default_hearing.id)))
+    assert data['n_comments'] == 13
+
+    assert 1 <= flush_comment_counter_slots() <= 4
+    assert not CommentCounterSlot.objects.exists()
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 13
+    assert Section.objects.get(pk=main_section.pk).n_comments == 7
+    assert Hearing.objects.get(pk=default_hearing.pk).get_n_comments() == 13
 
 
 @pytest.mark.django_db
@@ -970,3 +1047,260 @@ def test_comment_ordering(api_client, ordering, expected_order, default_hearing)
 
     n_votes_list = [comment['n_votes'] for comment in results]
     assert n_votes_list == expected_order
+
+
+@pytest.mark.parametrize('ordering', ['created_at', '-created_at', 'n_votes', '-n_votes'])
+@pytest.mark.django_db
+def test_comment_keyset_pagination(api_client, ordering, default_hearing):
+    SectionComment.objects.all().delete()
+    section = default_hearing.get_main_section()
+    for i in range(7):
+        comment = SectionCommentFactory(section=section)
+        # duplicate vote counts make the pk tiebreaker matter
+        SectionComment.objects.filter(id=comment.id).update(n_votes=i % 3)
+
+    expected_ids = [
+        comment['id'] for comment in
+        get_data_from_response(api_client.get(root_list_url, {'ordering': ordering, 'limit': 10}))['results']
+    ]
+    ids = []
+    url = '%s?ordering=%s&limit=3&cursor=' % (root_list_url, ordering)
+    while url:
+        data = get_data_from_response(api_client.get(url))
+        assert 'count' not in data
+        ids += [comment['id'] for comment in data['results']]
+        url = data['next']
+
+    assert len(ids) == 7
+    if ordering.lstrip('-') == 'n_votes':
+        # limit/offset pagination does not order ties by pk, so compare the vote counts only
+        n_votes = dict(SectionComment.objects.values_list('id', 'n_votes'))
+        assert [n_votes[id] for id in ids] == [n_votes[id] for id in expected_ids]
+    else:
+        assert ids == expected_ids
+
+
+@pytest.mark.django_db
+def test_comment_keyset_pagination_invalid_cursor(api_client, default_hearing):
+    response = api_client.get(get_main_comments_url(default_hearing), {'cursor': 'not-a-cursor'})
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_comment_change_feed(api_client, default_hearing):
+    url = root_list_url + 'changes/'
+    section = default_hearing.get_main_section()
+    removed = section.comments.create(content='Removed')
+    removed.soft_delete()
+    unpublished = section.comments.create(content='Unpublished', published=False)
+
+    data = get_data_from_response(api_client.get(url, {'limit': 1000}))
+    assert data['next'] is None
+    results = {comment['id']: comment for comment in data['results']}
+    assert set(results) == set(SectionComment.objects.everything().filter(
+        section__hearing=default_hearing
+    ).values_list('pk', flat=True))
+    assert results[removed.pk] == {'id': removed.pk, 'section': section.pk, 'hearing': default_hearing.pk,
+                                   'deleted': True}
+    assert results[unpublished.pk]['deleted'] is True
+    live = [comment for comment in data['results'] if not comment['deleted']]
+    assert live and all('content' in comment for comment in live)
+
+    # only the changes after the cursor are listed
+    cursor = data['cursor']
+    assert get_data_from_response(api_client.get(url, {'cursor': cursor}))['results'] == []
+    added = section.comments.create(content='Added')
+    data = get_data_from_response(api_client.get(url, {'cursor': cursor}))
+    assert [comment['id'] for comment in data['results']] == [added.pk]
+    assert data['cursor'] != cursor
+
+
+@pytest.mark.django_db
+def test_comment_change_feed_modified_since(api_client, default_hearing):
+    url = root_list_url + 'changes/'
+    section = default_hearing.get_main_section()
+    SectionComment.objects.everything().update(modified_at=now() - datetime.timedelta(days=2))
+    recent = section.comments.create(content='Recent')
+
+    modified_since = (now() - datetime.timedelta(days=1)).isoformat()
+    data = get_data_from_response(api_client.get(url, {'modified_since': modified_since}))
+    assert [comment['id'] for comment in data['results']] == [recent.pk]
+    assert api_client.get(url, {'modified_since': 'yesterday'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_comment_list_count_from_counter(api_client, default_hearing):
+    section = default_hearing.get_main_section()
+    data = get_data_from_response(api_client.get(root_list_url, {'section': section.id, 'limit': 2}))
+    assert data['count_strategy'] == 'counter'
+    assert data['count'] == section.comments.count() == 3
+    assert data['next']
+
+    data = get_data_from_response(api_client.get(root_list_url, {'hearing': default_hearing.id}))
+    assert data['count_strategy'] == 'counter'
+    assert data['count'] == 9
+
+    data = get_data_from_response(api_client.get(get_main_comments_url(default_hearing), {'limit': 5}))
+    assert data['count_strategy'] == 'counter'
+    assert data['count'] == 3
+    assert data['next'] is None
+
+
+@pytest.mark.django_db
+def test_comment_list_count_estimate(api_client, default_hearing, settings):
+    settings.DEMOCRACY_PAGINATION_ESTIMATE_THRESHOLD = 0
+    data = get_data_from_response(api_client.get(root_list_url, {'limit': 20}))
+    assert data['count_strategy'] == 'estimate'
+    # the estimate may be off, but the results and links must not depend on it
+    assert len(data['results']) == 9
+    assert data['next'] is None
+
+
+@pytest.mark.django_db
+def test_comment_list_count_cache(api_client, default_hearing, settings):
+    settings.DEMOCRACY_PAGINATION_COUNT_CACHE = 'default'
+    settings.DEMOCRACY_PAGINATION_ESTIMATE_THRESHOLD = None
+    caches['default'].clear()
+    url = root_list_url + '?authorization_code=&limit=1'
+    data = get_data_from_response(api_client.get(url))
+    assert data['count_strategy'] == 'exact'
+    assert get_data_from_response(api_client.get(url))['count_strategy'] == 'cached'
+
+
+@pytest.mark.django_db
+def test_comment_search_with_facets(api_client, default_hearing, default_label):
+    sections = [
+        default_hearing.get_main_section(),
+        default_hearing.sections.exclude(type__identifier=InitialSectionType.MAIN).first(),
+    ]
+    titled = sections[0].comments.create(
+        title='Noise', content='Too much noise at night', language_code='en', label=default_label
+    )
+    other = sections[1].comments.create(content='The new noise barriers look fine', language_code='en')
+    sections[1].comments.create(content='Melu on liian kova', language_code='fi')
+
+    data = get_data_from_response(api_client.get(root_list_url, {'hearing': default_hearing.id, 'q': 'noise'}))
+    # title matches rank above content matches
+    assert [comment['id'] for comment in data['results']] == [titled.id, other.id]
+    assert data['facets'] == {
+        'label': {str(default_label.pk): 1},
+        'section': {sections[0].id: 1, sections[1].id: 1},
+        'language_code': {'en': 2},
+    }
+
+    data = get_data_from_response(api_client.get(get_main_comments_url(default_hearing), {'q': 'noise'}))
+    assert [comment['id'] for comment in data['results']] == [titled.id]
+    assert data['facets']['section'] == {sections[0].id: 1}
+
+
+@pytest.mark.django_db
+def test_comment_geojson_is_streamed(api_client, default_hearing, geojson_feature, monkeypatch):
+    monkeypatch.setattr(SectionCommentViewSet, 'geojson_chunk_size', 2)
+    section = default_hearing.get_main_section()
+    comment = section.comments.create(content='Located', geojson=geojson_feature)
+
+    response = api_client.get(get_main_comments_url(default_hearing), {'format': 'geojson'})
+    assert response.streaming
+    data = get_data_from_response(response)
+    assert data['type'] == 'FeatureCollection'
+    assert len(data['features']) == 4
+    feature = [feature for feature in data['features'] if feature['id'] == comment.id][0]
+    assert feature['geometry'] == geojson_feature['geometry']
+    assert feature['properties']['content'] == 'Located'
+
+    data = get_data_from_response(api_client.get(root_list_url, {'format': 'geojson', 'limit': 3}))
+    assert data['count'] == 10
+    assert data['next']
+    assert len(data['features']) == 3
+
+
+@pytest.mark.django_db
+def test_bulk_create_comments(john_doe_api_client, default_hearing, default_label, geojson_feature):
+    section = default_hearing.get_main_section()
+    poll = SectionPollFactory(section=section, option_count=2)
+    option = poll.options.first()
+    data = [
+        {'content': 'First', 'label': {'id': default_label.pk}, 'geojson': geojson_feature},
+        {'content': ''},
+        {'content': 'Second', 'answers': [{'question': poll.pk, 'type': poll.type, 'answers': [option.pk]}]},
+        {'content': 'Third', 'answers': [{'question': poll.pk, 'type': poll.type, 'answers': [0]}]},
+    ]
+    response = john_doe_api_client.post(get_main_comments_url(default_hearing) + 'bulk/', data=data, format='json')
+    data = get_data_from_response(response, 201)
+
+    assert [created['index'] for created in data['created']] == [0, 2]
+    assert [created['comment']['content'] for created in data['created']] == ['First', 'Second']
+    assert data['created'][0]['comment']['label']['id'] == default_label.pk
+    assert data['created'][1]['comment']['answers'] == [{'question': poll.pk, 'type': poll.type, 'answers': [option.pk]}]
+    assert [error['index'] for error in data['errors']] == [1, 3]
+    assert 'option' in data['errors'][1]['errors']
+
+    comment = SectionComment.objects.get(pk=data['created'][0]['comment']['id'])
+    assert comment.created_by == john_doe_api_client.user
+    assert comment.geometry is not None
+    assert Section.objects.get(pk=section.pk).n_comments == 5
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 11
+    assert SectionPollOption.objects.get(pk=option.pk).n_answers == 1
+    assert SectionPoll.objects.get(pk=poll.pk).n_answers == 1
+
+
+@pytest.mark.django_db
+def test_bulk_create_comments_all_invalid(john_doe_api_client, default_hearing):
+    url = get_main_comments_url(default_hearing) + 'bulk/'
+    response = john_doe_api_client.post(url, data=[{'content': ''}], format='json')
+    data = get_data_from_response(response, 400)
+    assert data['created'] == []
+    assert data['errors'][0]['index'] == 0
+
+    response = john_doe_api_client.post(url, data={'content': 'Not a list'}, format='json')
+    assert response.status_code == 400
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 9
+
+
+@pytest.mark.django_db
+def test_comment_list_query_count_is_constant(john_doe, john_doe_api_client, default_hearing, default_label):
+    section = default_hearing.get_main_section()
+    polls = [SectionPollFactory(section=section, option_count=2) for i in range(2)]
+    url = get_main_comments_url(default_hearing)
+
+    def add_comments(count):
+        for i in range(count):
+            comment = section.comments.create(created_by=john_doe, content='Comment %d' % i, label=default_label)
+            for poll in polls:
+                SectionPollAnswer.objects.create(comment=comment, option=poll.options.first())
+
+    def count_list_queries():
+        with CaptureQueriesContext(connection) as context:
+            data = get_data_from_response(john_doe_api_client.get(url, {'limit': 50}))
+        return len(context.captured_queries), data
+
+    add_comments(2)
+    n_queries, data = count_list_queries()
+    add_comments(10)
+    assert count_list_queries()[0] == n_queries
+
+    answered = [comment for comment in count_list_queries()[1]['results'] if comment['answers']]
+    assert len(answered) == 12
+    assert sorted(answer['question'] for answer in answered[0]['answers']) == sorted(poll.pk for poll in polls)
+    assert answered[0]['label']['id'] == default_label.pk
+
+
+@pytest.mark.django_db
+def test_can_edit_checks_each_section_once(rf, john_doe, default_hearing):
+    sections = list(default_hearing.sections.all())
+    for section in sections:
+        for i in range(3):
+            section.comments.create(created_by=john_doe, content='Comment %d' % i)
+    request = rf.get('/')
+    request.user = john_doe
+    comments = list(SectionComment.objects.filter(created_by=john_doe))
+
+    with CaptureQueriesContext(connection) as context:
+        assert all(comment.can_edit(request) for comment in comments)
+    # a section and its hearing for each section, nothing for the comments or their authors
+    assert len(context.captured_queries) <= 2 * len(sections)
+
+    Hearing.objects.filter(pk=default_hearing.pk).update(force_closed=True)
+    request = rf.get('/')
+    request.user = john_doe
+    assert not any(comment.can_edit(request) for comment in SectionComment.objects.filter(created_by=john_doe))
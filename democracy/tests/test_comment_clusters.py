@@ -0,0 +1,69 @@
+import pytest
+from django.core.cache import caches
+
+from democracy.tests.utils import get_data_from_response, get_hearing_detail_url
+
+helsinki_bbox = '24.90,60.15,24.99,60.19'
+
+
+def get_clusters_url(hearing):
+    return get_hearing_detail_url(hearing.id, 'comment_clusters')
+
+
+def add_located_comments(hearing, coordinates, label=None):
+    section = hearing.get_main_section()
+    for lon, lat in coordinates:
+        section.comments.create(
+            content='Located comment', geojson={'type': 'Point', 'coordinates': [lon, lat]}, label=label
+        )
+
+
+@pytest.mark.django_db
+def test_comment_clusters(api_client, default_hearing, default_label):
+    add_located_comments(default_hearing, [(24.9401, 60.1701), (24.9402, 60.1702)], label=default_label)
+    add_located_comments(default_hearing, [(24.9403, 60.1703)])
+    # far apart from the others
+    add_located_comments(default_hearing, [(24.91, 60.18)])
+
+    data = get_data_from_response(api_client.get(get_clusters_url(default_hearing), {
+        'bbox': helsinki_bbox, 'zoom': 12,
+    }))
+    clusters = sorted(data, key=lambda cluster: -cluster['count'])
+    assert [cluster['count'] for cluster in clusters] == [3, 1]
+    assert clusters[0]['top_label'] == default_label.pk
+    assert clusters[0]['geojson']['type'] == 'Point'
+    lon, lat = clusters[0]['geojson']['coordinates']
+    assert lon == pytest.approx(24.9402, abs=1e-6) and lat == pytest.approx(60.1702, abs=1e-6)
+
+    # at the lowest zoom level, everything is in one cluster
+    data = get_data_from_response(api_client.get(get_clusters_url(default_hearing), {
+        'bbox': helsinki_bbox, 'zoom': 0,
+    }))
+    assert [cluster['count'] for cluster in data] == [4]
+
+
+@pytest.mark.django_db
+def test_comment_clusters_cache_is_invalidated(api_client, default_hearing, settings):
+    settings.DEMOCRACY_HEARING_CACHE = 'default'
+    caches['default'].clear()
+    params = {'bbox': helsinki_bbox, 'zoom': 5}
+    add_located_comments(default_hearing, [(24.94, 60.17)])
+    data = get_data_from_response(api_client.get(get_clusters_url(default_hearing), params))
+    assert [cluster['count'] for cluster in data] == [1]
+
+    add_located_comments(default_hearing, [(24.95, 60.17)])
+    data = get_data_from_response(api_client.get(get_clusters_url(default_hearing), params))
+    assert [cluster['count'] for cluster in data] == [2]
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'bbox': helsinki_bbox},
+    {'bbox': 'foo', 'zoom': 5},
+    {'bbox': helsinki_bbox, 'zoom': 23},
+    {'bbox': '-180,-85,180,85', 'zoom': 10},
+])
+@pytest.mark.django_db
+def test_comment_clusters_invalid_parameters(api_client, default_hearing, params):
+    response = api_client.get(get_clusters_url(default_hearing), params)
+    assert response.status_code == 400
@@ -3,6 +3,7 @@ import pytest
 from democracy.enums import InitialSectionType, Commenting
 from democracy.models import Section, SectionComment, SectionType
 from democracy.tests.test_images import get_hearing_detail_url
+from democracy.utils.vote_buffer import flush_vote_buffer, get_vote_buffer, get_vote_buffer_stats
 
 
 default_content = 'Awesome comment to vote.'
@@ -123,3 +124,71 @@ def test_vote_appears_in_user_data(john_doe_api_client, default_hearing):
     john_doe_api_client.post(get_section_comment_vote_url(default_hearing.id, section.id, sc_comment.id))
     response = john_doe_api_client.get('/v1/users/')
     assert sc_comment.id in response.data[0]['voted_section_comments']
+
+
+@pytest.mark.django_db
+def test_voting_does_not_save_comment(monkeypatch, api_client, john_doe_api_client, default_hearing):
+    section, comment = add_default_section_and_comment(default_hearing)
+    section.voting = Commenting.OPEN
+    section.save()
+
+    def fail_save(*args, **kwargs):
+        raise AssertionError('votes must not save the comment')
+
+    monkeypatch.setattr(SectionComment, 'save', fail_save)
+    vote_url = get_section_comment_vote_url(default_hearing.id, section.id, comment.id)
+    assert john_doe_api_client.post(vote_url).status_code == 201
+    assert john_doe_api_client.post(vote_url).status_code == 304
+    assert api_client.post(vote_url).status_code == 200
+    comment = SectionComment.objects.get(id=comment.id)
+    assert comment.n_votes == 2
+    assert comment.n_unregistered_votes == 1
+    assert comment.modified_at > comment.created_at
+
+    unvote_url = get_section_comment_unvote_url(default_hearing.id, section.id, comment.id)
+    assert john_doe_api_client.post(unvote_url).status_code == 204
+    assert john_doe_api_client.post(unvote_url).status_code == 304
+    comment = SectionComment.objects.get(id=comment.id)
+    assert comment.n_votes == 1
+    assert not comment.voters.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', ['local', 'sqlite'])
+def test_anonymous_votes_are_buffered(settings, tmpdir, monkeypatch, api_client, default_hearing, backend):
+    settings.DEMOCRACY_VOTE_BUFFER = {
+        'local': {'BACKEND': 'democracy.utils.vote_buffer.LocalVoteBuffer'},
+        'sqlite': {
+            'BACKEND': 'democracy.utils.vote_buffer.SQLiteVoteBuffer',
+            'OPTIONS': {'path': str(tmpdir.join('votes.db'))},
+        },
+    }[backend]
+    settings.DEMOCRACY_VOTE_BUFFER_FLUSH_INTERVAL = 3600
+    get_vote_buffer().take()
+    section, comment = add_default_section_and_comment(default_hearing)
+    section.voting = Commenting.OPEN
+    section.save()
+    comment_url = get_hearing_detail_url(default_hearing.id, 'sections/%s/comments/%s' % (section.id, comment.id))
+
+    for i in range(3):
+        response = api_client.post(get_section_comment_vote_url(default_hearing.id, section.id, comment.id))
+        assert response.status_code == 200
+    assert SectionComment.objects.get(id=comment.id).n_votes == 0
+    assert api_client.get(comment_url).data['n_votes'] == 3
+    assert get_vote_buffer_stats()['pending_votes'] == 3
+
+    # lists look up the pending votes of all their comments at once
+    with monkeypatch.context() as m:
+        m.setattr('democracy.models.comment.get_pending_votes', lambda comment: pytest.fail('per-row lookup'))
+        comments_url = get_hearing_detail_url(default_hearing.id, 'sections/%s/comments' % section.id)
+        data = api_client.get(comments_url).data
+        assert [c['n_votes'] for c in data if c['id'] == comment.id] == [3]
+
+    assert flush_vote_buffer() == 3
+    comment = SectionComment.objects.get(id=comment.id)
+    assert comment.n_votes == 3
+    assert comment.n_unregistered_votes == 3
+    assert api_client.get(comment_url).data['n_votes'] == 3
+    stats = get_vote_buffer_stats()
+    assert stats['pending_votes'] == 0
+    assert stats['last_flush_votes'] == 3
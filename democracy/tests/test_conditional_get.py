@@ -0,0 +1,87 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from democracy.enums import Commenting
+from democracy.tests.test_comment_vote import get_section_comment_vote_url
+from democracy.tests.utils import get_hearing_detail_url
+
+
+def get_comments_url(hearing, section):
+    return get_hearing_detail_url(hearing.id, 'sections/%s/comments' % section.id)
+
+
+@pytest.mark.django_db
+def test_hearing_detail_not_modified(api_client, default_hearing):
+    response = api_client.get(get_hearing_detail_url(default_hearing.id))
+    assert response.status_code == 200
+    assert response['Last-Modified']
+
+    response = api_client.get(get_hearing_detail_url(default_hearing.id), HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+    assert not response.content
+
+
+@pytest.mark.django_db
+def test_hearing_detail_etag_follows_section_changes(api_client, default_hearing):
+    etag = api_client.get(get_hearing_detail_url(default_hearing.id))['ETag']
+    section = default_hearing.sections.first()
+    section.title = 'Changed section title'
+    section.save()
+
+    response = api_client.get(get_hearing_detail_url(default_hearing.id), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_section_detail_not_modified(api_client, default_hearing):
+    section = default_hearing.sections.first()
+    url = get_hearing_detail_url(default_hearing.id, 'sections/%s' % section.id)
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    default_hearing.labels.create(label='New label')
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_comment_list_etag_follows_votes(api_client, default_hearing):
+    section = default_hearing.sections.first()
+    section.voting = Commenting.OPEN
+    section.save()
+    comment = section.comments.first()
+    url = get_comments_url(default_hearing, section)
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    response = api_client.post(get_section_comment_vote_url(default_hearing.id, section.id, comment.id))
+    assert response.status_code == 200
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_comment_list_etag_follows_edits(api_client, default_hearing):
+    section = default_hearing.sections.first()
+    url = get_comments_url(default_hearing, section)
+    etag = api_client.get(url)['ETag']
+
+    comment = section.comments.first()
+    comment.content = 'Edited comment'
+    comment.save()
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_comment_list_not_modified_without_comment_queries(api_client, default_hearing):
+    section = default_hearing.sections.first()
+    url = get_comments_url(default_hearing, section)
+    etag = api_client.get(url)['ETag']
+
+    with CaptureQueriesContext(connection) as context:
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert not [query for query in context.captured_queries if 'democracy_sectioncomment' in query['sql']]
@@ -0,0 +1,74 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from democracy.factories.poll import SectionPollFactory
+from democracy.models import Hearing, Section, SectionComment, SectionPoll, SectionPollAnswer, SectionPollOption
+
+
+def get_drift_report(output):
+    return dict(line.split(': ', 1) for line in output.splitlines())
+
+
+def get_counters(hearing, section, comment, poll, option):
+    return (
+        Hearing.objects.get(pk=hearing.pk).n_comments,
+        Section.objects.get(pk=section.pk).n_comments,
+        SectionComment.objects.get(pk=comment.pk).n_votes,
+        SectionPoll.objects.get(pk=poll.pk).n_answers,
+        SectionPollOption.objects.get(pk=option.pk).n_answers,
+    )
+
+
+@pytest.mark.django_db
+def test_reconcile_counters(john_doe, default_hearing):
+    section = default_hearing.get_main_section()
+    comment = section.comments.first()
+    comment.add_vote(john_doe)
+    poll = SectionPollFactory(section=section, option_count=2)
+    option = poll.options.first()
+    SectionPollAnswer.objects.create(comment=comment, option=option)
+    correct = get_counters(default_hearing, section, comment, poll, option)
+    assert correct == (9, 3, 1, 1, 1)
+
+    # simulate drift, no signals are sent for queryset updates
+    Hearing.objects.filter(pk=default_hearing.pk).update(n_comments=100)
+    Section.objects.filter(pk=section.pk).update(n_comments=0)
+    SectionComment.objects.filter(pk=comment.pk).update(n_votes=5)
+    SectionPoll.objects.filter(pk=poll.pk).update(n_answers=3)
+    SectionPollOption.objects.filter(pk=option.pk).update(n_answers=0)
+
+    out = StringIO()
+    call_command('democracy_reconcile_counters', dry_run=True, stdout=out)
+    report = get_drift_report(out.getvalue())
+    assert report['hearing comments'].endswith('drifted 1 by 91 in total, fixed 0')
+    assert report['section comments'] == 'checked %d, drifted 1 by 3 in total, fixed 0' % (
+        Section.objects.everything().count()
+    )
+    assert report['poll answers'].endswith('drifted 1 by 2 in total, fixed 0')
+    assert get_counters(default_hearing, section, comment, poll, option) == (100, 0, 5, 3, 0)
+
+    out = StringIO()
+    call_command('democracy_reconcile_counters', batch_size=2, stdout=out)
+    report = get_drift_report(out.getvalue())
+    assert report['comment votes'] == 'checked %d, drifted 1 by 4 in total, fixed 1' % (
+        SectionComment.objects.everything().count()
+    )
+    assert report['poll option answers'].endswith('drifted 1 by 1 in total, fixed 1')
+    assert get_counters(default_hearing, section, comment, poll, option) == correct
+
+
+@pytest.mark.django_db
+def test_reconcile_counters_keeps_pending_slots(settings, admin_user, default_hearing):
+    settings.DEMOCRACY_COMMENT_COUNTER_SLOTS = 2
+    section = default_hearing.get_main_section()
+    section.comments.create(created_by=admin_user, content='Hello')
+    Section.objects.filter(pk=section.pk).update(n_comments=0)
+
+    call_command('democracy_reconcile_counters', dry_run=True, stdout=StringIO())
+    assert Section.objects.get(pk=section.pk).get_n_comments() == 1
+
+    call_command('democracy_reconcile_counters', stdout=StringIO())
+    assert Section.objects.get(pk=section.pk).n_comments == 4
+    assert Hearing.objects.get(pk=default_hearing.pk).n_comments == 10
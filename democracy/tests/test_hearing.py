@@ -1,16 +1,23 @@
+import csv
 import datetime
+import io
 import json
+import math
 
 import pytest
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management import call_command
 from django.utils.encoding import force_text
 from django.utils.timezone import now
 
 from democracy.enums import InitialSectionType
 from democracy.factories.organization import OrganizationFactory
 from democracy.models import (
-    Hearing, Label, Organization, Project, ProjectPhase, Section, SectionComment, SectionImage, SectionType
+    Hearing, Label, Organization, Project, ProjectPhase, Section, SectionComment, SectionImage, SectionType,
+    StoredHearingReport
 )
 from democracy.models.utils import copy_hearing
+from democracy.utils import geo
 from democracy.tests.utils import (
     assert_common_keys_equal, assert_datetime_fuzzy_equal, get_data_from_response,
     get_hearing_detail_url, sectionimage_test_json
@@ -365,6 +372,55 @@ def test_get_next_closing_and_open_hearings(api_client):
     assert data['results'][1]['title'][default_lang_code].startswith('Gone')
 
 
+@pytest.mark.django_db
+def test_filter_hearings_by_status(api_client):
+    create_hearings(0)  # Clear out old hearings
+    closed = Hearing.objects.create(title='Closed', close_at=now() - datetime.timedelta(days=1))
+    force_closed = Hearing.objects.create(
+        title='Force closed', open_at=now() - datetime.timedelta(days=1), close_at=now() + datetime.timedelta(days=1),
+        force_closed=True
+    )
+    open_hearing = Hearing.objects.create(
+        title='Open', open_at=now() - datetime.timedelta(days=1), close_at=now() + datetime.timedelta(days=1)
+    )
+    upcoming = Hearing.objects.create(
+        title='Upcoming', open_at=now() + datetime.timedelta(days=1), close_at=now() + datetime.timedelta(days=2)
+    )
+
+    for status, expected in (
+        ('closed', {closed, force_closed}),
+        ('open', {open_hearing}),
+        ('upcoming', {upcoming}),
+    ):
+        assert {hearing.status for hearing in expected} == {status}
+        assert set(Hearing.objects.filter_by_status(status)) == expected
+
+    # upcoming hearings are only visible to admins, so check the filter on the visible ones
+    data = get_data_from_response(api_client.get(list_endpoint, {'status': 'closed'}))
+    assert {hearing['id'] for hearing in data['results']} == {closed.id, force_closed.id}
+    data = get_data_from_response(api_client.get(list_endpoint, {'status': 'open'}))
+    assert [hearing['id'] for hearing in data['results']] == [open_hearing.id]
+
+
+@pytest.mark.django_db
+def test_search_hearings(api_client, default_hearing):
+    other = Hearing.objects.create(title='Bicycle parking', close_at=now() + datetime.timedelta(days=1))
+    section = default_hearing.get_main_section()
+    section.content = '<p>New bicycle lanes along the shore</p>'
+    section.save()
+
+    data = get_data_from_response(api_client.get(list_endpoint, {'search': 'bicycle'}))
+    # title matches rank above section content matches
+    assert [hearing['id'] for hearing in data['results']] == [other.id, default_hearing.id]
+
+    data = get_data_from_response(api_client.get(list_endpoint, {'search': 'lanes'}))
+    assert [hearing['id'] for hearing in data['results']] == [default_hearing.id]
+
+    section.soft_delete()
+    data = get_data_from_response(api_client.get(list_endpoint, {'search': 'lanes'}))
+    assert data['results'] == []
+
+
 @pytest.mark.django_db
 def test_8_get_detail_check_properties(api_client, default_hearing):
     response = api_client.get(get_hearing_detail_url(default_hearing.id))
@@ -497,7 +553,63 @@ def test_7_get_detail_servicemap(api_client):
 def test_24_get_report(api_client, default_hearing):
     response = api_client.get('%s%s/report/' % (endpoint, default_hearing.id))
     assert response.status_code == 200
-    assert len(response.content) > 0
+    # the report is streamed from a temporary file
+    assert len(b''.join(response.streaming_content)) > 0
+
+
+@pytest.mark.django_db
+def test_large_hearing_report_is_generated_in_background(api_client, default_hearing, settings):
+    settings.DEMOCRACY_BACKGROUND_REPORT_THRESHOLD = 1
+    url = '%s%s/report/' % (endpoint, default_hearing.id)
+
+    response = api_client.get(url)
+    assert response.status_code == 202
+    assert api_client.get(url).status_code == 202
+    assert StoredHearingReport.objects.filter(hearing=default_hearing).count() == 1
+
+    call_command('democracy_generate_hearing_reports', stdout=io.StringIO())
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content).startswith(b'PK')
+
+    # a new comment changes the report
+    default_hearing.get_main_section().comments.create(content='Late comment')
+    assert api_client.get(url).status_code == 202
+    call_command('democracy_generate_hearing_reports', stdout=io.StringIO())
+    assert api_client.get(url).status_code == 200
+    assert StoredHearingReport.objects.filter(hearing=default_hearing).count() == 1
+
+    # and so does an edited one
+    comment = default_hearing.get_main_section().comments.first()
+    comment.content = 'Edited comment'
+    comment.save()
+    assert api_client.get(url).status_code == 202
+
+
+@pytest.mark.django_db
+def test_export_comments(api_client, default_hearing, default_label):
+    section = default_hearing.get_main_section()
+    labeled = section.comments.create(content='Labeled', label=default_label, author_name='Analyst')
+    section.comments.create(content='Unpublished', published=False)
+    expected_ids = set(SectionComment.objects.public().filter(section__hearing=default_hearing).values_list(
+        'pk', flat=True
+    ))
+
+    response = api_client.get('%s%s/comments.ndjson' % (endpoint, default_hearing.id))
+    assert response.status_code == 200
+    assert response.streaming
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+    assert {row['id'] for row in rows} == expected_ids
+    row = next(row for row in rows if row['id'] == labeled.pk)
+    assert row['author_name'] == 'Analyst'
+    assert row['label']['id'] == default_label.pk
+    assert row['answers'] == [] and row['images'] == []
+
+    response = api_client.get('%s%s/comments.csv' % (endpoint, default_hearing.slug))
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+    assert {int(row['id']) for row in rows} == expected_ids
+    assert next(row for row in rows if int(row['id']) == labeled.pk)['content'] == 'Labeled'
 
 
 @pytest.mark.django_db
@@ -665,6 +777,57 @@ def test_hearing_geojson_unsupported_types(request, john_smith_api_client, valid
     assert data['geojson'][0].startswith('Invalid geojson format. Type is not supported.')
 
 
+@pytest.fixture()
+def geojson_polygon_heavy():
+    # a polygon of 5000 vertices around central Helsinki
+    n = 5000
+    ring = [
+        [24.94 + 0.01 * math.cos(2 * math.pi * i / n), 60.17 + 0.005 * math.sin(2 * math.pi * i / n)]
+        for i in range(n)
+    ]
+    return {'type': 'Polygon', 'coordinates': [ring + ring[:1]]}
+
+
+@pytest.fixture()
+def count_geojson_parses(monkeypatch):
+    parses = []
+
+    def counting_geos_geometry(*args, **kwargs):
+        parses.append(args)
+        return GEOSGeometry(*args, **kwargs)
+
+    monkeypatch.setattr(geo, 'GEOSGeometry', counting_geos_geometry)
+    return parses
+
+
+@pytest.mark.django_db
+def test_hearing_geojson_is_parsed_once(john_smith_api_client, valid_hearing_json, geojson_polygon_heavy,
+                                        count_geojson_parses):
+    valid_hearing_json['geojson'] = geojson_polygon_heavy
+    response = john_smith_api_client.post(endpoint, data=valid_hearing_json, format='json')
+    hearing_data = get_data_from_response(response, status_code=201)
+    assert len(count_geojson_parses) == 1
+    assert Hearing.objects.get(pk=hearing_data['id']).geometry.num_points == 5001
+
+
+@pytest.mark.django_db
+def test_hearing_counter_save_skips_geometry(default_hearing, geojson_polygon_heavy, count_geojson_parses):
+    default_hearing.geojson = geojson_polygon_heavy
+    default_hearing.save()
+    assert len(count_geojson_parses) == 1
+
+    default_hearing.n_comments += 1
+    default_hearing.save(update_fields=('n_comments',))
+    default_hearing.recache_n_comments()
+    assert len(count_geojson_parses) == 1
+
+    # updating the area alone updates the geometry as well
+    default_hearing.geojson = {'type': 'Point', 'coordinates': [24.94, 60.17]}
+    default_hearing.save(update_fields=('geojson',))
+    default_hearing.refresh_from_db()
+    assert default_hearing.geometry.geom_type == 'Point'
+
+
 @pytest.mark.django_db
 def test_hearing_bbox_filtering(
         request, api_client, random_hearing, geojson_feature,
@@ -0,0 +1,59 @@
+import pytest
+from django.core.cache import caches
+
+from democracy.enums import Commenting
+from democracy.models import Hearing, Section
+from democracy.tests.utils import get_data_from_response
+
+
+def get_detail_url(hearing):
+    return '/v1/hearing/%s/' % hearing.pk
+
+
+@pytest.fixture()
+def hearing_cache(settings):
+    settings.DEMOCRACY_HEARING_CACHE = 'default'
+    cache = caches['default']
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_hearing_detail_is_served_from_cache(api_client, default_hearing, hearing_cache):
+    data = get_data_from_response(api_client.get(get_detail_url(default_hearing)))
+    # bypass the signals, so the cached representation stays current
+    Hearing.objects.filter(pk=default_hearing.pk).update(servicemap_url='http://example.com/changed')
+
+    cached_data = get_data_from_response(api_client.get(get_detail_url(default_hearing)))
+    assert cached_data == data
+
+
+@pytest.mark.django_db
+def test_hearing_detail_cache_follows_section_changes(api_client, default_hearing, hearing_cache):
+    get_data_from_response(api_client.get(get_detail_url(default_hearing)))
+    section = default_hearing.sections.first()
+    section.title = 'Changed section title'
+    section.save()
+
+    data = get_data_from_response(api_client.get(get_detail_url(default_hearing)))
+    section_data = next(s for s in data['sections'] if s['id'] == section.pk)
+    assert section_data['title'] == {'en': 'Changed section title'}
+
+
+@pytest.mark.django_db
+def test_hearing_detail_cache_follows_label_changes(api_client, default_hearing, default_label, hearing_cache):
+    get_data_from_response(api_client.get(get_detail_url(default_hearing)))
+    default_hearing.labels.add(default_label)
+
+    data = get_data_from_response(api_client.get(get_detail_url(default_hearing)))
+    assert [label['id'] for label in data['labels']] == [default_label.pk]
+
+
+@pytest.mark.django_db
+def test_hearing_detail_cache_is_bypassed_for_admins(admin_api_client, default_hearing, hearing_cache):
+    get_data_from_response(admin_api_client.get(get_detail_url(default_hearing)))
+    Section.objects.filter(hearing=default_hearing).update(commenting=Commenting.REGISTERED)
+
+    data = get_data_from_response(admin_api_client.get(get_detail_url(default_hearing)))
+    assert all(section['commenting'] == 'registered' for section in data['sections'])
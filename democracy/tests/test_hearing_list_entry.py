@@ -0,0 +1,114 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from democracy.enums import InitialSectionType
+from democracy.models import Hearing, HearingListEntry, Label
+from democracy.models.hearing_list import refresh_hearing_list_entry
+from democracy.tests.utils import get_data_from_response
+
+list_endpoint = '/v1/hearing/'
+
+
+@pytest.mark.django_db
+def test_list_entry_is_created_with_hearing():
+    hearing = Hearing.objects.create(title='Projected hearing', borough='Kallio')
+    entry = HearingListEntry.objects.get(hearing=hearing)
+    assert entry.title == {'en': 'Projected hearing'}
+    assert entry.borough == {'en': 'Kallio'}
+    assert entry.abstract == ''
+    assert entry.main_image is None
+
+
+@pytest.mark.django_db
+def test_list_entry_follows_main_section(default_hearing):
+    main_section = default_hearing.get_main_section()
+    main_section.abstract = 'Updated abstract'
+    main_section.save()
+    default_hearing.refresh_from_db()
+
+    entry = HearingListEntry.objects.get(hearing=default_hearing)
+    assert entry.abstract == {'en': 'Updated abstract'}
+    assert entry.main_image['id'] == main_section.images.first().pk
+
+
+@pytest.mark.django_db
+def test_list_entry_follows_labels(default_hearing, default_label):
+    default_hearing.labels.add(default_label)
+    default_label.label = 'Renamed label'
+    default_label.save()
+
+    entry = HearingListEntry.objects.get(hearing=default_hearing)
+    assert entry.labels == [{'id': default_label.pk, 'label': {'en': 'Renamed label'}}]
+
+
+@pytest.mark.django_db
+def test_list_entry_follows_reverse_label_clear(default_hearing, default_label):
+    default_hearing.labels.add(default_label)
+    default_label.hearing_set.clear()
+
+    entry = HearingListEntry.objects.get(hearing=default_hearing)
+    assert entry.labels == []
+
+
+@pytest.mark.django_db
+def test_list_entry_follows_organization_and_project(default_hearing, default_organization, default_project):
+    default_organization.name = 'The department for hedgehog welfare'
+    default_organization.save()
+    phase = default_project.phases.last()
+    phase.title = 'Renamed phase'
+    phase.save()
+
+    entry = HearingListEntry.objects.get(hearing=default_hearing)
+    assert entry.organization == 'The department for hedgehog welfare'
+    assert entry.project['phases'][-1]['title'] == {'en': 'Renamed phase'}
+
+
+@pytest.mark.django_db
+def test_comment_count_is_listed_from_hearing(api_client, default_hearing):
+    section = default_hearing.sections.exclude(type__identifier=InitialSectionType.MAIN).first()
+    tree_modified_at = Hearing.objects.get(pk=default_hearing.pk).tree_modified_at
+    with CaptureQueriesContext(connection) as context:
+        section.comments.create(content='Yet another comment')
+
+    # the count and the tree modification time change in a single update, the list entry not at all
+    queries = [query['sql'] for query in context.captured_queries]
+    assert len([sql for sql in queries if sql.startswith('UPDATE "democracy_hearing" ')]) == 1
+    assert not [sql for sql in queries if 'democracy_hearinglistentry' in sql]
+    assert Hearing.objects.get(pk=default_hearing.pk).tree_modified_at > tree_modified_at
+    data = get_data_from_response(api_client.get(list_endpoint))
+    assert data['results'][0]['n_comments'] == 10
+
+
+@pytest.mark.django_db
+def test_list_from_entries_matches_computed_list(api_client, default_hearing, default_label):
+    Hearing.objects.filter(pk=default_hearing.pk).first().labels.add(default_label)
+    Label.objects.create(label='Unused label')
+    refresh_hearing_list_entry(default_hearing.pk)
+
+    projected_data = get_data_from_response(api_client.get(list_endpoint))
+    HearingListEntry.objects.all().delete()
+    computed_data = get_data_from_response(api_client.get(list_endpoint))
+
+    assert projected_data['count'] == 1
+    assert projected_data == computed_data
+
+
+@pytest.mark.django_db
+def test_list_queries_do_not_grow_with_hearings(api_client, default_hearing, default_organization):
+    with CaptureQueriesContext(connection) as context:
+        api_client.get(list_endpoint)
+    n_queries = len(context.captured_queries)
+
+    for x in range(3):
+        Hearing.objects.create(
+            title='Another hearing %d' % x,
+            open_at=default_hearing.open_at,
+            close_at=default_hearing.close_at,
+            organization=default_organization,
+            project_phase=default_hearing.project_phase,
+        )
+    with CaptureQueriesContext(connection) as context:
+        data = get_data_from_response(api_client.get(list_endpoint))
+    assert data['count'] == 4
+    assert len(context.captured_queries) == n_queries
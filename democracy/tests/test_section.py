@@ -408,3 +408,16 @@ def test_hearing_visibility(john_smith_api_client, default_hearing):
     response = john_smith_api_client.get('/v1/section/')
     response_data = get_results_from_response(response)
     assert len(response_data) > 1
+
+
+@pytest.mark.django_db
+def test_search_sections(api_client, default_hearing):
+    sections = list(default_hearing.sections.all())
+    sections[1].title = 'Tram stops'
+    sections[1].save()
+    sections[2].abstract = 'Moving the tram depot'
+    sections[2].save()
+
+    response = api_client.get('/v1/section/', {'search': 'tram'})
+    response_data = get_results_from_response(response)
+    assert [section['id'] for section in response_data] == [sections[1].id, sections[2].id]
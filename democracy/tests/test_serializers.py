@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from democracy.views.section import SectionSerializer
 from democracy.enums import InitialSectionType
-from democracy.models import SectionType
+from democracy.models import Section, SectionPoll, SectionType
+from democracy.tests.utils import create_default_images
 
 
 @pytest.mark.django_db
@@ -12,3 +15,69 @@ def test_section_serializer(random_hearing):
     section.type = SectionType.objects.get(identifier=InitialSectionType.PART)
     data = SectionSerializer(instance=section).data
     assert data["type"] == InitialSectionType.PART
+
+
+def get_query_counts(api_client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(url)
+    assert response.status_code == 200
+    queries = context.captured_queries
+    return len(queries), len([query for query in queries if '_translation' in query['sql']])
+
+
+def add_section_with_images_and_poll(hearing, title):
+    section = Section.objects.create(
+        hearing=hearing, type=SectionType.objects.get(identifier=InitialSectionType.PART), title=title
+    )
+    create_default_images(section)
+    poll = SectionPoll.objects.create(section=section, type=SectionPoll.TYPE_SINGLE_CHOICE, text='Question')
+    for x in range(1, 4):
+        poll.options.create(text='Option %d' % x)
+    return section
+
+
+@pytest.mark.django_db
+def test_hearing_translation_queries_do_not_depend_on_section_count(api_client, default_hearing):
+    section_type = SectionType.objects.get(identifier=InitialSectionType.PART)
+    Section.objects.create(hearing=default_hearing, type=section_type, title='Section 1')
+    query_count, translation_query_count = get_query_counts(api_client, '/v1/hearing/%s/' % default_hearing.pk)
+
+    for x in range(2, 21):
+        Section.objects.create(hearing=default_hearing, type=section_type, title='Section %d' % x)
+    assert get_query_counts(api_client, '/v1/hearing/%s/' % default_hearing.pk)[1] == translation_query_count
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', [
+    '/v1/hearing/{hearing}/',
+    '/v1/hearing/{hearing}/sections/',
+    '/v1/section/?hearing={hearing}',
+])
+def test_section_tree_queries_do_not_depend_on_section_count(api_client, default_hearing, url):
+    url = url.format(hearing=default_hearing.pk)
+    add_section_with_images_and_poll(default_hearing, 'Section 1')
+    query_counts = get_query_counts(api_client, url)
+
+    for x in range(2, 6):
+        add_section_with_images_and_poll(default_hearing, 'Section %d' % x)
+    assert get_query_counts(api_client, url) == query_counts
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', [
+    '/v1/hearing/',
+    '/v1/hearing/{hearing}/',
+    '/v1/hearing/{hearing}/sections/',
+    '/v1/section/?hearing={hearing}',
+])
+def test_counter_slot_queries_do_not_depend_on_section_count(api_client, default_hearing, settings, url):
+    settings.DEMOCRACY_COMMENT_COUNTER_SLOTS = 4
+    url = url.format(hearing=default_hearing.pk)
+    section = add_section_with_images_and_poll(default_hearing, 'Section 1')
+    section.comments.create(content='Comment')
+    query_counts = get_query_counts(api_client, url)
+
+    for x in range(2, 6):
+        section = add_section_with_images_and_poll(default_hearing, 'Section %d' % x)
+        section.comments.create(content='Comment')
+    assert get_query_counts(api_client, url) == query_counts
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+# the tile covering central Helsinki at zoom level 10
+helsinki_tile = '10/582/296'
+
+
+def get_tile_url(layer, tile):
+    return '/v1/tiles/%s/%s.mvt' % (layer, tile)
+
+
+@pytest.fixture()
+def hearing_with_area(default_hearing, geojson_polygon):
+    default_hearing.geojson = geojson_polygon
+    default_hearing.save()
+    return default_hearing
+
+
+@pytest.mark.django_db
+def test_hearing_tile(api_client, hearing_with_area):
+    response = api_client.get(get_tile_url('hearings', helsinki_tile))
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/vnd.mapbox-vector-tile'
+    assert hearing_with_area.id.encode('utf-8') in response.content
+
+    # tiles elsewhere are empty
+    response = api_client.get(get_tile_url('hearings', '10/0/0'))
+    assert response.status_code == 200
+    assert response.content == b''
+
+
+@pytest.mark.django_db
+def test_hearing_tile_visibility(api_client, admin_api_client, hearing_with_area):
+    hearing_with_area.published = False
+    hearing_with_area.save()
+    assert api_client.get(get_tile_url('hearings', helsinki_tile)).content == b''
+    assert hearing_with_area.id.encode('utf-8') in admin_api_client.get(get_tile_url('hearings', helsinki_tile)).content
+
+
+@pytest.mark.django_db
+def test_comment_tile(api_client, default_hearing, geojson_point):
+    comment = default_hearing.get_main_section().comments.create(content='Here', geojson=geojson_point)
+    response = api_client.get(get_tile_url('comments', helsinki_tile))
+    assert response.status_code == 200
+    assert response.content
+    comment.soft_delete()
+    assert api_client.get(get_tile_url('comments', helsinki_tile)).content == b''
+
+
+@pytest.mark.parametrize('tile', ['2/4/0', '2/0/4', '23/0/0'])
+@pytest.mark.django_db
+def test_invalid_tile(api_client, tile):
+    assert api_client.get(get_tile_url('hearings', tile)).status_code == 404
+    assert api_client.get(get_tile_url('unknown', '0/0/0')).status_code == 404
+
+
+@pytest.mark.django_db
+def test_tile_cache_is_invalidated(api_client, hearing_with_area, settings, tmpdir):
+    settings.DEMOCRACY_TILE_CACHE_DIR = str(tmpdir)
+    tile_path = os.path.join(str(tmpdir), 'hearings', '10', '582', '296.mvt')
+    content = api_client.get(get_tile_url('hearings', helsinki_tile)).content
+    with open(tile_path, 'rb') as f:
+        assert f.read() == content
+
+    # comment count updates do not touch the tiles
+    hearing_with_area.save(update_fields=('n_comments',))
+    assert os.path.exists(tile_path)
+
+    hearing_with_area.geojson = None
+    hearing_with_area.save()
+    assert not os.path.exists(tile_path)
+    assert api_client.get(get_tile_url('hearings', helsinki_tile)).content == b''
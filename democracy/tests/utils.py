@@ -72,7 +72,8 @@ def get_data_from_response(response, status_code=200):
         assert response.status_code == status_code, (
             "Status code mismatch (%s is not the expected %s)" % (response.status_code, status_code)
         )
-    return json.loads(response.content.decode('utf-8'))
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    return json.loads(content.decode('utf-8'))
 
 
 def assert_datetime_fuzzy_equal(dt1, dt2, fuzziness=1):
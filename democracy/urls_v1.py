@@ -3,7 +3,7 @@ from rest_framework_nested import routers
 
 from democracy.views import (
     CommentViewSet, ContactPersonViewSet, HearingViewSet, ImageViewSet, LabelViewSet, ProjectViewSet,
-    RootSectionViewSet, SectionCommentViewSet, SectionViewSet, UserDataViewSet
+    RootSectionViewSet, SectionCommentViewSet, SectionViewSet, TileView, UserDataViewSet
 )
 
 router = routers.DefaultRouter()
@@ -25,6 +25,9 @@ section_comments_router = routers.NestedSimpleRouter(hearing_child_router, r'sec
 section_comments_router.register(r'comments', SectionCommentViewSet, base_name='comments')
 
 urlpatterns = [
+    url(r'^tiles/(?P<layer>[a-z]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.mvt$', TileView.as_view(), name='tiles'),
+    url(r'^hearing/(?P<pk>[^/.]+)/comments\.(?P<export_format>ndjson|csv)$',
+        HearingViewSet.as_view({'get': 'export_comments'}), name='hearing-comments-export'),
     url(r'^', include(router.urls, namespace='v1')),
     url(r'^', include(hearing_comments_router.urls, namespace='v1')),
     url(r'^', include(hearing_child_router.urls, namespace='v1')),
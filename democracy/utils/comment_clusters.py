@@ -0,0 +1,139 @@
+"""
+Grid clustering of located comments.
+
+Comments are clustered by snapping a point on their geometry to a Web Mercator grid whose
+cells divide the map tiles of the zoom level evenly, so that clusters never span tiles.
+Clusters are computed and cached per (hearing, zoom, tile) and requests for a bounding box
+combine the tiles covering it.
+
+Cached clusters are keyed by a per-hearing comment generation, which is bumped on every
+comment write, and by the hearing tree generation, see `democracy.utils.hearing_cache`.
+"""
+import json
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Transform
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.db.models import Func
+from django.db.models.signals import post_delete, post_save
+
+from democracy.models import Section, SectionComment
+from democracy.models.comment import comments_bulk_created
+from democracy.utils.hearing_cache import (
+    bump_hearing_generation, get_hearing_cache, get_hearing_cache_timeout, get_hearing_generation
+)
+from democracy.utils.tiles import WEB_MERCATOR_HALF_SIZE, get_tile_bounds
+
+CELLS_PER_TILE = 8
+MAX_ZOOM = 22
+# the most tiles a single request may cover
+MAX_TILES = 64
+WEB_MERCATOR_SRID = 3857
+GENERATION_SCOPE = 'comments'
+
+# comment fields that do not affect the clusters
+NON_CLUSTER_FIELDS = {'n_votes', 'n_unregistered_votes', 'modified_at', 'language_code', 'search_vector'}
+
+CLUSTER_SQL = """
+SELECT cell_x, cell_y, COUNT(*), ST_AsGeoJSON(ST_Transform(ST_Centroid(ST_Collect(point)), 4326)),
+    mode() WITHIN GROUP (ORDER BY label_id)
+FROM (
+    SELECT point, label_id,
+        floor((ST_X(point) + %%s) / %%s)::bigint AS cell_x,
+        floor((%%s - ST_Y(point)) / %%s)::bigint AS cell_y
+    FROM (%s) AS comment
+) AS cells
+WHERE cell_x >= %%s AND cell_x < %%s AND cell_y >= %%s AND cell_y < %%s
+GROUP BY cell_x, cell_y
+ORDER BY cell_x, cell_y
+"""
+
+
+def _compute_tile_clusters(queryset, z, x, y):
+    bounds = get_tile_bounds(z, x, y)
+    bbox = Polygon.from_bbox(bounds)
+    bbox.srid = WEB_MERCATOR_SRID
+    # a point on the surface lies in the tile whenever the geometry intersects it, unlike a centroid
+    point = Func(
+        Transform('geometry', WEB_MERCATOR_SRID), function='ST_PointOnSurface',
+        output_field=GeometryField(srid=WEB_MERCATOR_SRID)
+    )
+    queryset = queryset.filter(geometry__intersects=bbox).order_by().annotate(point=point).values('label_id', 'point')
+    sql, params = queryset.query.sql_with_params()
+
+    cell_size = (bounds[2] - bounds[0]) / CELLS_PER_TILE
+    first_x, first_y = x * CELLS_PER_TILE, y * CELLS_PER_TILE
+    with connection.cursor() as cursor:
+        cursor.execute(
+            CLUSTER_SQL % sql,
+            [WEB_MERCATOR_HALF_SIZE, cell_size, WEB_MERCATOR_HALF_SIZE, cell_size] + list(params) + [
+                first_x, first_x + CELLS_PER_TILE, first_y, first_y + CELLS_PER_TILE,
+            ]
+        )
+        rows = cursor.fetchall()
+    return [
+        {
+            'id': '%d/%d/%d' % (z, cell_x, cell_y),
+            'count': count,
+            'geojson': json.loads(centroid),
+            'top_label': top_label,
+        }
+        for cell_x, cell_y, count, centroid, top_label in rows
+    ]
+
+
+def get_comment_clusters(hearing, z, tiles, include_unpublished=False):
+    """
+    Get the comment clusters of a hearing in the given tiles.
+
+    :param tiles: (x, y) of the tiles at zoom level `z`
+    :param include_unpublished: Whether unpublished comments are included, these are never cached
+    :return: Clusters with their id, comment count, centroid and most common label
+    :rtype: list[dict]
+    """
+    manager = SectionComment.objects
+    queryset = (manager.with_unpublished() if include_unpublished else manager.public()).filter(
+        section__hearing=hearing, section__deleted=False, geometry__isnull=False
+    )
+    cache = get_hearing_cache() if not include_unpublished else None
+    if cache is None:
+        return [cluster for x, y in tiles for cluster in _compute_tile_clusters(queryset, z, x, y)]
+
+    key_prefix = 'democracy:hearing:%s:clusters:%s:%s:%d' % (
+        hearing.pk, get_hearing_generation(hearing.pk), get_hearing_generation(hearing.pk, GENERATION_SCOPE), z
+    )
+    keys = {'%s:%d:%d' % (key_prefix, x, y): (x, y) for x, y in tiles}
+    cached = cache.get_many(list(keys))
+    missing = {}
+    for key, (x, y) in keys.items():
+        if key not in cached:
+            missing[key] = _compute_tile_clusters(queryset, z, x, y)
+    if missing:
+        cache.set_many(missing, get_hearing_cache_timeout(hearing))
+    cached.update(missing)
+    return [cluster for key in sorted(keys, key=keys.get) for cluster in cached[key]]
+
+
+def bump_comment_generation(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= NON_CLUSTER_FIELDS:
+        return
+    hearing_ids = Section.objects.everything().filter(pk=instance.section_id).values_list('hearing_id', flat=True)
+    for hearing_id in hearing_ids:
+        bump_hearing_generation(hearing_id, GENERATION_SCOPE)
+
+
+post_save.connect(bump_comment_generation, sender=SectionComment, dispatch_uid='bump_comment_cluster_generation')
+post_delete.connect(bump_comment_generation, sender=SectionComment, dispatch_uid='bump_comment_cluster_generation')
+
+
+def bump_bulk_comment_generations(sender, instances, **kwargs):
+    section_ids = {instance.section_id for instance in instances if instance.geometry is not None}
+    hearing_ids = Section.objects.everything().filter(pk__in=section_ids).values_list('hearing_id', flat=True)
+    for hearing_id in set(hearing_ids):
+        bump_hearing_generation(hearing_id, GENERATION_SCOPE)
+
+
+comments_bulk_created.connect(
+    bump_bulk_comment_generations, sender=SectionComment, dispatch_uid='bump_bulk_comment_cluster_generations'
+)
@@ -4,9 +4,50 @@ import json
 from django.contrib.gis.geos import GEOSGeometry
 
 
+class ParsedGeoJSON(dict):
+    """
+    GeoJSON data along with the GEOS geometry parsed from it.
+
+    Serializers return validated GeoJSON as this, so that model saves can reuse the geometry
+    instead of parsing the data again.
+    """
+
+    def __init__(self, data, geometry):
+        super().__init__(data)
+        self.geometry = geometry
+
+
+def parse_geojson(geojson):
+    """
+    Parse the geometry of a GeoJSON geometry or feature.
+
+    :raises GDALException: if the data is not valid GeoJSON
+    :rtype: ParsedGeoJSON
+    """
+    geometry_data = geojson.get('geometry', None) or geojson
+    return ParsedGeoJSON(geojson, GEOSGeometry(json.dumps(geometry_data)))
+
+
 def get_geometry_from_geojson(geojson):
     if geojson is None:
         return None
-    geometry_data = geojson.get('geometry', None) or geojson
-    geometry = GEOSGeometry(json.dumps(geometry_data))
-    return geometry
+    if isinstance(geojson, ParsedGeoJSON):
+        return geojson.geometry
+    return parse_geojson(geojson).geometry
+
+
+def update_geometry(instance, update_fields=None):
+    """
+    Recompute the geometry of a model instance from its GeoJSON before saving it.
+
+    Saves whose `update_fields` do not include the GeoJSON, such as counter updates, skip
+    the geometry entirely.
+
+    :return: The update fields to save with
+    """
+    if update_fields is not None and 'geojson' not in update_fields:
+        return update_fields
+    instance.geometry = get_geometry_from_geojson(instance.geojson)
+    if update_fields is not None and 'geometry' not in update_fields:
+        update_fields = list(update_fields) + ['geometry']
+    return update_fields
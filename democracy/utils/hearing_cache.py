@@ -0,0 +1,98 @@
+"""
+Versioned cache for serialized hearings.
+
+Every hearing has a generation counter in the cache. The counter is bumped whenever anything
+in the hearing tree changes, and cached representations are keyed by the generation, so stale
+representations are never read again and simply expire.
+
+The cache is disabled unless `DEMOCRACY_HEARING_CACHE` names a cache alias. The cache must be
+shared by all processes serving the API, otherwise writes handled by one process would not
+invalidate the representations cached by the others.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.timezone import now
+
+from democracy.models.signals import get_dependent_hearing_ids, hearing_tree_changed
+
+DEFAULT_TIMEOUT = 60 * 60
+
+
+def get_hearing_cache():
+    """
+    Get the cache for hearing representations, or None if caching is disabled.
+    """
+    alias = getattr(settings, 'DEMOCRACY_HEARING_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _get_generation_key(hearing_id, scope=None):
+    if scope:
+        return 'democracy:hearing:%s:%s:generation' % (hearing_id, scope)
+    return 'democracy:hearing:%s:generation' % hearing_id
+
+
+def get_hearing_generation(hearing_id, scope=None):
+    """
+    Get the generation of the hearing tree, or of some other `scope` of data of the hearing.
+    """
+    cache = get_hearing_cache()
+    key = _get_generation_key(hearing_id, scope)
+    generation = cache.get(key)
+    if generation is None:
+        # start from the current time so that a lost counter never reuses an old generation
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_hearing_generation(hearing_id, scope=None):
+    cache = get_hearing_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(_get_generation_key(hearing_id, scope))
+    except ValueError:
+        # there is no counter, so nothing has been cached for the hearing
+        pass
+
+
+def get_hearing_cache_key(hearing, request):
+    """
+    Get the cache key for the representation of `hearing` in `request`.
+
+    The generation must be read before the hearing is serialized, so that a concurrent change
+    makes the key obsolete instead of leaving stale data under a current key.
+    """
+    variant = '%s|%s' % (request.build_absolute_uri('/'), sorted(request.query_params.lists()))
+    return 'democracy:hearing:%s:%s:%s' % (
+        hearing.pk,
+        get_hearing_generation(hearing.pk),
+        hashlib.md5(variant.encode('utf-8')).hexdigest(),
+    )
+
+
+def get_hearing_cache_timeout(hearing):
+    """
+    Get the timeout for a cached hearing representation.
+
+    The representation depends on whether the hearing is open, so it must not outlive the next
+    opening or closing time of the hearing.
+    """
+    timeout = getattr(settings, 'DEMOCRACY_HEARING_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    current_time = now()
+    for boundary in (hearing.open_at, hearing.close_at):
+        if boundary and boundary > current_time:
+            timeout = min(timeout, (boundary - current_time).total_seconds())
+    return max(int(timeout), 1)
+
+
+def bump_hearing_generations(sender, instance, hearing_ids, update_fields=None, **kwargs):
+    for hearing_id in get_dependent_hearing_ids(instance, hearing_ids, update_fields):
+        bump_hearing_generation(hearing_id)
+
+
+hearing_tree_changed.connect(bump_hearing_generations, dispatch_uid='bump_hearing_generations')
@@ -0,0 +1,47 @@
+"""
+Language detection of comment texts.
+
+Loading the langdetect language profiles is slow, so they are loaded once per process into a
+detector factory that is reused for every text.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from langdetect.detector_factory import PROFILES_DIRECTORY, DetectorFactory
+from langdetect.lang_detect_exception import LangDetectException
+
+
+@lru_cache()
+def get_detector_factory():
+    factory = DetectorFactory()
+    factory.load_profile(PROFILES_DIRECTORY)
+    return factory
+
+
+def get_detectable_languages():
+    return {lang['code'] for lang in settings.PARLER_LANGUAGES[None]}
+
+
+def detect_language(text, languages=None):
+    """
+    Detect the language of `text` among the given or the site languages.
+
+    :return: The language code, or an empty string if the language could not be detected reliably
+    :rtype: str
+    """
+    if languages is None:
+        languages = get_detectable_languages()
+    detector = get_detector_factory().create()
+    detector.append(text.lower())
+    try:
+        candidates = detector.get_probabilities()
+    except LangDetectException:
+        return ''
+    for candidate in candidates:
+        if candidate.lang in languages:
+            return candidate.lang if candidate.prob > settings.DETECT_LANGS_MIN_PROBA else ''
+    return ''
+
+
+def is_language_detection_async():
+    return getattr(settings, 'DEMOCRACY_ASYNC_LANGUAGE_DETECTION', False)
@@ -0,0 +1,157 @@
+"""
+On-disk cache for Mapbox vector tiles.
+
+Tiles are stored as `<DEMOCRACY_TILE_CACHE_DIR>/<layer>/<z>/<x>/<y>.mvt`. Any change of a
+geometry, or of the visibility of a hearing, drops the whole cached layer, since a single
+polygon may cover a huge number of tiles at high zoom levels. Hearings become visible when
+their opening time passes without any save, so cached tiles also expire after
+`DEMOCRACY_TILE_CACHE_TIMEOUT` seconds.
+
+The cache is disabled unless `DEMOCRACY_TILE_CACHE_DIR` is set. Only the tiles seen by the
+public are cached, admins always get freshly generated tiles.
+"""
+import math
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models.signals import post_save
+
+from democracy.models import Hearing, SectionComment
+from democracy.models.comment import comments_bulk_created
+
+DEFAULT_TIMEOUT = 60 * 60
+WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+WEB_MERCATOR_MAX_LATITUDE = 85.0511287798
+
+HEARING_LAYER = 'hearings'
+COMMENT_LAYER = 'comments'
+
+# fields whose changes may change what the tiles show
+HEARING_TILE_FIELDS = {'geojson', 'geometry', 'deleted', 'published', 'open_at', 'organization'}
+COMMENT_TILE_FIELDS = {'geojson', 'geometry', 'deleted', 'published', 'section', 'label'}
+
+
+def get_tile_bounds(z, x, y):
+    """
+    Get the Web Mercator bounds of a tile.
+
+    :return: xmin, ymin, xmax, ymax
+    """
+    size = 2 * WEB_MERCATOR_HALF_SIZE / 2 ** z
+    xmin = -WEB_MERCATOR_HALF_SIZE + x * size
+    ymax = WEB_MERCATOR_HALF_SIZE - y * size
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def get_tile_xy(lon, lat, z):
+    """
+    Get the x and y of the tile containing a WGS84 coordinate.
+    """
+    n = 2 ** z
+    lat = math.radians(max(min(lat, WEB_MERCATOR_MAX_LATITUDE), -WEB_MERCATOR_MAX_LATITUDE))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def get_tile_range(west, south, east, north, z):
+    """
+    Get the range of tiles that cover a WGS84 bounding box.
+
+    :return: xmin, ymin, xmax, ymax, all inclusive
+    """
+    xmin, ymin = get_tile_xy(west, north, z)
+    xmax, ymax = get_tile_xy(east, south, z)
+    return xmin, ymin, xmax, ymax
+
+
+def get_tile_cache_dir():
+    """
+    Get the tile cache directory, or None if caching is disabled.
+    """
+    return getattr(settings, 'DEMOCRACY_TILE_CACHE_DIR', None)
+
+
+def _get_tile_path(cache_dir, layer, z, x, y):
+    return os.path.join(cache_dir, layer, str(z), str(x), '%d.mvt' % y)
+
+
+def get_cached_tile(layer, z, x, y):
+    """
+    :return: The cached tile, or None if it is not cached or has expired
+    :rtype: bytes|None
+    """
+    cache_dir = get_tile_cache_dir()
+    if not cache_dir:
+        return None
+    path = _get_tile_path(cache_dir, layer, z, x, y)
+    timeout = getattr(settings, 'DEMOCRACY_TILE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    try:
+        if os.path.getmtime(path) + timeout < time.time():
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def set_cached_tile(layer, z, x, y, tile):
+    cache_dir = get_tile_cache_dir()
+    if not cache_dir:
+        return
+    path = _get_tile_path(cache_dir, layer, z, x, y)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # write to a temporary file first so that readers never see partial tiles
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(tile)
+    os.replace(temp_path, path)
+
+
+def invalidate_tile_layer(layer):
+    cache_dir = get_tile_cache_dir()
+    if not cache_dir:
+        return
+    layer_dir = os.path.join(cache_dir, layer)
+    # move the layer away first so that no tile of it is served while it is being removed
+    stale_dir = os.path.join(cache_dir, '.stale-%s-%s' % (layer, uuid.uuid4().hex))
+    try:
+        os.rename(layer_dir, stale_dir)
+    except OSError:
+        return
+    shutil.rmtree(stale_dir, ignore_errors=True)
+
+
+def invalidate_hearing_tiles(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not set(update_fields) & HEARING_TILE_FIELDS:
+        return
+    # comments are shown only if their hearing is visible
+    invalidate_tile_layer(HEARING_LAYER)
+    invalidate_tile_layer(COMMENT_LAYER)
+
+
+def invalidate_comment_tiles(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields and not set(update_fields) & COMMENT_TILE_FIELDS:
+        return
+    if created and instance.geometry is None:
+        return
+    invalidate_tile_layer(COMMENT_LAYER)
+
+
+post_save.connect(invalidate_hearing_tiles, sender=Hearing, dispatch_uid='invalidate_hearing_tiles')
+post_save.connect(invalidate_comment_tiles, sender=SectionComment, dispatch_uid='invalidate_comment_tiles')
+
+
+def invalidate_bulk_comment_tiles(sender, instances, **kwargs):
+    if any(instance.geometry is not None for instance in instances):
+        invalidate_tile_layer(COMMENT_LAYER)
+
+
+comments_bulk_created.connect(
+    invalidate_bulk_comment_tiles, sender=SectionComment, dispatch_uid='invalidate_bulk_comment_tiles'
+)
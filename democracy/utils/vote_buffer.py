@@ -0,0 +1,326 @@
+"""
+Write-behind buffer for anonymous votes.
+
+When a hearing draws a crowd, anonymous votes concentrate on a few comment rows. With
+`DEMOCRACY_VOTE_BUFFER` set, anonymous votes are only counted in a buffer, and the buffered
+votes are added to `n_unregistered_votes` and `n_votes` in batched updates. The buffer is
+flushed by the first vote after `DEMOCRACY_VOTE_BUFFER_FLUSH_INTERVAL` seconds have passed
+since the previous flush, and by the `democracy_flush_vote_buffer` command. Comment
+representations include the pending votes.
+
+`DEMOCRACY_VOTE_BUFFER` is a dict with the dotted path of the buffer `BACKEND` and its
+`OPTIONS`. `LocalVoteBuffer` keeps the votes in the memory of the process, and
+`SQLiteVoteBuffer` in an SQLite database shared by the processes of a host. Votes in a
+buffer are lost if the buffer is lost before a flush.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+# SQLite limits the number of query parameters
+SQLITE_CHUNK_SIZE = 500
+
+
+class BaseVoteBuffer:
+    """
+    Pending vote counts by comment key.
+    """
+
+    def __init__(self):
+        self.flush_lock = threading.Lock()
+        self.last_flush_at = time.monotonic()
+        self.last_flush_duration = None
+        self.last_flush_votes = 0
+
+    def add(self, key, count=1):
+        raise NotImplementedError()
+
+    def get_pending(self, keys):
+        """
+        :return: The pending counts of the given keys that have any
+        :rtype: dict[str, int]
+        """
+        raise NotImplementedError()
+
+    def take(self):
+        """
+        Remove and return all pending counts.
+
+        :rtype: dict[str, int]
+        """
+        raise NotImplementedError()
+
+    def get_version(self):
+        """
+        Get a number that changes whenever votes are added.
+        """
+        raise NotImplementedError()
+
+    def get_depth(self):
+        """
+        :return: The number of comments with pending votes, and the number of pending votes
+        :rtype: tuple[int, int]
+        """
+        raise NotImplementedError()
+
+
+class LocalVoteBuffer(BaseVoteBuffer):
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._version = 0
+
+    def add(self, key, count=1):
+        with self._lock:
+            self._counts[key] += count
+            self._version += 1
+
+    def get_pending(self, keys):
+        with self._lock:
+            return {key: self._counts[key] for key in keys if key in self._counts}
+
+    def take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return dict(counts)
+
+    def get_version(self):
+        return self._version
+
+    def get_depth(self):
+        with self._lock:
+            return len(self._counts), sum(self._counts.values())
+
+
+class SQLiteVoteBuffer(BaseVoteBuffer):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # autocommit mode, transactions are started explicitly
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS vote (key TEXT PRIMARY KEY, count INTEGER NOT NULL)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def add(self, key, count=1):
+        with self._transaction() as connection:
+            connection.execute(
+                'INSERT INTO vote (key, count) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET count = count + excluded.count',
+                (key, count)
+            )
+            connection.execute(
+                'INSERT INTO version (id, version) VALUES (1, 1) '
+                'ON CONFLICT (id) DO UPDATE SET version = version + 1'
+            )
+
+    def get_pending(self, keys):
+        keys = list(keys)
+        connection = self._get_connection()
+        pending = {}
+        for i in range(0, len(keys), SQLITE_CHUNK_SIZE):
+            chunk = keys[i:i + SQLITE_CHUNK_SIZE]
+            pending.update(connection.execute(
+                'SELECT key, count FROM vote WHERE key IN (%s)' % ', '.join('?' * len(chunk)), chunk
+            ))
+        return pending
+
+    def take(self):
+        with self._transaction() as connection:
+            counts = dict(connection.execute('SELECT key, count FROM vote'))
+            connection.execute('DELETE FROM vote')
+        return counts
+
+    def get_version(self):
+        row = self._get_connection().execute('SELECT version FROM version').fetchone()
+        return row[0] if row else 0
+
+    def get_depth(self):
+        n_keys, n_votes = self._get_connection().execute('SELECT COUNT(*), SUM(count) FROM vote').fetchone()
+        return n_keys, n_votes or 0
+
+
+_buffers = {}
+
+
+def get_vote_buffer():
+    """
+    Get the vote buffer, or None if anonymous votes are not buffered.
+
+    :rtype: BaseVoteBuffer|None
+    """
+    config = getattr(settings, 'DEMOCRACY_VOTE_BUFFER', None)
+    if not config:
+        return None
+    options = config.get('OPTIONS', {})
+    buffer_key = (config['BACKEND'], tuple(sorted(options.items())))
+    if buffer_key not in _buffers:
+        _buffers[buffer_key] = import_string(config['BACKEND'])(**options)
+    return _buffers[buffer_key]
+
+
+def get_comment_key(comment):
+    return '%s:%s' % (comment._meta.label_lower, comment.pk)
+
+
+def get_pending_votes(comment):
+    buffer = get_vote_buffer()
+    if buffer is None:
+        return 0
+    key = get_comment_key(comment)
+    return buffer.get_pending([key]).get(key, 0)
+
+
+def get_pending_votes_by_pk(model, pks):
+    """
+    Get the pending votes of many comments of `model` at once.
+
+    :return: The pending counts by comment primary key, for the comments that have any
+    :rtype: dict[int, int]
+    """
+    buffer = get_vote_buffer()
+    if buffer is None:
+        return {}
+    keys = {'%s:%s' % (model._meta.label_lower, pk): pk for pk in pks}
+    return {keys[key]: count for key, count in buffer.get_pending(keys).items()}
+
+
+def prefetch_pending_votes(comments):
+    """
+    Look up the pending votes of many comments at once for `BaseComment.get_n_votes()`.
+    """
+    comments_by_model = defaultdict(list)
+    for comment in comments:
+        comments_by_model[type(comment)].append(comment)
+    for model, model_comments in comments_by_model.items():
+        pending = get_pending_votes_by_pk(model, [comment.pk for comment in model_comments])
+        for comment in model_comments:
+            comment._pending_votes = pending.get(comment.pk, 0)
+
+
+def get_vote_buffer_version():
+    buffer = get_vote_buffer()
+    return buffer.get_version() if buffer is not None else None
+
+
+def buffer_unregistered_vote(comment):
+    """
+    Count an anonymous vote in the buffer, flushing the buffer if it is due.
+
+    :return: Whether the vote was buffered, False if there is no buffer
+    :rtype: bool
+    """
+    buffer = get_vote_buffer()
+    if buffer is None:
+        return False
+    buffer.add(get_comment_key(comment))
+    interval = getattr(settings, 'DEMOCRACY_VOTE_BUFFER_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    if time.monotonic() - buffer.last_flush_at >= interval:
+        flush_vote_buffer(blocking=False)
+    return True
+
+
+def _apply_votes(counts):
+    # comments with the same number of pending votes are updated together. The votes were already
+    # represented as pending votes, so no comments_modified is sent for them.
+    comment_pks = defaultdict(lambda: defaultdict(list))
+    for key, count in counts.items():
+        model_label, pk = key.rsplit(':', 1)
+        comment_pks[model_label][count].append(pk)
+    modified_at = now()
+    with transaction.atomic():
+        for model_label, pks_by_count in comment_pks.items():
+            model = apps.get_model(model_label)
+            for count, pks in pks_by_count.items():
+                model.objects.everything().filter(pk__in=pks).update(
+                    n_votes=F('n_votes') + count,
+                    n_unregistered_votes=F('n_unregistered_votes') + count,
+                    modified_at=modified_at,
+                )
+
+
+def flush_vote_buffer(blocking=True):
+    """
+    Add the buffered votes to the vote counts of their comments.
+
+    :param blocking: Whether to wait for a flush already running in this process, instead of skipping the flush
+    :return: The number of flushed votes
+    """
+    buffer = get_vote_buffer()
+    if buffer is None or not buffer.flush_lock.acquire(blocking):
+        return 0
+    try:
+        started_at = time.monotonic()
+        counts = buffer.take()
+        try:
+            _apply_votes(counts)
+        except Exception:
+            # put the votes back for the next flush
+            for key, count in counts.items():
+                buffer.add(key, count)
+            raise
+        finished_at = time.monotonic()
+        buffer.last_flush_at = finished_at
+        buffer.last_flush_duration = finished_at - started_at
+        buffer.last_flush_votes = sum(counts.values())
+    finally:
+        buffer.flush_lock.release()
+    if counts:
+        LOG.info(
+            'Flushed %d buffered votes of %d comments in %.3f s',
+            buffer.last_flush_votes, len(counts), buffer.last_flush_duration
+        )
+    return buffer.last_flush_votes
+
+
+def get_vote_buffer_stats():
+    """
+    Get the depth of the vote buffer, and the statistics of the last flush in this process.
+
+    :rtype: dict|None
+    """
+    buffer = get_vote_buffer()
+    if buffer is None:
+        return None
+    pending_comments, pending_votes = buffer.get_depth()
+    return {
+        'pending_comments': pending_comments,
+        'pending_votes': pending_votes,
+        'seconds_since_last_flush': time.monotonic() - buffer.last_flush_at,
+        'last_flush_duration': buffer.last_flush_duration,
+        'last_flush_votes': buffer.last_flush_votes,
+    }
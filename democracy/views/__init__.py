@@ -4,6 +4,7 @@ from .label import LabelViewSet
 from .project import ProjectViewSet
 from .section import ImageViewSet, SectionViewSet, RootSectionViewSet
 from .section_comment import SectionCommentViewSet, CommentViewSet
+from .tile import TileView
 from .user import UserDataViewSet
 
 __all__ = [
@@ -16,5 +17,6 @@ __all__ = [
     "RootSectionViewSet",
     "SectionCommentViewSet",
     "SectionViewSet",
+    "TileView",
     "UserDataViewSet"
 ]
@@ -1,9 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
+from django.http import StreamingHttpResponse
 from rest_framework import serializers
 
 from democracy.models.base import BaseModel
 from democracy.models.images import BaseImage
+from democracy.renderers import GeoJSONRenderer
 from democracy.views.utils import AbstractSerializerMixin
 
 
@@ -74,3 +76,51 @@ class AdminsSeeUnpublishedMixin(object):
     def _get_user_from_request_or_context(self):
         if hasattr(self, "request"):  # pragma: no branch
             return getattr(self.request, "user", None)
+
+
+class StreamingGeoJSONListMixin(object):
+    """
+    Stream GeoJSON lists feature by feature instead of rendering the whole FeatureCollection at once.
+
+    Unpaginated lists are read from the database in chunks, so memory use does not grow with
+    the number of features.
+    """
+    geojson_chunk_size = 500
+
+    def prefetch_for_serialization(self, objs):
+        """
+        Prefetch the related objects needed for serializing a queryset or a list of objects.
+
+        :return: The queryset to serialize instead, or the same list
+        """
+        return objs
+
+    def list(self, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        if not isinstance(renderer, GeoJSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            members = self.get_paginated_response([]).data
+            del members['results']
+            objects = self.prefetch_for_serialization(page)
+        else:
+            members = None
+            objects = self._iterate_in_chunks(self.prefetch_for_serialization(queryset))
+
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        features = (serializer_class(obj, context=context).data for obj in objects)
+        return StreamingHttpResponse(renderer.render_stream(features, members), content_type=renderer.media_type)
+
+    def _iterate_in_chunks(self, queryset):
+        # QuerySet.iterator() ignores prefetch_related, so prefetch every chunk separately
+        chunk = []
+        for obj in queryset.iterator():
+            chunk.append(obj)
+            if len(chunk) >= self.geojson_chunk_size:
+                yield from self.prefetch_for_serialization(chunk)
+                chunk = []
+        yield from self.prefetch_for_serialization(chunk)
@@ -2,6 +2,7 @@
 import django_filters
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import QuerySet
 from django.utils.encoding import force_text
 from rest_framework import permissions, response, serializers, status, viewsets
 from rest_framework.decorators import detail_route
@@ -9,7 +10,8 @@ from rest_framework.settings import api_settings
 from reversion import revisions
 
 from democracy.models.comment import BaseComment
-from democracy.views.base import AdminsSeeUnpublishedMixin, CreatedBySerializer
+from democracy.utils.vote_buffer import prefetch_pending_votes
+from democracy.views.base import AdminsSeeUnpublishedMixin, CreatedBySerializer, StreamingGeoJSONListMixin
 from democracy.views.utils import GeoJSONField, AbstractSerializerMixin
 from democracy.renderers import GeoJSONRenderer
 
@@ -21,6 +23,7 @@ class BaseCommentSerializer(AbstractSerializerMixin, CreatedBySerializer, serial
     is_registered = serializers.SerializerMethodField()
     can_edit = serializers.SerializerMethodField()
     geojson = GeoJSONField()
+    n_votes = serializers.IntegerField(source='get_n_votes', read_only=True)
 
     def to_representation(self, instance):
         r = super().to_representation(instance)
@@ -52,7 +55,7 @@ class BaseCommentFilter(django_filters.rest_framework.FilterSet):
         fields = ['authorization_code', ]
 
 
-class BaseCommentViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
+class BaseCommentViewSet(AdminsSeeUnpublishedMixin, StreamingGeoJSONListMixin, viewsets.ModelViewSet):
     """
     Base viewset for comments.
     """
@@ -71,8 +74,19 @@ class BaseCommentViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
             data = kwargs["data"].copy()
             data[serializer_class.Meta.model.parent_field] = context["comment_parent"]
             kwargs["data"] = data
+        if args and kwargs.get('many'):
+            objs = args[0]
+            if isinstance(objs, QuerySet):
+                # the whole queryset is serialized anyway, so prepare its objects like a page
+                objs = list(self.prefetch_for_serialization(objs))
+            args = (self.prefetch_for_serialization(objs),) + args[1:]
         return serializer_class(*args, **kwargs)
 
+    def prefetch_for_serialization(self, objs):
+        if not isinstance(objs, QuerySet):
+            prefetch_pending_votes(objs)
+        return objs
+
     def get_comment_parent_id(self):
         return self.kwargs["comment_parent_pk"]
 
@@ -185,16 +199,11 @@ class BaseCommentViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
 
         if not request.user.is_authenticated():
             # If the check went through, anonymous voting is allowed
-            comment.n_unregistered_votes += 1
-            comment.recache_n_votes()
+            comment.add_unregistered_vote()
             return response.Response({'status': 'Vote has been counted'}, status=status.HTTP_200_OK)
-        # Check if user voted already. If yes, return 304.
-        if comment.__class__.objects.filter(id=comment.id, voters=request.user).exists():
+        # If user voted already, return 304.
+        if not comment.add_vote(request.user):
             return response.Response({'status': 'Already voted'}, status=status.HTTP_304_NOT_MODIFIED)
-        # add voter
-        comment.voters.add(request.user)
-        # update number of votes
-        comment.recache_n_votes()
         # return success
         return response.Response({'status': 'Vote has been added'}, status=status.HTTP_201_CREATED)
 
@@ -206,12 +215,8 @@ class BaseCommentViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
 
         comment = self.get_object()
 
-        # Check if user voted already. If yes, return 400.
-        if comment.__class__.objects.filter(id=comment.id, voters=request.user).exists():
-            # remove voter
-            comment.voters.remove(request.user)
-            # update number of votes
-            comment.recache_n_votes()
+        # Remove the vote if the user has voted. If not, return 304.
+        if comment.remove_vote(request.user):
             # return success
             return response.Response({'status': 'Removed vote'}, status=status.HTTP_204_NO_CONTENT)
 
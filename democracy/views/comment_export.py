@@ -0,0 +1,183 @@
+"""
+Streaming exports of all the comments of a hearing.
+
+Comments are read through a server-side cursor and encoded row by row without serializers,
+so an export takes constant memory regardless of the number of comments. Labels, poll answers,
+images and buffered votes are fetched once per chunk of comments.
+"""
+import csv
+import json
+from collections import OrderedDict, defaultdict
+from itertools import islice
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from democracy.models import Label, SectionComment, SectionPollAnswer
+from democracy.models.section import CommentImage
+from democracy.utils.vote_buffer import get_pending_votes_by_pk
+
+CHUNK_SIZE = 1000
+
+# comment columns read from the database
+COMMENT_VALUES = (
+    'id', 'section_id', 'created_at', 'author_name', 'created_by_id', 'content', 'label_id', 'language_code',
+    'geojson', 'n_votes',
+)
+EXPORT_FIELDS = (
+    'id', 'section', 'created_at', 'author_name', 'is_registered', 'content', 'label', 'language_code', 'geojson',
+    'n_votes', 'answers', 'images',
+)
+
+
+def get_exported_comments(hearing, request):
+    """
+    Get the comments of a hearing visible in the comment lists, in a stable order.
+    """
+    manager = SectionComment.objects
+    queryset = manager.with_unpublished() if request.user.is_superuser else manager.public()
+    return queryset.filter(section__hearing=hearing, section__deleted=False).order_by('pk')
+
+
+class CommentRowReader(object):
+    """
+    Read comments as plain rows, fetching their related objects a chunk at a time.
+    """
+
+    def __init__(self, queryset, base_url, chunk_size=CHUNK_SIZE):
+        """
+        :param base_url: The absolute URL that image URLs are relative to
+        """
+        self.queryset = queryset
+        self.base_url = base_url
+        self.chunk_size = chunk_size
+        # labels are shared by the comments of a hearing, so they are kept for the whole export
+        self.labels = {}
+        self.image_storage = CommentImage._meta.get_field('image').storage
+
+    def __iter__(self):
+        comments = self.queryset.values(*COMMENT_VALUES).iterator()
+        while True:
+            chunk = list(islice(comments, self.chunk_size))
+            if not chunk:
+                return
+            yield from self.get_rows(chunk)
+
+    def get_rows(self, chunk):
+        ids = [comment['id'] for comment in chunk]
+        self._fetch_labels({comment['label_id'] for comment in chunk} - set(self.labels) - {None})
+        answers = self._get_answers(ids)
+        images = self._get_images(ids)
+        pending_votes = get_pending_votes_by_pk(SectionComment, ids)
+        for comment in chunk:
+            yield OrderedDict([
+                ('id', comment['id']),
+                ('section', comment['section_id']),
+                ('created_at', comment['created_at']),
+                ('author_name', comment['author_name']),
+                ('is_registered', comment['created_by_id'] is not None),
+                ('content', comment['content']),
+                ('label', self.labels.get(comment['label_id'])),
+                ('language_code', comment['language_code']),
+                ('geojson', comment['geojson']),
+                ('n_votes', comment['n_votes'] + pending_votes.get(comment['id'], 0)),
+                ('answers', list(answers[comment['id']].values())),
+                ('images', images[comment['id']]),
+            ])
+
+    def _fetch_labels(self, label_ids):
+        if not label_ids:
+            return
+        for label in Label.objects.everything().filter(pk__in=label_ids).prefetch_related('translations'):
+            self.labels[label.pk] = OrderedDict([
+                ('id', label.pk),
+                ('label', {translation.language_code: translation.label for translation in label.translations.all()}),
+            ])
+
+    def _get_answers(self, ids):
+        # grouped by poll like in the comment representations
+        answers = defaultdict(OrderedDict)
+        rows = SectionPollAnswer.objects.filter(comment_id__in=ids).values_list(
+            'comment_id', 'option__poll_id', 'option__poll__type', 'option_id'
+        )
+        for comment_id, poll_id, poll_type, option_id in rows:
+            if poll_id not in answers[comment_id]:
+                answers[comment_id][poll_id] = OrderedDict([
+                    ('question', poll_id),
+                    ('type', poll_type),
+                    ('answers', []),
+                ])
+            answers[comment_id][poll_id]['answers'].append(option_id)
+        return answers
+
+    def _get_images(self, ids):
+        images = defaultdict(list)
+        rows = CommentImage.objects.filter(comment_id__in=ids).values_list('comment_id', 'image')
+        for comment_id, name in rows:
+            images[comment_id].append(urljoin(self.base_url, self.image_storage.url(name)))
+        return images
+
+
+class NDJSONCommentEncoder(object):
+    content_type = 'application/x-ndjson'
+
+    def encode(self, rows):
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class CSVCommentEncoder(object):
+    """
+    Encode comments as CSV, with the label in the default language and nested values as JSON.
+    """
+    content_type = 'text/csv; charset=utf-8'
+
+    class Echo(object):
+        def write(self, value):
+            return value
+
+    def encode(self, rows):
+        writer = csv.writer(self.Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow([
+                row['id'],
+                row['section'],
+                row['created_at'].isoformat(),
+                row['author_name'],
+                row['is_registered'],
+                row['content'],
+                self._get_label_text(row['label']),
+                row['language_code'],
+                json.dumps(row['geojson']) if row['geojson'] else '',
+                row['n_votes'],
+                json.dumps(row['answers']) if row['answers'] else '',
+                ' '.join(row['images']),
+            ])
+
+    def _get_label_text(self, label):
+        if not label:
+            return ''
+        translations = label['label']
+        return translations.get(settings.LANGUAGE_CODE) or next(iter(translations.values()), '')
+
+
+COMMENT_ENCODERS = {
+    'ndjson': NDJSONCommentEncoder,
+    'csv': CSVCommentEncoder,
+}
+
+
+def get_comment_export_response(hearing, request, export_format):
+    """
+    Stream all the visible comments of a hearing in `export_format`, one of `COMMENT_ENCODERS`.
+    """
+    encoder = COMMENT_ENCODERS[export_format]()
+    rows = CommentRowReader(get_exported_comments(hearing, request), request.build_absolute_uri('/'))
+    response = StreamingHttpResponse(encoder.encode(rows), content_type=encoder.content_type)
+    response['Content-Disposition'] = 'attachment; filename="hearing-%s-comments.%s"' % (
+        hearing.slug or hearing.pk, export_format
+    )
+    return response
@@ -1,29 +1,41 @@
 from collections import defaultdict
+from types import SimpleNamespace
 import django_filters
-import datetime
 
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Prefetch
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from django.utils import timezone
 from rest_framework import filters, permissions, response, serializers, status, viewsets
 from rest_framework.decorators import detail_route, list_route
 from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.settings import api_settings
 
-from democracy.enums import InitialSectionType
-from democracy.models import ContactPerson, Hearing, Label, Section, SectionImage, Project
+from democracy.enums import HearingStatus, InitialSectionType
+from democracy.models import ContactPerson, Hearing, HearingListEntry, Label, Section, SectionImage, Project
+from democracy.models.base import get_counter_slot_prefetches
+from democracy.models.search import filter_by_search
 from democracy.pagination import DefaultLimitPagination
 from democracy.renderers import GeoJSONRenderer
+from democracy.utils.comment_clusters import MAX_TILES, MAX_ZOOM, get_comment_clusters
+from democracy.utils.hearing_cache import get_hearing_cache, get_hearing_cache_key, get_hearing_cache_timeout
+from democracy.utils.tiles import get_tile_range
 from democracy.views.base import AdminsSeeUnpublishedMixin
 from democracy.views.contact_person import ContactPersonSerializer
 from democracy.views.label import LabelSerializer
-from democracy.views.project import ProjectSerializer, ProjectFieldSerializer, ProjectCreateUpdateSerializer
+from democracy.views.project import (
+    ProjectSerializer, ProjectFieldSerializer, ProjectCreateUpdateSerializer, get_visible_phase_hearings
+)
 from democracy.views.section import (
-    SectionCreateUpdateSerializer, SectionFieldSerializer, SectionImageSerializer, SectionSerializer
+    SectionCreateUpdateSerializer, SectionFieldSerializer, SectionImageSerializer, SectionSerializer,
+    section_prefetches
+)
+from democracy.views.utils import (
+    GeoJSONField, GeometryBboxFilterBackend, TranslatableSerializer, get_hearing_validators,
+    get_not_modified_response, get_translation_list, prefetch_translations, set_validator_headers
 )
-from democracy.views.utils import GeoJSONField, GeometryBboxFilterBackend, TranslatableSerializer, get_translation_list
-from .hearing_report import HearingReport
+from .comment_export import get_comment_export_response
+from .hearing_report import HearingReport, get_stored_report_response
 from .utils import NestedPKRelatedField, filter_by_hearing_visible
 
 
@@ -33,10 +45,21 @@ class HearingFilter(django_filters.rest_framework.FilterSet):
     title = django_filters.CharFilter(lookup_expr='icontains', name='translations__title', distinct=True)
     label = django_filters.Filter(name='labels__id', lookup_expr='in', distinct=True,
                                   widget=django_filters.widgets.CSVWidget)
+    status = django_filters.ChoiceFilter(
+        choices=[(status, status) for status in (HearingStatus.UPCOMING, HearingStatus.OPEN, HearingStatus.CLOSED)],
+        method='filter_status'
+    )
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Hearing
-        fields = ['published', 'open_at_lte', 'open_at_gt', 'title', 'label']
+        fields = ['published', 'open_at_lte', 'open_at_gt', 'title', 'label', 'status', 'search']
+
+    def filter_status(self, queryset, name, value):
+        return queryset.filter_by_status(value)
+
+    def filter_search(self, queryset, name, value):
+        return filter_by_search(queryset, value)
 
 
 class HearingCreateUpdateSerializer(serializers.ModelSerializer, TranslatableSerializer):
@@ -261,6 +284,7 @@ class HearingSerializer(serializers.ModelSerializer, TranslatableSerializer):
     contact_persons = ContactPersonSerializer(many=True, read_only=True)
     default_to_fullscreen = serializers.SerializerMethodField()
     project = serializers.SerializerMethodField()
+    n_comments = serializers.IntegerField(source='get_n_comments', read_only=True)
 
     def _get_main_section(self, hearing):
         prefetched_mains = getattr(hearing, 'main_section_list', [])
@@ -281,13 +305,15 @@ class HearingSerializer(serializers.ModelSerializer, TranslatableSerializer):
         return abstract
 
     def get_sections(self, hearing):
-        queryset = hearing.sections.all()
-        if not hearing.closed:
-            queryset = queryset.exclude(type__identifier=InitialSectionType.CLOSURE_INFO)
+        # filter in Python, so that sections prefetched with hearing_detail_prefetches need no further queries
+        sections = [
+            section for section in hearing.sections.all()
+            if hearing.closed or section.type.identifier != InitialSectionType.CLOSURE_INFO
+        ]
 
         serializer = SectionFieldSerializer(many=True, read_only=True)
         serializer.bind('sections', self)  # this is needed to get context in the serializer
-        return serializer.to_representation(queryset)
+        return serializer.to_representation(prefetch_translations(sections))
 
     def get_main_image(self, hearing):
         main_section = self._get_main_section(hearing)
@@ -336,13 +362,57 @@ class HearingSerializer(serializers.ModelSerializer, TranslatableSerializer):
         translation_lang = [lang['code'] for lang in settings.PARLER_LANGUAGES[None]]
 
 
+def _get_raw_translations(values):
+    """
+    Turn raw translation values ({field: {language_code: value}}) into translation-like objects.
+    """
+    translations = defaultdict(dict)
+    for field, field_values in values.items():
+        for language_code, value in field_values.items():
+            translations[language_code][field] = value
+    return [SimpleNamespace(language_code=language_code, **fields) for language_code, fields in translations.items()]
+
+
+class HearingListListSerializer(serializers.ListSerializer):
+    """
+    List serializer that loads what the listed hearings cannot read from their list entries at once.
+    """
+
+    def to_representation(self, data):
+        hearings = list(data.all() if isinstance(data, Manager) else data)
+        with_entry = [hearing for hearing in hearings if self.child._get_list_entry(hearing)]
+        without_entry = [hearing for hearing in hearings if not self.child._get_list_entry(hearing)]
+        request = self.context['request']
+        prefetch_related_objects(without_entry, *hearing_prefetches)
+        if 'dim' in request.GET:
+            prefetch_related_objects(with_entry, main_section_prefetch)
+        phase_ids = [
+            phase['id'] for hearing in with_entry if hearing.list_entry.project
+            for phase in hearing.list_entry.project['phases']
+        ]
+        self.child.phase_hearings = get_visible_phase_hearings(phase_ids, request)
+        return [self.child.to_representation(hearing) for hearing in hearings]
+
+
 class HearingListSerializer(HearingSerializer):
+    """
+    Hearing serializer for listing hearings.
+
+    The expensive parts of the payload are read from the precomputed `HearingListEntry`
+    of the hearing if it has one.
+    """
+    phase_hearings = None
+
+    class Meta(HearingSerializer.Meta):
+        list_serializer_class = HearingListListSerializer
 
     def get_fields(self):
         fields = super(HearingListSerializer, self).get_fields()
         # Elide section, contact person and geo data when listing hearings; one can get to them via detail routes
         fields.pop("sections")
         fields.pop("contact_persons")
+        fields["labels"] = serializers.SerializerMethodField()
+        fields["organization"] = serializers.SerializerMethodField()
         request = self.context.get('request', None)
         if request:
             if not request.GET.get('include', None) == 'geojson'\
@@ -350,6 +420,101 @@ class HearingListSerializer(HearingSerializer):
                 fields.pop("geojson")
         return fields
 
+    def _get_list_entry(self, hearing):
+        try:
+            return hearing.list_entry
+        except HearingListEntry.DoesNotExist:
+            return None
+
+    def get_translations(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        if not list_entry:
+            return super().get_translations(hearing)
+        return _get_raw_translations({'title': list_entry.title, 'borough': list_entry.borough})
+
+    def get_abstract(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        if not list_entry:
+            return super().get_abstract(hearing)
+        return list_entry.abstract
+
+    def get_labels(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        if not list_entry:
+            return LabelSerializer(hearing.labels.all(), many=True, context=self.context).data
+        labels = []
+        for label in list_entry.labels:
+            data = {'id': label['id']}
+            for translation in _get_raw_translations({'label': label['label']}):
+                self._update_lang(data, 'label', translation.label, translation.language_code)
+            labels.append(data)
+        return labels
+
+    def get_main_image(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        request = self.context['request']
+        # thumbnails are not precomputed
+        if not list_entry or 'dim' in request.GET:
+            return super().get_main_image(hearing)
+
+        main_image = list_entry.main_image
+        if not main_image or not (main_image['published'] or request.user.is_superuser):
+            return None
+        url = SectionImage._meta.get_field('image').storage.url(main_image['image'])
+        data = {
+            'id': main_image['id'],
+            'url': request.build_absolute_uri(url),
+            'width': main_image['width'],
+            'height': main_image['height'],
+        }
+        fields = ('title', 'caption')
+        for translation in _get_raw_translations({field: main_image[field] for field in fields}):
+            for field in fields:
+                self._update_lang(data, field, getattr(translation, field), translation.language_code)
+        return data
+
+    def get_default_to_fullscreen(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        if not list_entry:
+            return super().get_default_to_fullscreen(hearing)
+        return list_entry.default_to_fullscreen
+
+    def get_organization(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        if not list_entry:
+            return hearing.organization.name if hearing.organization else None
+        return list_entry.organization
+
+    def get_project(self, hearing):
+        list_entry = self._get_list_entry(hearing)
+        if not list_entry:
+            return super().get_project(hearing)
+
+        project = list_entry.project
+        if not project:
+            return None
+        phase_hearings = self.phase_hearings
+        if phase_hearings is None:
+            phase_hearings = get_visible_phase_hearings(
+                [phase['id'] for phase in project['phases']], self.context['request']
+            )
+        data = {'id': project['id'], 'phases': []}
+        for translation in _get_raw_translations({'title': project['title']}):
+            self._update_lang(data, 'title', translation.title, translation.language_code)
+        fields = ('title', 'description', 'schedule')
+        for phase in project['phases']:
+            phase_data = {
+                'id': phase['id'],
+                'has_hearings': phase['id'] in phase_hearings,
+                'hearings': phase_hearings.get(phase['id'], []),
+                'is_active': hearing.project_phase_id == phase['id'],
+            }
+            for translation in _get_raw_translations({field: phase[field] for field in fields}):
+                for field in fields:
+                    self._update_lang(phase_data, field, getattr(translation, field), translation.language_code)
+            data['phases'].append(phase_data)
+        return data
+
 
 class HearingMapSerializer(serializers.ModelSerializer, TranslatableSerializer):
     geojson = GeoJSONField()
@@ -361,17 +526,19 @@ class HearingMapSerializer(serializers.ModelSerializer, TranslatableSerializer):
         ]
 
 
-hearing_prefetches = (
-    Prefetch(
-        'sections',
-        queryset=Section.objects.filter(type__identifier='main').prefetch_related(
-            Prefetch('translations', to_attr='translation_list'),
-            Prefetch('images',
-                     queryset=SectionImage.objects.filter(section__type__identifier='main').
-                     prefetch_related('translations'))
-        ),
-        to_attr='main_section_list'
+main_section_prefetch = Prefetch(
+    'sections',
+    queryset=Section.objects.filter(type__identifier='main').prefetch_related(
+        Prefetch('translations', to_attr='translation_list'),
+        Prefetch('images',
+                 queryset=SectionImage.objects.filter(section__type__identifier='main').
+                 prefetch_related('translations'))
     ),
+    to_attr='main_section_list'
+)
+
+hearing_prefetches = (
+    main_section_prefetch,
     Prefetch(
         'labels',
         queryset=Label.objects.prefetch_related('translations')
@@ -380,6 +547,15 @@ hearing_prefetches = (
     )
 
 
+def get_hearing_detail_prefetches():
+    slot_prefetches = get_counter_slot_prefetches()
+    return hearing_prefetches + slot_prefetches + (
+        Prefetch('sections', queryset=Section.objects.prefetch_related(*(section_prefetches + slot_prefetches))),
+        'contact_persons__translations',
+        'project_phase__project',
+    )
+
+
 class HearingViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
     """
     API endpoint for hearings.
@@ -405,6 +581,9 @@ class HearingViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
         return HearingSerializer
 
     def filter_queryset(self, queryset):
+        if self.action == 'comment_clusters':
+            # the bbox parameter selects the clusters, not the hearing
+            return queryset
         next_closing = self.request.query_params.get('next_closing', None)
         open = self.request.query_params.get('open', None)
         if next_closing is not None:
@@ -412,25 +591,32 @@ class HearingViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
             return queryset.filter(close_at__gt=next_closing).order_by('close_at')[:1]
         if open is not None:
             if open.lower() == 'false' or open == 0:
-                queryset = (queryset.filter(close_at__lt=datetime.datetime.now()) |
-                            queryset.filter(open_at__gt=datetime.datetime.now()) |
-                            queryset.filter(force_closed=True)).distinct()
+                queryset = queryset.exclude_by_status(HearingStatus.OPEN)
             else:
-                queryset = queryset.filter(close_at__gt=datetime.datetime.now()).\
-                    filter(open_at__lt=datetime.datetime.now()).filter(force_closed=False)
+                queryset = queryset.filter_by_status(HearingStatus.OPEN)
         queryset = super().filter_queryset(queryset)
+        if self.request.query_params.get('search') and not self.request.query_params.get(api_settings.ORDERING_PARAM):
+            # best matches first unless another ordering is requested
+            queryset = queryset.order_by('-search_rank', '-created_at')
         return queryset
 
     def get_queryset(self):
         queryset = filter_by_hearing_visible(Hearing.objects.with_unpublished(), self.request,
-                                             hearing_lookup='').prefetch_related(*hearing_prefetches)
-        return queryset
-
-    def get_object(self):
+                                             hearing_lookup='')
+        if self.action == 'list':
+            # the list payload is precomputed, see HearingListEntry; hearings without an entry are
+            # prefetched by HearingListListSerializer
+            return queryset.select_related(
+                'list_entry', 'organization', 'project_phase__project'
+            ).prefetch_related(*get_counter_slot_prefetches())
+        return queryset.prefetch_related(*hearing_prefetches)
+
+    def get_object(self, prefetch=True):
         id_or_slug = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
 
         queryset = self.filter_queryset(Hearing.objects.with_unpublished())
-        queryset = queryset.prefetch_related(*hearing_prefetches)
+        if prefetch:
+            queryset = queryset.prefetch_related(*hearing_prefetches)
 
         try:
             obj = queryset.get_by_id_or_slug(id_or_slug)
@@ -452,6 +638,37 @@ class HearingViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def _is_cacheable_request(self):
+        # previews and admins may see unpublished content, so only cache what everybody sees
+        if 'preview' in self.request.query_params:
+            return False
+        user = self.request.user
+        if user.is_authenticated() and (user.is_superuser or user.admin_organizations.exists()):
+            return False
+        return True
+
+    def _get_hearing_data(self, hearing):
+        cache = get_hearing_cache()
+        if cache is None or not self._is_cacheable_request():
+            prefetch_related_objects([hearing], *get_hearing_detail_prefetches())
+            return self.get_serializer(hearing).data
+
+        cache_key = get_hearing_cache_key(hearing, self.request)
+        data = cache.get(cache_key)
+        if data is None:
+            prefetch_related_objects([hearing], *get_hearing_detail_prefetches())
+            data = self.get_serializer(hearing).data
+            cache.set(cache_key, data, get_hearing_cache_timeout(hearing))
+        return data
+
+    def retrieve(self, request, *args, **kwargs):
+        hearing = self.get_object(prefetch=False)
+        etag, last_modified = get_hearing_validators(request, hearing)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validator_headers(response.Response(self._get_hearing_data(hearing)), etag, last_modified)
+
     @detail_route(methods=['post'])
     def follow(self, request, pk=None):
         hearing = self.get_object()
@@ -479,8 +696,44 @@ class HearingViewSet(AdminsSeeUnpublishedMixin, viewsets.ModelViewSet):
     @detail_route(methods=['get'])
     def report(self, request, pk=None):
         context = self.get_serializer_context()
-        report = HearingReport(HearingSerializer(self.get_object(), context=context).data, context=context)
-        return report.get_response()
+        hearing = self.get_object(prefetch=False)
+
+        def get_hearing_data():
+            prefetch_related_objects([hearing], *get_hearing_detail_prefetches())
+            return HearingSerializer(hearing, context=context).data
+
+        # reports of large hearings are generated in the background, but only the public ones can be shared
+        threshold = getattr(settings, 'DEMOCRACY_BACKGROUND_REPORT_THRESHOLD', None)
+        if threshold is not None and hearing.get_n_comments() >= threshold and self._is_cacheable_request():
+            return get_stored_report_response(hearing, request, get_hearing_data)
+        return HearingReport(get_hearing_data(), context=context).get_response()
+
+    def export_comments(self, request, pk=None, export_format=None):
+        """
+        Stream all the comments of the hearing as newline-delimited JSON or CSV.
+
+        Routed as `comments.ndjson` and `comments.csv` in `democracy.urls_v1`.
+        """
+        hearing = self.get_object(prefetch=False)
+        return get_comment_export_response(hearing, request, export_format)
+
+    @detail_route(methods=['get'])
+    def comment_clusters(self, request, pk=None):
+        hearing = self.get_object(prefetch=False)
+        try:
+            zoom = int(request.query_params['zoom'])
+            west, south, east, north = (float(value) for value in request.query_params['bbox'].split(','))
+        except (KeyError, ValueError):
+            raise ValidationError({'detail': 'zoom and bbox (west,south,east,north) are required'})
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValidationError({'zoom': 'zoom must be between 0 and %d' % MAX_ZOOM})
+        xmin, ymin, xmax, ymax = get_tile_range(west, south, east, north, zoom)
+        if (xmax - xmin + 1) * (ymax - ymin + 1) > MAX_TILES:
+            raise ValidationError({'bbox': 'bbox is too large for the zoom level'})
+
+        tiles = [(x, y) for x in range(xmin, xmax + 1) for y in range(ymin, ymax + 1)]
+        clusters = get_comment_clusters(hearing, zoom, tiles, include_unpublished=request.user.is_superuser)
+        return response.Response(clusters)
 
     @list_route(methods=['get'])
     def map(self, request):
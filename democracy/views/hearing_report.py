@@ -1,21 +1,43 @@
-import io
+import tempfile
 
 import xlsxwriter
 import json
 from django.conf import settings
-from django.http import HttpResponse
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.http import FileResponse
+from django.utils.timezone import now
+from rest_framework import response, serializers, status
 
-from democracy.models import SectionComment
+from democracy.models import SectionComment, StoredHearingReport
+from democracy.models.hearing_report import get_report_key
 
-from .section_comment import SectionCommentSerializer
+from .comment_export import CommentRowReader
 
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# seconds for clients to wait before asking for a pending report again
+REPORT_RETRY_AFTER = 30
 
-class HearingReport(object):
 
-    def __init__(self, json, context=None):
+class HearingReport(object):
+    """
+    XLSX report of a hearing and its comments.
+
+    The workbook is written row by row in constant memory mode to a temporary file, and the
+    comments are read in chunks without serializers, so the report size is not limited by memory.
+    """
+
+    def __init__(self, json, context=None, base_url=None):
+        """
+        :param json: The serialized hearing
+        :param base_url: The absolute URL that image URLs are relative to, by default the root of the request
+        """
         self.json = json
-        self.buffer = io.BytesIO()
-        self.xlsdoc = xlsxwriter.Workbook(self.buffer, {'in_memory': True})
+        if base_url is None:
+            base_url = context['request'].build_absolute_uri('/')
+        self.base_url = base_url
+        self.file = tempfile.TemporaryFile()
+        self.xlsdoc = xlsxwriter.Workbook(self.file, {'constant_memory': True})
         self.hearing_worksheet = self.xlsdoc.add_worksheet('Hearing')
         self.hearing_worksheet.set_landscape()
         self.hearing_worksheet_active_row = 0
@@ -23,7 +45,7 @@ class HearingReport(object):
         self.comments_worksheet.set_landscape()
         self.comments_worksheet_active_row = 0
         self.format_bold = self.xlsdoc.add_format({'bold': True})
-        self.context = context
+        self.datetime_field = serializers.DateTimeField()
 
     def add_hearing_row(self, label, content):
         row = self.hearing_worksheet_active_row
@@ -67,7 +89,7 @@ class HearingReport(object):
         # add author
         self.comments_worksheet.write(row, 1, comment['author_name'])
         # add creation date
-        self.comments_worksheet.write(row, 2, comment['created_at'])
+        self.comments_worksheet.write(row, 2, self.datetime_field.to_representation(comment['created_at']))
         # add votes
         self.comments_worksheet.write(row, 3, comment['n_votes'])
         # add label
@@ -77,8 +99,7 @@ class HearingReport(object):
         self.comments_worksheet.write(row, 5, comment['content'])
         # add geojson
         self.comments_worksheet.write(row, 6, json.dumps(comment['geojson']))
-        self.comments_worksheet.write(row, 7, ','.join(
-            image['url'] for image in comment['images']))
+        self.comments_worksheet.write(row, 7, ','.join(comment['images']))
         self.comments_worksheet_active_row += 1
 
     def generate_comments_worksheet(self):
@@ -108,8 +129,7 @@ class HearingReport(object):
 
         sections = [s for s in self.json['sections']]
         for s in sections:
-            comments = [SectionCommentSerializer(c, context=self.context).data
-                        for c in SectionComment.objects.filter(section=s['id'])]
+            comments = CommentRowReader(SectionComment.objects.filter(section=s['id']), self.base_url)
             for comment in comments:
                 self.add_comment_row('%s: %s' % (s['type_name_singular'],
                                                  self._get_default_translation(s['title'])), comment)
@@ -117,18 +137,83 @@ class HearingReport(object):
 
         self.add_hearing_row('All comments', str(comments_count))
 
-    def get_xlsx(self):
+    def get_file(self):
+        """
+        Generate the report.
+
+        :return: The temporary file of the report, positioned at its start
+        """
         self.generate_hearing_worksheet()
         self.generate_comments_worksheet()
         self.xlsdoc.close()
+        self.file.seek(0)
+        return self.file
 
-        return self.buffer.getvalue()
+    def get_filename(self):
+        return '{title}.xlsx'.format(title=self._get_default_translation(self.json['title']))
 
     def get_response(self):
-        response = HttpResponse(
-            self.get_xlsx(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename={filename}.xlsx'.format(
-            filename=self._get_default_translation(self.json['title']))
-        return response
+        return get_file_response(self.get_file(), self.get_filename())
+
+
+def get_file_response(file, filename):
+    response = FileResponse(file, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename={filename}'.format(filename=filename)
+    return response
+
+
+def get_stored_report_response(hearing, request, get_hearing_data):
+    """
+    Serve the stored report of the current state of `hearing`, or request one and tell the client to come back.
+
+    :param get_hearing_data: Function that serializes the hearing for a new report
+    """
+    key = get_report_key(hearing)
+    stored = StoredHearingReport.objects.filter(key=key).first()
+    if stored is None:
+        try:
+            # a savepoint keeps a surrounding transaction usable after a conflict
+            with transaction.atomic():
+                stored = StoredHearingReport.objects.create(
+                    hearing=hearing, key=key, hearing_data=get_hearing_data(), base_url=request.build_absolute_uri('/')
+                )
+        except IntegrityError:
+            # requested concurrently
+            stored = StoredHearingReport.objects.get(key=key)
+    if not stored.file:
+        resp = response.Response({'status': 'The report is being generated'}, status=status.HTTP_202_ACCEPTED)
+        resp['Retry-After'] = REPORT_RETRY_AFTER
+        return resp
+    report = HearingReport(stored.hearing_data, base_url=stored.base_url)
+    return get_file_response(stored.file.storage.open(stored.file.name, 'rb'), report.get_filename())
+
+
+def generate_stored_report(stored):
+    """
+    Generate the file of a pending stored report, and remove the older reports of the hearing.
+    """
+    report = HearingReport(stored.hearing_data, base_url=stored.base_url)
+    with report.get_file() as file:
+        stored.file.save('%s.xlsx' % stored.hearing_id, File(file), save=False)
+    stored.generated_at = now()
+    stored.save(update_fields=('file', 'generated_at'))
+    older = StoredHearingReport.objects.filter(hearing_id=stored.hearing_id, requested_at__lt=stored.requested_at)
+    for old in older:
+        old.delete_with_file()
+
+
+def generate_pending_reports():
+    """
+    Generate the files of all pending stored reports, skipping those superseded by a newer request.
+
+    :return: The number of generated reports
+    """
+    n_generated = 0
+    for stored in StoredHearingReport.objects.filter(generated_at__isnull=True).order_by('requested_at'):
+        newer = StoredHearingReport.objects.filter(hearing_id=stored.hearing_id, requested_at__gt=stored.requested_at)
+        if newer.exists():
+            stored.delete_with_file()
+            continue
+        generate_stored_report(stored)
+        n_generated += 1
+    return n_generated
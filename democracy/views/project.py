@@ -4,11 +4,33 @@
 from rest_framework import serializers, viewsets
 from rest_framework.exceptions import ValidationError
 
-from democracy.models import Project, ProjectPhase
+from democracy.models import Hearing, Project, ProjectPhase
 from democracy.pagination import DefaultLimitPagination
 from democracy.views.utils import TranslatableSerializer, NestedPKRelatedField, filter_by_hearing_visible
 
 
+def get_visible_phase_hearings(phase_ids, request):
+    """
+    Get the slugs of the hearings visible in `request` of all the given project phases at once.
+
+    Phases without any hearings are left out, so that `has_hearings` can be told from the result too.
+
+    :rtype: dict[str, list[str]]
+    """
+    if not phase_ids:
+        return {}
+    phase_hearings = {
+        phase_id: [] for phase_id in
+        Hearing.objects.filter(project_phase__in=phase_ids).values_list('project_phase_id', flat=True).distinct()
+    }
+    visible_hearings = filter_by_hearing_visible(
+        Hearing.objects.with_unpublished(project_phase__in=phase_ids), request, hearing_lookup=''
+    )
+    for phase_id, slug in visible_hearings.values_list('project_phase_id', 'slug'):
+        phase_hearings[phase_id].append(slug)
+    return phase_hearings
+
+
 class ProjectPhaseSerializer(serializers.ModelSerializer, TranslatableSerializer):
     has_hearings = serializers.SerializerMethodField()
     hearings = serializers.SerializerMethodField()
@@ -9,12 +9,14 @@ from rest_framework.exceptions import ValidationError, PermissionDenied, ParseEr
 
 from democracy.enums import Commenting, InitialSectionType
 from democracy.models import Hearing, Section, SectionImage, SectionType, SectionPoll, SectionPollOption
+from democracy.models.base import get_counter_slot_prefetches
+from democracy.models.search import filter_by_search
 from democracy.pagination import DefaultLimitPagination
 from democracy.utils.drf_enum_field import EnumField
 from democracy.views.base import AdminsSeeUnpublishedMixin, BaseImageSerializer
 from democracy.views.utils import (
     Base64ImageField, filter_by_hearing_visible, PublicFilteredImageField, TranslatableSerializer,
-    compare_serialized
+    compare_serialized, get_hearing_validators, get_not_modified_response, set_validator_headers
 )
 
 
@@ -175,6 +177,7 @@ class SectionSerializer(serializers.ModelSerializer, TranslatableSerializer):
     type_name_plural = serializers.SlugRelatedField(source='type', slug_field='name_plural', read_only=True)
     commenting = EnumField(enum_type=Commenting)
     voting = EnumField(enum_type=Commenting)
+    n_comments = serializers.IntegerField(source='get_n_comments', read_only=True)
 
     class Meta:
         model = Section
@@ -186,6 +189,16 @@ class SectionSerializer(serializers.ModelSerializer, TranslatableSerializer):
         ]
 
 
+# everything SectionSerializer needs, to be used with Section querysets or Prefetch('sections')
+section_prefetches = (
+    'type',
+    'translations',
+    'images__translations',
+    'polls__translations',
+    'polls__options__translations',
+)
+
+
 class SectionFieldSerializer(serializers.RelatedField):
     """
     Serializer for section field. A property of other instance.
@@ -321,13 +334,31 @@ class SectionViewSet(AdminsSeeUnpublishedMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = SectionSerializer
     model = Section
 
+    def get_hearing(self):
+        if not hasattr(self, '_hearing'):
+            self._hearing = Hearing.objects.get_by_id_or_slug(self.kwargs['hearing_pk'])
+        return self._hearing
+
     def get_queryset(self):
-        id_or_slug = self.kwargs['hearing_pk']
-        hearing = Hearing.objects.get_by_id_or_slug(id_or_slug)
+        hearing = self.get_hearing()
         queryset = super().get_queryset().filter(hearing=hearing)
         if not hearing.closed:
             queryset = queryset.exclude(type__identifier=InitialSectionType.CLOSURE_INFO)
-        return queryset
+        return queryset.prefetch_related(*(section_prefetches + get_counter_slot_prefetches()))
+
+    def _get_conditional_response(self, view, request, *args, **kwargs):
+        # sections are part of the hearing tree, so the hearing validators cover them
+        etag, last_modified = get_hearing_validators(request, self.get_hearing())
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validator_headers(view(request, *args, **kwargs), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        return self._get_conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._get_conditional_response(super().retrieve, request, *args, **kwargs)
 
 
 class RootSectionImageSerializer(SectionImageCreateUpdateSerializer):
@@ -412,10 +443,15 @@ class RootSectionSerializer(SectionSerializer, TranslatableSerializer):
 class SectionFilter(django_filters.rest_framework.FilterSet):
     hearing = django_filters.CharFilter(name='hearing_id')
     type = django_filters.CharFilter(name='type__identifier')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Section
-        fields = ['hearing', 'type']
+        fields = ['hearing', 'type', 'search']
+
+    def filter_search(self, queryset, name, value):
+        queryset = filter_by_search(queryset, value)
+        return queryset.order_by('-search_rank', 'ordering')
 
 
 # root level Section endpoint
@@ -433,4 +469,4 @@ class RootSectionViewSet(AdminsSeeUnpublishedMixin, viewsets.ReadOnlyModelViewSe
         open_hearings = Q(hearing__force_closed=False) & Q(hearing__open_at__lte=n) & Q(hearing__close_at__gt=n)
         queryset = queryset.exclude(open_hearings, type__identifier=InitialSectionType.CLOSURE_INFO)
 
-        return queryset
+        return queryset.prefetch_related(*(section_prefetches + get_counter_slot_prefetches()))
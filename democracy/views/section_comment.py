@@ -1,20 +1,58 @@
+from collections import OrderedDict
+
 import django_filters
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Prefetch, QuerySet, prefetch_related_objects
 from django.db.transaction import atomic
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import ugettext as _
 from rest_framework import filters, serializers, status, response
+from rest_framework.decorators import list_route
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import as_serializer_error
 from rest_framework.settings import api_settings
 
-from democracy.models import SectionComment, Label, Section, SectionPollOption, SectionPollAnswer
+from democracy.models import Hearing, SectionComment, Label, Section, SectionPollOption, SectionPollAnswer
+from democracy.models.comment import bulk_create_comments
+from democracy.models.search import filter_by_search
 from democracy.models.section import CommentImage
-from democracy.views.comment import COMMENT_FIELDS, BaseCommentViewSet, BaseCommentSerializer
+from democracy.views.comment import COMMENT_FIELDS, BaseCommentFilter, BaseCommentViewSet, BaseCommentSerializer
 from democracy.views.label import LabelSerializer
-from democracy.pagination import DefaultLimitPagination
+from democracy.pagination import (
+    ChangeFeedPagination, CountStrategyPagination, DefaultLimitPagination, KeysetPagination
+)
 from democracy.views.comment_image import CommentImageCreateSerializer, CommentImageSerializer
 from democracy.views.utils import filter_by_hearing_visible, NestedPKRelatedField
+from democracy.views.utils import get_etag, get_hearing_validators, get_not_modified_response, set_validator_headers
 from democracy.views.utils import GeoJSONField, GeometryBboxFilterBackend
+from democracy.utils.vote_buffer import get_vote_buffer_version
+
+
+poll_answers_prefetch = Prefetch('poll_answers', queryset=SectionPollAnswer.objects.select_related('option__poll'))
+
+# everything SectionCommentSerializer and RootSectionCommentSerializer need
+section_comment_related = ('created_by', 'label', 'section__hearing')
+section_comment_prefetches = (poll_answers_prefetch, 'images', 'label__translations')
+
+
+def group_poll_answers(comment, get_value):
+    """
+    Group the poll answers of a comment by poll, using prefetched answers if there are any.
+
+    :param get_value: Function that gives the value listed for each answer
+    """
+    prefetch_related_objects([comment], poll_answers_prefetch)
+    polls_by_id = {}
+    for answer in comment.poll_answers.all():
+        poll = answer.option.poll
+        if poll.id not in polls_by_id:
+            polls_by_id[poll.id] = {
+                'question': poll.id,
+                'type': poll.type,
+                'answers': [],
+            }
+        polls_by_id[poll.id]['answers'].append(get_value(answer))
+    return list(polls_by_id.values())
 
 
 class SectionCommentCreateSerializer(serializers.ModelSerializer):
@@ -38,16 +76,7 @@ class SectionCommentCreateSerializer(serializers.ModelSerializer):
                   'label', 'images', 'answers', 'geojson', 'language_code']
 
     def get_answers(self, obj):
-        polls_by_id = {}
-        for answer in obj.poll_answers.select_related('option', 'option__poll').all():
-            if answer.option.poll.id not in polls_by_id:
-                polls_by_id[answer.option.poll.id] = {
-                    'question': answer.option.poll.id,
-                    'type': answer.option.poll.type,
-                    'answers': [],
-                }
-            polls_by_id[answer.option.poll.id]['answers'].append(answer.id)
-        return list(polls_by_id.values())
+        return group_poll_answers(obj, lambda answer: answer.id)
 
     def to_internal_value(self, data):
         if data.get("plugin_data") is None:
@@ -92,6 +121,24 @@ class SectionCommentCreateSerializer(serializers.ModelSerializer):
         return comment
 
 
+class ContextSectionDefault(object):
+    """
+    Default to the section in the serializer context.
+    """
+    def set_context(self, serializer_field):
+        self.section = serializer_field.context['section']
+
+    def __call__(self):
+        return self.section
+
+
+class SectionCommentBulkCreateSerializer(SectionCommentCreateSerializer):
+    """
+    Serializer for validating each comment of a bulk creation, all in the section of the context.
+    """
+    section = serializers.HiddenField(default=ContextSectionDefault())
+
+
 class SectionCommentSerializer(BaseCommentSerializer):
     """
     Serializer for comment added to section.
@@ -106,16 +153,38 @@ class SectionCommentSerializer(BaseCommentSerializer):
         fields = ['section', 'language_code', 'answers'] + COMMENT_FIELDS
 
     def get_answers(self, obj):
-        polls_by_id = {}
-        for answer in obj.poll_answers.select_related('option', 'option__poll').all():
-            if answer.option.poll.id not in polls_by_id:
-                polls_by_id[answer.option.poll.id] = {
-                    'question': answer.option.poll.id,
-                    'type': answer.option.poll.type,
-                    'answers': [],
-                }
-            polls_by_id[answer.option.poll.id]['answers'].append(answer.option_id)
-        return list(polls_by_id.values())
+        return group_poll_answers(obj, lambda answer: answer.option_id)
+
+
+class SectionCommentFilter(BaseCommentFilter):
+    q = django_filters.CharFilter(method='filter_q')
+
+    class Meta:
+        model = SectionComment
+        fields = ['authorization_code', 'q']
+
+    def filter_q(self, queryset, name, value):
+        # best matches first, the ordering parameter still takes precedence
+        return filter_by_search(queryset, value).order_by('-search_rank', '-created_at')
+
+
+def get_comment_facets(queryset):
+    """
+    Count the given comments per label, section and language with a single aggregate query.
+
+    :return: {'label': {label_id: count}, 'section': {section_id: count}, 'language_code': {code: count}}
+    """
+    facets = OrderedDict((field, {}) for field in ('label', 'section', 'language_code'))
+    groups = queryset.order_by().values('label_id', 'section_id', 'language_code').annotate(count=Count('pk'))
+    for group in groups:
+        for field, value in (
+            ('label', group['label_id']),
+            ('section', group['section_id']),
+            ('language_code', group['language_code']),
+        ):
+            if value:
+                facets[field][value] = facets[field].get(value, 0) + group['count']
+    return facets
 
 
 class SectionCommentViewSet(BaseCommentViewSet):
@@ -125,7 +194,158 @@ class SectionCommentViewSet(BaseCommentViewSet):
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,
                        filters.OrderingFilter,
                        GeometryBboxFilterBackend)
+    filter_class = SectionCommentFilter
     ordering_fields = ('created_at', 'n_votes')
+    pagination_class = CountStrategyPagination
+    # query parameters that do not change the number of listed comments
+    count_neutral_params = {'limit', 'offset', 'ordering', 'format', 'include'}
+    bulk_create_max_items = 500
+
+    def get_denormalized_count(self):
+        """
+        Get the number of listed comments from the cached comment counters, if the filters allow it.
+
+        The counters include unpublished comments, so for others than admins the count may be approximate.
+        """
+        params = self.request.query_params
+        filters = set(params) - self.count_neutral_params
+        parent_id = self.get_comment_parent_id()
+        if parent_id:
+            counters = Section.objects.filter(pk=parent_id) if not filters else None
+        elif filters == {'section'}:
+            counters = filter_by_hearing_visible(Section.objects.filter(pk=params['section']), self.request)
+        elif filters == {'hearing'}:
+            counters = filter_by_hearing_visible(
+                Hearing.objects.filter(pk=params['hearing']), self.request, hearing_lookup=''
+            )
+        else:
+            counters = None
+        if counters is None:
+            return None
+        counter = counters.first()
+        return counter.get_n_comments() if counter else 0
+
+    def prefetch_for_serialization(self, objs):
+        if isinstance(objs, QuerySet):
+            return objs.select_related(*section_comment_related).prefetch_related(*section_comment_prefetches)
+        prefetch_related_objects(objs, *(section_comment_related + section_comment_prefetches))
+        return super().prefetch_for_serialization(objs)
+
+    @property
+    def paginator(self):
+        # keyset pagination is opt-in, limit/offset pagination stays the default
+        if not hasattr(self, '_paginator') and KeysetPagination.cursor_query_param in self.request.query_params:
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        parent_id = self.get_comment_parent_id()
+        section = parent_id and Section.objects.everything().select_related('hearing').filter(pk=parent_id).first()
+        if not section:
+            return self._list(request, *args, **kwargs)
+
+        # comment edits and votes bump the hearing tree, new comments the comment counts and buffered votes
+        # the vote buffer version, so the comments themselves need not be queried
+        hearing_etag, last_modified = get_hearing_validators(request, section.hearing)
+        etag = get_etag(request, hearing_etag, section.get_n_comments(), get_vote_buffer_version())
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validator_headers(self._list(request, *args, **kwargs), etag, last_modified)
+
+    def _list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('q') and not response.streaming:
+            facets = get_comment_facets(self.filter_queryset(self.get_queryset()))
+            if isinstance(response.data, dict):
+                response.data['facets'] = facets
+            else:
+                response.data = OrderedDict([('results', response.data), ('facets', facets)])
+        return response
+
+    @list_route(methods=['post'])
+    def bulk(self, request, **kwargs):
+        """
+        Create a list of comments in the section at once.
+
+        The valid comments are created even if some are not, and the errors of the invalid ones
+        are reported by their index in the list.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [_('Expected a list of comments.')]})
+        if len(request.data) > self.bulk_create_max_items:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                _('At most {max_items} comments can be created at once.').format(max_items=self.bulk_create_max_items)
+            ]})
+        resp = self._check_may_comment(request)
+        if resp:
+            return resp
+
+        comments, comment_indexes, images, answer_option_ids, errors = self._validate_bulk_items(request)
+        with atomic():
+            comments = bulk_create_comments(SectionComment, comments)
+            CommentImage.objects.bulk_create([
+                CommentImage(comment=comment, **image)
+                for comment, comment_images in zip(comments, images) for image in comment_images
+            ])
+            answers = SectionPollAnswer.objects.bulk_create([
+                SectionPollAnswer(comment=comment, option_id=option_id)
+                for comment, comment_option_ids in zip(comments, answer_option_ids) for option_id in comment_option_ids
+            ])
+            # answer counts once per option, instead of once per answer
+            for option in SectionPollOption.objects.filter(pk__in={answer.option_id for answer in answers}):
+                option.recache_n_answers()
+
+        created = self.get_serializer(comments, many=True).data
+        return response.Response(OrderedDict([
+            ('created', [
+                OrderedDict([('index', index), ('comment', comment)])
+                for index, comment in zip(comment_indexes, created)
+            ]),
+            ('errors', errors),
+        ]), status=status.HTTP_201_CREATED if comments else status.HTTP_400_BAD_REQUEST)
+
+    def _validate_bulk_items(self, request):
+        context = self.get_serializer_context()
+        context['section'] = self.get_comment_parent()
+        serializer = SectionCommentBulkCreateSerializer(context=context)
+        option_ids = set(SectionPollOption.objects.filter(
+            pk__in=[
+                option_id for item in request.data for option_id in self._get_answer_option_ids(item)
+                if isinstance(option_id, int)
+            ]
+        ).values_list('pk', flat=True))
+        created_by = request.user if request.user.is_authenticated() else None
+
+        comments, comment_indexes, images, answer_option_ids, errors = [], [], [], [], []
+        for index, item in enumerate(request.data):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [_('Expected a comment object.')]})
+                attrs = serializer.run_validation(item)
+                for option_id in self._get_answer_option_ids(item):
+                    if option_id not in option_ids:
+                        raise ValidationError({'option': [
+                            _('Invalid id "{id}" - object does not exist.').format(id=option_id)
+                        ]})
+            except ValidationError as error:
+                errors.append(OrderedDict([('index', index), ('errors', error.detail)]))
+                continue
+            images.append(attrs.pop('images', []))
+            answer_option_ids.append(self._get_answer_option_ids(item))
+            comments.append(SectionComment(created_by=created_by, **attrs))
+            comment_indexes.append(index)
+        return comments, comment_indexes, images, answer_option_ids, errors
+
+    @staticmethod
+    def _get_answer_option_ids(item):
+        if not isinstance(item, dict):
+            return []
+        return [
+            option_id
+            for answer in item.get('answers') or [] if isinstance(answer, dict)
+            for option_id in answer.get('answers') or []
+        ]
 
     def create_related(self, request, instance=None, *args, **kwargs):
         answers = request.data.pop('answers', [])
@@ -159,7 +379,9 @@ class SectionCommentViewSet(BaseCommentViewSet):
         super().update_related(request, instance=instance, *args, **kwargs)
 
     def _check_may_comment(self, request):
-        if len(request.data.get('answers', [])) > 0 and not request.user.is_authenticated():
+        items = request.data if isinstance(request.data, list) else [request.data]
+        if any(len(item.get('answers', [])) > 0 for item in items if hasattr(item, 'get')) \
+                and not request.user.is_authenticated():
             return response.Response(
                 {'status': 'Unauthenticated users cannot answer polls.'},
                 status=status.HTTP_403_FORBIDDEN
@@ -177,12 +399,12 @@ class RootSectionCommentSerializer(SectionCommentSerializer):
         fields = SectionCommentSerializer.Meta.fields + ['hearing']
 
 
-class CommentFilter(django_filters.rest_framework.FilterSet):
+class CommentFilter(SectionCommentFilter):
     hearing = django_filters.CharFilter(name='section__hearing__id')
 
     class Meta:
         model = SectionComment
-        fields = ['authorization_code', 'section', 'hearing']
+        fields = ['authorization_code', 'section', 'hearing', 'q']
 
 
 # root level SectionComment endpoint
@@ -190,6 +412,8 @@ class CommentViewSet(SectionCommentViewSet):
     serializer_class = RootSectionCommentSerializer
     pagination_class = DefaultLimitPagination
     filter_class = CommentFilter
+    # comments are created in bulk in their section
+    bulk = None
 
     def get_comment_parent_id(self):
         method = self.request.method
@@ -218,10 +442,67 @@ class CommentViewSet(SectionCommentViewSet):
             ]})
 
     def get_queryset(self):
-        queryset = super(BaseCommentViewSet, self).get_queryset()
+        if self.action == 'changes':
+            # removed and unpublished comments are listed as tombstones
+            queryset = SectionComment.objects.everything()
+        else:
+            queryset = super(BaseCommentViewSet, self).get_queryset()
         queryset = filter_by_hearing_visible(queryset, self.request, 'section__hearing')
         return queryset
 
+    @list_route(methods=['get'])
+    def changes(self, request, **kwargs):
+        """
+        List the comments created, edited or removed after the given cursor, in the order of the changes.
+
+        Comments that were removed or are otherwise no longer visible are listed as tombstones,
+        so that clients can mirror the comments by applying the changes in order. Without a cursor,
+        the changes can be limited to comments modified since `modified_since`.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).select_related('section')
+        if not request.query_params.get(self.paginator.cursor_query_param):
+            queryset = self._filter_modified_since(queryset)
+        page = self.paginator.paginate_queryset(queryset, request, view=self)
+        live = [comment for comment in page if self._is_listed(comment)]
+        data = iter(self.get_serializer(live, many=True).data)
+        results = []
+        for comment in page:
+            if self._is_listed(comment):
+                item = next(data)
+                item['deleted'] = False
+            else:
+                item = OrderedDict([
+                    ('id', comment.pk),
+                    ('section', comment.section_id),
+                    ('hearing', comment.section.hearing_id),
+                    ('deleted', True),
+                ])
+            results.append(item)
+        return self.paginator.get_paginated_response(results)
+
+    def _filter_modified_since(self, queryset):
+        value = self.request.query_params.get('modified_since')
+        if not value:
+            return queryset
+        try:
+            modified_since = parse_datetime(value)
+        except ValueError:
+            modified_since = None
+        if modified_since is None:
+            raise ValidationError({'modified_since': [_('Expected an ISO 8601 date and time.')]})
+        return queryset.filter(modified_at__gte=modified_since)
+
+    def _is_listed(self, comment):
+        if comment.deleted or comment.section.deleted:
+            return False
+        return comment.published or self.request.user.is_superuser
+
+    @property
+    def paginator(self):
+        if self.action == 'changes' and not hasattr(self, '_paginator'):
+            self._paginator = ChangeFeedPagination()
+        return super().paginator
+
     def _check_may_comment(self, request):
         parent = self.get_comment_parent()
         if not parent:
@@ -0,0 +1,108 @@
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Transform
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+from django.db.models import F, Func, Value
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound
+from rest_framework.views import APIView
+
+from democracy.models import Hearing, SectionComment
+from democracy.utils.tiles import (
+    COMMENT_LAYER, HEARING_LAYER, get_cached_tile, get_tile_bounds, set_cached_tile
+)
+from democracy.views.utils import filter_by_hearing_visible
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+WEB_MERCATOR_SRID = 3857
+
+
+def get_tile_geometry(field_name, bounds):
+    """
+    Get an expression that transforms the geometry in `field_name` to the coordinate space of a tile.
+    """
+    envelope = Func(
+        *[Value(coordinate) for coordinate in bounds], Value(WEB_MERCATOR_SRID),
+        function='ST_MakeEnvelope', output_field=GeometryField(srid=WEB_MERCATOR_SRID)
+    )
+    return Func(
+        Transform(field_name, WEB_MERCATOR_SRID), envelope, Value(TILE_EXTENT), Value(TILE_BUFFER), Value(True),
+        function='ST_AsMVTGeom', output_field=GeometryField(srid=WEB_MERCATOR_SRID)
+    )
+
+
+def get_hearing_features(request):
+    return filter_by_hearing_visible(Hearing.objects.with_unpublished(), request, hearing_lookup='')
+
+
+def get_comment_features(request):
+    if request.user.is_authenticated() and request.user.is_superuser:
+        queryset = SectionComment.objects.with_unpublished()
+    else:
+        queryset = SectionComment.objects.public()
+    queryset = filter_by_hearing_visible(queryset, request, 'section__hearing')
+    return queryset.annotate(hearing_id=F('section__hearing_id'))
+
+
+# layer name: (queryset getter, feature properties)
+TILE_LAYERS = {
+    HEARING_LAYER: (get_hearing_features, ('id',)),
+    COMMENT_LAYER: (get_comment_features, ('id', 'hearing_id', 'section_id', 'label_id')),
+}
+
+
+def render_tile(layer, queryset, properties, bounds):
+    """
+    Render the geometries of the given queryset that fall in `bounds` as a vector tile layer in PostGIS.
+
+    :rtype: bytes
+    """
+    bbox = Polygon.from_bbox(bounds)
+    bbox.srid = WEB_MERCATOR_SRID
+    queryset = queryset.filter(geometry__intersects=bbox).order_by().annotate(
+        mvt_geom=get_tile_geometry('geometry', bounds)
+    ).values(*(properties + ('mvt_geom',)))
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT ST_AsMVT(tile, %s, %s, %s) FROM (' + sql + ') AS tile WHERE tile.mvt_geom IS NOT NULL',
+            [layer, TILE_EXTENT, 'mvt_geom'] + list(params)
+        )
+        tile = cursor.fetchone()[0]
+    return bytes(tile) if tile else b''
+
+
+class TileView(APIView):
+    """
+    Mapbox vector tiles of hearing areas and comment locations.
+
+    The tiles contain the same objects as the corresponding list endpoints, and are generated
+    in PostGIS. Tiles seen by the public are cached on disk, see `democracy.utils.tiles`.
+    """
+    permission_classes = (permissions.AllowAny,)
+    content_type = 'application/vnd.mapbox-vector-tile'
+
+    def get(self, request, layer, z, x, y):
+        z, x, y = int(z), int(x), int(y)
+        if layer not in TILE_LAYERS or z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            raise NotFound()
+
+        cacheable = self._is_public_request()
+        tile = get_cached_tile(layer, z, x, y) if cacheable else None
+        if tile is None:
+            get_features, properties = TILE_LAYERS[layer]
+            bounds = get_tile_bounds(z, x, y)
+            tile = render_tile(layer, get_features(request), properties, bounds)
+            if cacheable:
+                set_cached_tile(layer, z, x, y, tile)
+        return HttpResponse(tile, content_type=self.content_type)
+
+    def _is_public_request(self):
+        # superusers and organization admins see unpublished hearings
+        user = self.request.user
+        if not user.is_authenticated():
+            return True
+        return not user.is_superuser and not user.admin_organizations.exists()
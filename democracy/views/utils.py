@@ -1,40 +1,66 @@
 # -*- coding: utf-8 -*-
 import base64
+import hashlib
+from calendar import timegm
 from collections import OrderedDict
 from functools import lru_cache
 import json
 
 from django.conf import settings
-from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.gdal.error import GDALException
 from django.core.exceptions import ImproperlyConfigured
 from django.core.files.base import ContentFile
 from django.db.models.query import QuerySet
-from django.db.models import Q
+from django.db.models import Manager, Q, prefetch_related_objects
+from django.utils.cache import get_conditional_response
 from django.utils.crypto import get_random_string
+from django.utils.http import http_date
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.filters import BaseFilterBackend
 from rest_framework.relations import ManyRelatedField, MANY_RELATION_KWARGS, PrimaryKeyRelatedField
+from rest_framework.serializers import LIST_SERIALIZER_KWARGS
 from rest_framework.utils import encoders
 from munigeo.api import build_bbox_filter, srid_to_srs
 
+from democracy.utils.geo import parse_geojson
+
+
+def _get_prefetched_translations(obj):
+    prefetched_translations = getattr(obj, 'translation_list', None)
+    if prefetched_translations is None:
+        prefetched_translations = getattr(obj, '_prefetched_objects_cache', {}).get('translations')
+    return prefetched_translations
+
 
 def get_translation_list(obj, language_codes=[lang['code'] for lang in settings.PARLER_LANGUAGES[None]]):
     """
-    This method uses translation_list attribute created by Prefetch to obtain translations without database hit.
+    This method uses prefetched translations to obtain translations without database hit.
 
-    :param obj: Any translated object that may have had Prefetch('translations', to_attr='translation_list') done
+    :param obj: Any translated object that may have had Prefetch('translations', to_attr='translation_list') or
+                prefetch_related('translations') done
     :param language_codes: Iterable containing the languages to return
     :return: QuerySet or list containing the desired translations, if not the default
     """
-    prefetched_translations = getattr(obj, 'translation_list', [])
-    filtered_prefetched = [translation for translation in prefetched_translations if
-                           translation.language_code in language_codes]
-    return filtered_prefetched if prefetched_translations else obj.translations.filter(
-        language_code__in=language_codes)
+    prefetched_translations = _get_prefetched_translations(obj)
+    if prefetched_translations is None:
+        return obj.translations.filter(language_code__in=language_codes)
+    return [translation for translation in prefetched_translations if translation.language_code in language_codes]
+
+
+def prefetch_translations(objs):
+    """
+    Load the translations of all the given objects that do not have them prefetched yet, in a single query.
+
+    :param objs: List of objects of the same translated model
+    :return: The same list
+    """
+    missing = [obj for obj in objs if _get_prefetched_translations(obj) is None]
+    if missing:
+        prefetch_related_objects(missing, 'translations')
+    return objs
 
 
 def compare_serialized(a, b):
@@ -87,6 +113,8 @@ class IOErrorIgnoringManyRelatedField(ManyRelatedField):
         out = []
         if isinstance(iterable, QuerySet):
             iterable = iterable.iterator()
+        else:
+            iterable = iter(iterable)
         while True:
             try:
                 value = next(iterable)
@@ -108,11 +136,11 @@ class PublicFilteredImageField(serializers.Field):
 
     def to_representation(self, images):
         request = self.context.get('request')
-
-        if request and request.user and request.user.is_authenticated() and request.user.is_superuser:
-            images = images.with_unpublished()
-        else:
-            images = images.public()
+        show_unpublished = bool(
+            request and request.user and request.user.is_authenticated() and request.user.is_superuser
+        )
+        # filter in Python, so that prefetched images need no further queries
+        images = prefetch_translations([image for image in images.all() if show_unpublished or image.published])
 
         serializer = self.serializer_class.get_field_serializer(
             many=True, read_only=True, many_field_class=IOErrorIgnoringManyRelatedField
@@ -147,6 +175,52 @@ def filter_by_hearing_visible(queryset, request, hearing_lookup='hearing'):
     return queryset.filter(q)
 
 
+def get_etag(request, *parts):
+    """
+    Get a strong ETag for the representation identified by `parts` in `request`.
+
+    The absolute URL, the response format and the user are always included, since
+    representations may vary by all of them.
+    """
+    user = request.user
+    variant = (
+        request.build_absolute_uri(),
+        request.accepted_renderer.format,
+        user.pk if user.is_authenticated() else '',
+    )
+    value = '|'.join(str(part) for part in variant + parts)
+    return '"%s"' % hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+def get_hearing_validators(request, hearing):
+    """
+    Get the ETag and Last-Modified time for a representation of `hearing` or any part of its tree.
+    """
+    last_modified = hearing.get_last_modified()
+    etag = get_etag(request, hearing.pk, last_modified.isoformat(), hearing.get_n_comments(), hearing.closed)
+    return etag, last_modified
+
+
+def get_not_modified_response(request, etag, last_modified):
+    """
+    Get the response to a conditional request, or None if the representation must be sent.
+
+    :type last_modified: datetime.datetime|None
+    """
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    conditional_response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if conditional_response is not None:
+        set_validator_headers(conditional_response, etag, last_modified)
+    return conditional_response
+
+
+def set_validator_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    return response
+
+
 class NestedPKRelatedField(PrimaryKeyRelatedField):
     """
     Support of showing and saving of expanded nesting or just a resource ID.
@@ -196,7 +270,6 @@ class GeoJSONField(serializers.JSONField):
     def to_internal_value(self, data):
         if not data:
             return None
-        geometry = data.get('geometry', None) or data
 
         if 'type' not in data:
             raise ValidationError('Invalid geojson format. "type" field is required. Got %(data)s' % {'data': data})
@@ -212,11 +285,12 @@ class GeoJSONField(serializers.JSONField):
                                       'data': data
                                   })
 
+        data = super(GeoJSONField, self).to_internal_value(data)
         try:
-            GEOSGeometry(json.dumps(geometry))
+            # the parsed geometry is carried along to the model, so it does not need to be parsed again
+            return parse_geojson(data)
         except GDALException:
             raise ValidationError('Invalid geojson format: %(data)s' % {'data': data})
-        return super(GeoJSONField, self).to_internal_value(data)
 
 
 class GeometryBboxFilterBackend(BaseFilterBackend):
@@ -254,6 +328,17 @@ class Base64ImageField(serializers.ImageField):
         raise ValidationError(_('Invalid content. Expected "data:image"'))
 
 
+class TranslatableListSerializer(serializers.ListSerializer):
+    """
+    List serializer that loads the translations of all the listed objects at once.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        objs = prefetch_translations(list(iterable))
+        return [self.child.to_representation(item) for item in objs]
+
+
 class TranslatableSerializer(serializers.Serializer):
     """
     A serializer for translated fields.
@@ -274,6 +359,17 @@ class TranslatableSerializer(serializers.Serializer):
         if not hasattr(self.Meta, 'translation_lang'):
             self.Meta.translation_lang = [lang['code'] for lang in settings.PARLER_LANGUAGES[None]]
 
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        # same as BaseSerializer.many_init, except for the default list serializer class
+        allow_empty = kwargs.pop('allow_empty', None)
+        list_kwargs = {'child': cls(*args, **kwargs)}
+        if allow_empty is not None:
+            list_kwargs['allow_empty'] = allow_empty
+        list_kwargs.update({key: value for key, value in kwargs.items() if key in LIST_SERIALIZER_KWARGS})
+        list_serializer_class = getattr(getattr(cls, 'Meta', None), 'list_serializer_class', TranslatableListSerializer)
+        return list_serializer_class(*args, **list_kwargs)
+
     def _update_lang(self, ret, field, value, lang_code):
         if not ret.get(field) or isinstance(ret[field], str):
             ret[field] = {}
@@ -281,9 +377,17 @@ class TranslatableSerializer(serializers.Serializer):
             ret[field][lang_code] = value
         return ret
 
+    def get_translations(self, instance):
+        """
+        Get the translation objects of `instance` to be represented.
+
+        Each returned object must have `language_code` and the translated fields as attributes.
+        """
+        return get_translation_list(instance, language_codes=self.Meta.translation_lang)
+
     def to_representation(self, instance):
         ret = super(TranslatableSerializer, self).to_representation(instance)
-        translations = instance.translations.filter(language_code__in=self.Meta.translation_lang)
+        translations = self.get_translations(instance)
 
         for translation in translations:
             for field in self.Meta.translated_fields:
@@ -181,7 +181,47 @@ PARLER_LANGUAGES = {
 }
 PARLER_ENABLE_CACHING = False
 
+# Postgres text search configurations of the languages, others use 'simple'
+DEMOCRACY_SEARCH_CONFIGS = {
+    'en': 'english',
+    'fi': 'finnish',
+    'sv': 'swedish',
+}
+
 DETECT_LANGS_MIN_PROBA = 0.3
+# Detect the languages of new comments in batches with the democracy_detect_comment_languages command,
+# instead of while saving them
+DEMOCRACY_ASYNC_LANGUAGE_DETECTION = False
+
+# Alias of the cache used for hearing detail representations, disabled if None.
+# The cache must be shared by all processes, e.g. memcached or redis.
+DEMOCRACY_HEARING_CACHE = None
+DEMOCRACY_HEARING_CACHE_TIMEOUT = 60 * 60
+
+# Paginated lists without a comment counter report planner estimates instead of exact counts from
+# this many rows up, disabled if None. Enabling it, e.g. with 50000, costs an EXPLAIN query per list.
+DEMOCRACY_PAGINATION_ESTIMATE_THRESHOLD = None
+# Alias of the cache used for exact pagination counts, disabled if None
+DEMOCRACY_PAGINATION_COUNT_CACHE = None
+DEMOCRACY_PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# Directory for caching public vector tiles, disabled if None
+DEMOCRACY_TILE_CACHE_DIR = None
+DEMOCRACY_TILE_CACHE_TIMEOUT = 60 * 60
+
+# Number of counter slots per section that comment count changes are spread over to avoid
+# contention on hot hearings, comment counts are updated in place if None
+DEMOCRACY_COMMENT_COUNTER_SLOTS = None
+
+# Write-behind buffer for anonymous votes, e.g.
+# {'BACKEND': 'democracy.utils.vote_buffer.SQLiteVoteBuffer', 'OPTIONS': {'path': '/var/tmp/kerrokantasi-votes.db'}}
+# anonymous votes are counted in place if None
+DEMOCRACY_VOTE_BUFFER = None
+DEMOCRACY_VOTE_BUFFER_FLUSH_INTERVAL = 5
+
+# Public reports of hearings with at least this many comments are generated by the
+# democracy_generate_hearing_reports command and served from media storage, disabled if None
+DEMOCRACY_BACKGROUND_REPORT_THRESHOLD = None
 
 # CKEDITOR_CONFIGS is in __init__.py
 CKEDITOR_UPLOAD_PATH = 'uploads/'